@@ -1,7 +1,9 @@
-import re
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.services.address_validation import validate_address as check_address
+
 
 router = APIRouter()
 
@@ -13,27 +15,43 @@ class AddressValidateIn(BaseModel):
 
 class AddressValidateOut(BaseModel):
     is_valid: bool
+    # Код причины, если адрес невалиден (invalid_checksum, invalid_format, ...)
+    reason: str | None = None
+
+
+class AddressBatchIn(BaseModel):
+    items: list[AddressValidateIn]
+
+
+class AddressBatchItemOut(AddressValidateOut):
+    network: str
+    address: str
 
 
-BTC_RE = re.compile(r"^(bc1|[13])[a-zA-HJ-NP-Z0-9]{25,39}$")
-ETH_RE = re.compile(r"^0x[a-fA-F0-9]{40}$")
-TRON_RE = re.compile(r"^T[1-9A-HJ-NP-Za-km-z]{33}$")
-TON_RE = re.compile(r"^((EQ|UQ)[a-zA-Z0-9_-]{48})$")
+class AddressBatchOut(BaseModel):
+    results: list[AddressBatchItemOut]
 
 
 @router.post("/address/validate", response_model=AddressValidateOut)
 def validate_address(payload: AddressValidateIn):
-    net = payload.network.upper()
-    addr = payload.address.strip()
-
-    valid = False
-    if net in {"BTC", "LTC"}:
-        valid = bool(BTC_RE.match(addr))
-    elif net in {"ETH", "USDT_ERC20", "BNB"}:
-        valid = bool(ETH_RE.match(addr))
-    elif net in {"TRX", "USDT_TRC20"}:
-        valid = bool(TRON_RE.match(addr))
-    elif net == "TON":
-        valid = bool(TON_RE.match(addr))
-
-    return AddressValidateOut(is_valid=valid)
+    valid, reason = check_address(payload.network.upper(), payload.address.strip())
+    return AddressValidateOut(is_valid=valid, reason=reason)
+
+
+@router.post("/address/validate/batch", response_model=AddressBatchOut)
+def validate_address_batch(payload: AddressBatchIn):
+    if len(payload.items) > settings.ADDRESS_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не больше {settings.ADDRESS_BATCH_MAX} адресов за запрос",
+        )
+
+    results = []
+    for item in payload.items:
+        net = item.network.upper()
+        addr = item.address.strip()
+        valid, reason = check_address(net, addr)
+        results.append(
+            AddressBatchItemOut(network=net, address=addr, is_valid=valid, reason=reason)
+        )
+    return AddressBatchOut(results=results)
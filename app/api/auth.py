@@ -1,17 +1,13 @@
-from datetime import timedelta
-
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_db
+from app.db import get_async_db
 from app import models
 from app.schemas.user import UserCreate, UserOut
-from app.services.security import (
-    verify_password,
-    get_password_hash,
-    create_access_token,
-)
+from app.services.password_hasher import password_hasher
+from app.services.security import create_access_token
 
 router = APIRouter(
     prefix="/auth",          # ← только /auth
@@ -19,40 +15,50 @@ router = APIRouter(
 )
 
 
+async def _get_user_by_email(db: AsyncSession, email: str) -> models.User | None:
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+
 @router.post("/register", response_model=UserOut)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = await _get_user_by_email(db, user_in.email)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже существует",
         )
 
+    # bcrypt — в отдельном пуле; при переполнении очереди будет 429
     user = models.User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await password_hasher.hash(user_in.password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-def authenticate_user(db: Session, email: str, password: str) -> models.User | None:
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> models.User | None:
+    user = await _get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash is not None:
+        # Cost bcrypt в настройках изменился — прозрачно перехешируем
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
 @router.post("/login")
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,84 @@
+"""Полные выгрузки транзакций и P2P-ордеров для финансов и комплаенса.
+
+Доступ — только пользователям из EXPORT_ALLOWED_EMAILS. Ответ стримится
+(NDJSON или CSV) прямо из серверного курсора; после обрыва соединения
+выгрузку продолжают тем же запросом с `after_id` = id последней строки.
+"""
+from datetime import date, datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app import models
+from app.core.config import settings
+from app.services.export import ExportResponse, csv_chunks, ndjson_chunks, stream_rows
+from app.services.security import get_streaming_user
+
+router = APIRouter()
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# Горячая таблица и её архив (см. app.services.archiver)
+_transactions = (models.Transaction.__table__, models.transactions_archive)
+_orders = (models.P2POrder.__table__, models.p2p_orders_archive)
+
+# signed_tx не выгружаем: это сырые байты транзакции, для сверки хватает хеша
+TRANSACTION_COLUMNS = (
+    "id", "user_id", "network_code", "tx_hash", "signed_tx_sha256", "status",
+    "from_address", "to_address", "amount", "created_at", "updated_at",
+)
+ORDER_COLUMNS = tuple(c.name for c in models.P2POrder.__table__.columns)
+
+_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def _exporter(current_user: models.User = Depends(get_streaming_user)) -> models.User:
+    allowed = {email.lower() for email in settings.EXPORT_ALLOWED_EMAILS}
+    if current_user.email.lower() not in allowed:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет доступа к выгрузкам")
+    return current_user
+
+
+def _export_response(
+    name: str,
+    tables,
+    columns,
+    fmt: ExportFormat,
+    created_from: datetime | None,
+    created_to: datetime | None,
+    after_id: int | None,
+) -> ExportResponse:
+    if created_from is not None and created_to is not None and created_from >= created_to:
+        raise HTTPException(status_code=400, detail="created_from должен быть раньше created_to")
+    batches = stream_rows(tables, columns, created_from=created_from, created_to=created_to, after_id=after_id)
+    encode = ndjson_chunks if fmt == "ndjson" else csv_chunks
+    filename = f"{name}-{date.today():%Y%m%d}.{fmt}"
+    return ExportResponse(
+        encode(name, columns, batches),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/export/transactions")
+async def export_transactions(
+    format: ExportFormat = "ndjson",
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    after_id: int | None = Query(None, ge=0, description="Продолжить после строки с этим id"),
+    current_user: models.User = Depends(_exporter),
+):
+    """Все транзакции по возрастанию id, `created_from` <= created_at < `created_to`."""
+    return _export_response("transactions", _transactions, TRANSACTION_COLUMNS, format, created_from, created_to, after_id)
+
+
+@router.get("/export/p2p-orders")
+async def export_p2p_orders(
+    format: ExportFormat = "ndjson",
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    after_id: int | None = Query(None, ge=0, description="Продолжить после строки с этим id"),
+    current_user: models.User = Depends(_exporter),
+):
+    """Все P2P-ордера по возрастанию id, `created_from` <= created_at < `created_to`."""
+    return _export_response("p2p_orders", _orders, ORDER_COLUMNS, format, created_from, created_to, after_id)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.services.fee_oracle import fee_oracle
+
 
 router = APIRouter()
 
@@ -10,28 +13,60 @@ class FeeEstimateIn(BaseModel):
     amount: float
 
 
+class FeeTiers(BaseModel):
+    slow: float
+    normal: float
+    fast: float
+
+
 class FeeEstimateOut(BaseModel):
     network: str
     amount: float
+    # Комиссия уровня normal (как раньше); все уровни — в tiers
     fee: float
+    fee_currency: str
+    tiers: FeeTiers
+    # tatum — живые данные сети, static — base_fee из справочника
+    source: str
+    age_seconds: float | None = None
+
+
+class FeeBatchIn(BaseModel):
+    items: list[FeeEstimateIn]
+
 
+class FeeBatchOut(BaseModel):
+    results: list[FeeEstimateOut]
 
-BASE_FEES = {
-    "BTC": 0.00005,
-    "LTC": 0.0005,
-    "ETH": 0.0005,
-    "USDT_ERC20": 3.0,
-    "BNB": 0.0003,
-    "TRX": 1.0,
-    "USDT_TRC20": 1.5,
-    "TON": 0.02,
-}
+
+def _estimate(item: FeeEstimateIn) -> FeeEstimateOut:
+    est = fee_oracle.estimate(item.network)
+    return FeeEstimateOut(
+        network=est.network,
+        amount=item.amount,
+        fee=est.normal,
+        fee_currency=est.fee_currency,
+        tiers=FeeTiers(slow=est.slow, normal=est.normal, fast=est.fast),
+        source=est.source,
+        age_seconds=est.age_seconds,
+    )
 
 
 @router.post("/fees/estimate", response_model=FeeEstimateOut)
-def estimate_fee(payload: FeeEstimateIn):
-    net = payload.network.upper()
-    base_fee = BASE_FEES.get(net, 0.001)
-    # Примитивная модель: комиссия пропорциональна логарифму суммы
-    fee = base_fee * (1.0 + 0.1 * (len(str(int(payload.amount))) if payload.amount > 0 else 0))
-    return FeeEstimateOut(network=net, amount=payload.amount, fee=fee)
+async def estimate_fee(payload: FeeEstimateIn):
+    return _estimate(payload)
+
+
+@router.post("/fees/estimate/batch", response_model=FeeBatchOut)
+async def estimate_fee_batch(payload: FeeBatchIn):
+    if len(payload.items) > settings.FEES_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не больше {settings.FEES_BATCH_MAX} оценок за запрос",
+        )
+    return FeeBatchOut(results=[_estimate(item) for item in payload.items])
+
+
+@router.get("/fees/stats")
+def get_fees_stats():
+    return fee_oracle.stats()
@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Header, Response
 
-from app.db import get_db
-from app import models
+from app.core.config import settings
 from app.schemas.network import NetworkOut
+from app.services.network_registry import network_registry
 
 router = APIRouter()
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/ не учитываем."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
 @router.get("/networks", response_model=list[NetworkOut])
-def list_networks(db: Session = Depends(get_db)):
-    nets = db.query(models.Network).order_by(models.Network.id).all()
-    return nets
+def list_networks(if_none_match: str | None = Header(default=None)):
+    """Справочник сетей: готовое тело из памяти, ETag и 304 на If-None-Match."""
+    snap = network_registry.snapshot
+    headers = {
+        "ETag": snap.etag,
+        "Cache-Control": f"public, max-age={settings.NETWORKS_CACHE_MAX_AGE}",
+    }
+    if if_none_match and _etag_matches(if_none_match, snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
@@ -1,13 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, case, or_, select, tuple_, union_all, update
 from sqlalchemy.orm import Session
 
 from app.db import get_db
 from app import models
-from app.schemas.p2p import P2POrderCreate, P2POrderOut
+from app.schemas.p2p import (
+    OrderBookLevel,
+    OrderBookMatchOut,
+    OrderBookOut,
+    P2POrderCreate,
+    P2POrderOut,
+)
+from app.services.event_hub import book_topic, event_hub, user_topic
+from app.services.fast_json import RowsResponse, columns_for
+from app.services.order_book import order_book
+from app.services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.services.rates_cache import rates_cache
 from app.services.security import get_current_user
 
 router = APIRouter()
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Поля P2POrderOut: списки отдаются кортежами этих колонок (см. fast_json)
+ORDER_FIELDS = tuple(P2POrderOut.model_fields)
+
+
+def _publish_order(order: models.P2POrder, event: str) -> None:
+    """Событие по ордеру подписчикам пары и участникам сделки (см. /ws, /stream)."""
+    best_bid, best_ask = order_book.best_bid_ask(order.crypto_currency, order.fiat_currency)
+    topics = [book_topic(order.crypto_currency, order.fiat_currency), user_topic(order.maker_id)]
+    if order.taker_id is not None:
+        topics.append(user_topic(order.taker_id))
+    event_hub.publish(
+        topics,
+        {
+            "type": "order",
+            "event": event,
+            "order": P2POrderOut.model_validate(order).model_dump(mode="json"),
+            "best_bid": best_bid,
+            "best_ask": best_ask,
+        },
+    )
+
 
 @router.post("/orders", response_model=P2POrderOut)
 def create_order(
@@ -30,22 +68,158 @@ def create_order(
     db.add(order)
     db.commit()
     db.refresh(order)
+    order_book.sync(order)
+    # Курс пары будет в кэше к тому времени, как его спросят
+    rates_cache.track(order.crypto_currency, order.fiat_currency)
+    _publish_order(order, "created")
     return order
 
 
 @router.get("/orders", response_model=list[P2POrderOut])
 def list_active_orders(
+    crypto_currency: str | None = None,
+    fiat_currency: str | None = None,
+    side: Literal["buy", "sell"] | None = None,
+    sort: Literal["id", "price_asc", "price_desc"] = "id",
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
+    """Активные ордера других пользователей, постранично (keyset).
+
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor;
+    его нужно передать в `cursor` вместе с теми же фильтрами и `sort`.
+    """
+    Order = models.P2POrder
     # Показываем активные ордера, созданные другими пользователями
-    orders = (
-        db.query(models.P2POrder)
-        .filter(models.P2POrder.status == "active", models.P2POrder.maker_id != current_user.id)
-        .order_by(models.P2POrder.id)
-        .all()
+    q = select(*columns_for(P2POrderOut, Order.__table__.c)).where(
+        Order.status == "active", Order.maker_id != current_user.id
+    )
+    if crypto_currency:
+        q = q.where(Order.crypto_currency == crypto_currency.upper())
+    if fiat_currency:
+        q = q.where(Order.fiat_currency == fiat_currency.upper())
+    if side:
+        q = q.where(Order.side == side)
+
+    if sort == "id":
+        if cursor:
+            (last_id,) = decode_cursor(cursor, (int,))
+            q = q.where(Order.id > last_id)
+        q = q.order_by(Order.id)
+    elif sort == "price_asc":
+        if cursor:
+            last_price, last_id = decode_cursor(cursor, (float, int))
+            q = q.where(tuple_(Order.price, Order.id) > (last_price, last_id))
+        q = q.order_by(Order.price, Order.id)
+    else:
+        if cursor:
+            last_price, last_id = decode_cursor(cursor, (float, int))
+            q = q.where(tuple_(Order.price, Order.id) < (last_price, last_id))
+        q = q.order_by(Order.price.desc(), Order.id.desc())
+
+    rows = db.execute(q.limit(limit + 1)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last.id) if sort == "id" else encode_cursor(last.price, last.id)
+    # Кортежи колонок сразу в JSON, без P2POrderOut на каждую строку
+    return RowsResponse(ORDER_FIELDS, rows, headers=headers)
+
+
+@router.get("/book/{crypto_currency}/{fiat_currency}", response_model=OrderBookOut)
+def get_order_book(
+    crypto_currency: str,
+    fiat_currency: str,
+    depth: int = Query(20, ge=1, le=500),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Стакан пары из памяти: лучшие цены и `depth` уровней с каждой стороны."""
+    snapshot = order_book.depth(crypto_currency, fiat_currency, levels=depth)
+    best_bid, best_ask = order_book.best_bid_ask(crypto_currency, fiat_currency)
+    # Только из памяти: стакан не ждёт CoinGecko
+    quote = rates_cache.quote(crypto_currency, fiat_currency)
+    return OrderBookOut(
+        crypto_currency=crypto_currency.upper(),
+        fiat_currency=fiat_currency.upper(),
+        best_bid=best_bid,
+        best_ask=best_ask,
+        market_price=quote.price if quote else None,
+        bids=[OrderBookLevel(price=p, amount=a, orders=n) for p, a, n in snapshot["bids"]],
+        asks=[OrderBookLevel(price=p, amount=a, orders=n) for p, a, n in snapshot["asks"]],
+    )
+
+
+@router.get("/book/{crypto_currency}/{fiat_currency}/match", response_model=OrderBookMatchOut)
+def match_order_book(
+    crypto_currency: str,
+    fiat_currency: str,
+    side: Literal["buy", "sell"],
+    amount: float = Query(..., gt=0),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Лучшие чужие ордера под сумму `amount`.
+
+    `side` — намерение тейкера: для 'buy' подбираются sell-ордера, и наоборот.
+    """
+    book_side = "sell" if side == "buy" else "buy"
+    orders = order_book.best_matches(
+        crypto_currency,
+        fiat_currency,
+        book_side,
+        amount,
+        exclude_maker_id=current_user.id,
+    )
+    return OrderBookMatchOut(
+        side=side,
+        amount=amount,
+        filled=min(amount, sum(o.amount for o in orders)),
+        orders=orders,
+    )
+
+
+def _transition(db: Session, order_id: int, conditions: list, values: dict) -> models.P2POrder | None:
+    """Переход состояния одним `UPDATE ... WHERE <условия> RETURNING`.
+
+    Проверка и запись атомарны на уровне строки: из параллельных запросов
+    условие выполнится только у одного, остальные получат 0 строк.
+    None — ни одна строка не подошла, причину выясняет _transition_error().
+    """
+    Order = models.P2POrder
+    order = db.execute(
+        update(Order)
+        .where(Order.id == order_id, *conditions)
+        .values(**values)
+        .returning(Order)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if order is not None:
+        # Состояние уже пришло в RETURNING: отвязываем объект, чтобы commit
+        # не пометил его устаревшим и чтение полей не вызвало лишний SELECT
+        db.expunge(order)
+    db.commit()
+    return order
+
+
+def _transition_error(db: Session, order_id: int, check) -> HTTPException:
+    """Почему UPDATE не затронул строк: 404 / 403 / 400 / 409.
+
+    Отдельный SELECT только на пути ошибки; check(order) возвращает
+    HTTPException для «нельзя в принципе» (403/400) или None — тогда
+    это конфликт состояния (ордер уже изменён другим запросом), 409.
+    """
+    order = db.get(models.P2POrder, order_id)
+    if order is None:
+        # Завершённый ордер мог уже уехать в архив — переход всё равно недопустим
+        archive = models.p2p_orders_archive
+        order = db.execute(select(archive).where(archive.c.id == order_id)).first()
+    if order is None:
+        return HTTPException(status_code=404, detail="Ордер не найден")
+    return check(order) or HTTPException(
+        status_code=409, detail=f"Недопустимый переход: ордер в статусе {order.status}"
     )
-    return orders
 
 
 @router.post("/orders/{order_id}/accept", response_model=P2POrderOut)
@@ -54,20 +228,25 @@ def accept_order(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    order = db.query(models.P2POrder).filter(models.P2POrder.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Ордер не найден")
-    if order.maker_id == current_user.id:
-        raise HTTPException(status_code=400, detail="Нельзя принять собственный ордер")
-    if order.status != "active":
-        raise HTTPException(status_code=400, detail=f"Нельзя принять ордер со статусом {order.status}")
-    if order.taker_id is not None:
-        raise HTTPException(status_code=400, detail="Ордер уже принят")
+    Order = models.P2POrder
+    order = _transition(
+        db,
+        order_id,
+        [Order.status == "active", Order.taker_id.is_(None), Order.maker_id != current_user.id],
+        {"taker_id": current_user.id, "status": "in_progress"},
+    )
+    if order is None:
+        def check(o: models.P2POrder) -> HTTPException | None:
+            if o.maker_id == current_user.id:
+                return HTTPException(status_code=400, detail="Нельзя принять собственный ордер")
+            if o.taker_id is not None:
+                return HTTPException(status_code=409, detail="Ордер уже принят")
+            return None
 
-    order.taker_id = current_user.id
-    order.status = "in_progress"
-    db.commit()
-    db.refresh(order)
+        raise _transition_error(db, order_id, check)
+
+    order_book.sync(order)
+    _publish_order(order, "accepted")
     return order
 
 
@@ -77,28 +256,37 @@ def confirm_order(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    order = db.query(models.P2POrder).filter(models.P2POrder.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Ордер не найден")
-    if order.status not in {"in_progress", "active"}:
-        raise HTTPException(status_code=400, detail=f"Нельзя подтвердить ордер со статусом {order.status}")
-    if current_user.id not in {order.maker_id, order.taker_id}:
-        raise HTTPException(status_code=403, detail="Вы не участвуете в этой сделке")
-
-    if current_user.id == order.maker_id:
-        order.maker_confirmed = True
-    if current_user.id == order.taker_id:
-        order.taker_confirmed = True
-
-    # Если обе стороны подтвердили – считаем сделку завершённой
-    if order.maker_confirmed and order.taker_confirmed and order.taker_id is not None:
-        order.status = "completed"
-    else:
-        # Иначе оставляем 'in_progress'
-        order.status = "in_progress"
+    Order = models.P2POrder
+    is_maker = Order.maker_id == current_user.id
+    is_taker = Order.taker_id == current_user.id
+    # SET считается по старым значениям строки, поэтому «подтвердил ли
+    # уже кто-то» выражаем через роль текущего пользователя
+    maker_done = or_(is_maker, Order.maker_confirmed.is_(True))
+    taker_done = or_(is_taker, Order.taker_confirmed.is_(True))
+    order = _transition(
+        db,
+        order_id,
+        [Order.status.in_(("in_progress", "active")), or_(is_maker, is_taker)],
+        {
+            "maker_confirmed": case((is_maker, True), else_=Order.maker_confirmed),
+            "taker_confirmed": case((is_taker, True), else_=Order.taker_confirmed),
+            # Если обе стороны подтвердили – считаем сделку завершённой
+            "status": case(
+                (and_(maker_done, taker_done, Order.taker_id.is_not(None)), "completed"),
+                else_="in_progress",
+            ),
+        },
+    )
+    if order is None:
+        def check(o: models.P2POrder) -> HTTPException | None:
+            if current_user.id not in {o.maker_id, o.taker_id}:
+                return HTTPException(status_code=403, detail="Вы не участвуете в этой сделке")
+            return None
 
-    db.commit()
-    db.refresh(order)
+        raise _transition_error(db, order_id, check)
+
+    order_book.sync(order)
+    _publish_order(order, "completed" if order.status == "completed" else "confirmed")
     return order
 
 
@@ -108,32 +296,87 @@ def cancel_order(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    order = db.query(models.P2POrder).filter(models.P2POrder.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Ордер не найден")
-    if order.maker_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Отменять может только создатель ордера")
-    if order.status in {"completed", "cancelled"}:
-        raise HTTPException(status_code=400, detail=f"Нельзя отменить ордер со статусом {order.status}")
-
-    order.status = "cancelled"
-    db.commit()
-    db.refresh(order)
+    Order = models.P2POrder
+    order = _transition(
+        db,
+        order_id,
+        [Order.maker_id == current_user.id, Order.status.not_in(("completed", "cancelled"))],
+        {"status": "cancelled"},
+    )
+    if order is None:
+        def check(o: models.P2POrder) -> HTTPException | None:
+            if o.maker_id != current_user.id:
+                return HTTPException(status_code=403, detail="Отменять может только создатель ордера")
+            return None
+
+        raise _transition_error(db, order_id, check)
+
+    order_book.sync(order)
+    _publish_order(order, "cancelled")
     return order
 
 
+OrderStatus = Literal["active", "in_progress", "completed", "cancelled"]
+
+
 @router.get("/history", response_model=list[P2POrderOut])
 def list_history(
+    status: list[OrderStatus] | None = Query(None),
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    orders = (
-        db.query(models.P2POrder)
-        .filter(
-            (models.P2POrder.maker_id == current_user.id)
-            | (models.P2POrder.taker_id == current_user.id)
+    """Сделки пользователя (мейкер или тейкер), от новых к старым, постранично.
+
+    Фильтры: `status` (можно несколько), `created_from` <= created_at < `created_to`.
+    Курсор следующей страницы — в заголовке X-Next-Cursor.
+    """
+    Order = models.P2POrder
+    me = current_user.id
+    if cursor:
+        (last_id,) = decode_cursor(cursor, (int,))
+
+    # Вместо maker_id = :me OR taker_id = :me — по ветке UNION ALL на роль
+    # в горячей и в архивной таблице; каждая идёт по своему индексу
+    # (role_id, id) и отдаёт не больше limit + 1 строк
+    def branch(table, role: str):
+        c = table.c
+        conditions = [c[role] == me]
+        if role == "taker_id":
+            # Свой ордер принять нельзя, но на всякий случай не дублируем строку
+            conditions.append(c.maker_id != me)
+        if status:
+            conditions.append(c.status.in_(status))
+        if created_from is not None:
+            conditions.append(c.created_at >= created_from)
+        if created_to is not None:
+            conditions.append(c.created_at < created_to)
+        if cursor:
+            conditions.append(c.id < last_id)
+        return select(
+            select(*columns_for(P2POrderOut, c))
+            .where(*conditions)
+            .order_by(c.id.desc())
+            .limit(limit + 1)
+            .subquery()
         )
-        .order_by(models.P2POrder.id.desc())
-        .all()
-    )
-    return orders
+
+    both = union_all(
+        *(
+            branch(table, role)
+            for table in (Order.__table__, models.p2p_orders_archive)
+            for role in ("maker_id", "taker_id")
+        )
+    ).subquery()
+    rows = db.execute(
+        select(*columns_for(P2POrderOut, both.c)).order_by(both.c.id.desc()).limit(limit + 1)
+    ).all()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return RowsResponse(ORDER_FIELDS, rows, headers=headers)
@@ -1,13 +1,57 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+
 from app.services.rates_cache import rates_cache
 
 router = APIRouter()
 
 
+class ConvertOut(BaseModel):
+    amount: float
+    from_currency: str = Field(serialization_alias="from")
+    to_currency: str = Field(serialization_alias="to")
+    rate: float
+    result: float
+    # Возраст самого старого использованного курса; stale — старше TTL
+    age_seconds: float
+    stale: bool
+
+
 @router.get("/rates")
-async def get_rates():
+async def get_rates(vs: str = Query("usd", description="Фиаты через запятую: usd,eur,rub")):
+    fiats = [v.strip() for v in vs.split(",") if v.strip()]
     try:
-        data = await rates_cache.get_rates()
+        data = await rates_cache.get_rates(fiats)
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Не удалось получить курсы: {exc}")
     return data
+
+
+@router.get("/rates/convert", response_model=ConvertOut, response_model_by_alias=True)
+async def convert(
+    amount: float = Query(..., ge=0),
+    from_currency: str = Query(..., alias="from", description="Монета (BTC) или фиат (EUR)"),
+    to_currency: str = Query(..., alias="to"),
+):
+    try:
+        result = await rates_cache.convert(amount, from_currency, to_currency)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Не удалось получить курсы: {exc}")
+    return ConvertOut(
+        amount=result.amount,
+        from_currency=result.from_currency,
+        to_currency=result.to_currency,
+        rate=result.rate,
+        result=result.result,
+        age_seconds=round(result.age_seconds, 3),
+        stale=result.stale,
+    )
+
+
+@router.get("/rates/stats")
+def get_rates_stats():
+    return rates_cache.stats()
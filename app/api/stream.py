@@ -0,0 +1,129 @@
+"""Push-события вместо опроса: WebSocket `/ws` и SSE `/stream`.
+
+Темы, на которые может подписаться клиент:
+- `book:{CRYPTO}:{FIAT}` — ордера пары (создан/принят/подтверждён/отменён);
+- `orders`               — свои ордера (как мейкер или тейкер);
+- `tx:{NETWORK}:{hash}`  — статус транзакции.
+
+WebSocket: токен в `?token=`, дальше сообщения
+`{"action": "subscribe" | "unsubscribe", "topics": [...]}`.
+SSE: `GET /stream?topics=book:BTC:USD,orders` с обычным Bearer-токеном.
+"""
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+from app import models
+from app.services.event_hub import HEARTBEAT, Subscription, book_topic, event_hub, tx_topic, user_topic
+from app.services.network_registry import network_registry
+from app.services.security import authenticate_token, get_streaming_user
+
+router = APIRouter()
+
+_PING = json.dumps({"type": "ping"})
+
+
+def _resolve_topic(name: str, user_id: int) -> str:
+    """Тема клиента -> внутренняя тема хаба; ValueError, если тема неизвестна."""
+    kind, _, rest = name.strip().partition(":")
+    if kind == "orders" and not rest:
+        return user_topic(user_id)
+    if kind == "book":
+        crypto, _, fiat = rest.partition(":")
+        if crypto and fiat and ":" not in fiat:
+            return book_topic(crypto, fiat)
+    if kind == "tx":
+        network, _, tx_hash = rest.partition(":")
+        if tx_hash and network.upper() in network_registry:
+            return tx_topic(network, tx_hash)
+    raise ValueError(f"Неизвестная тема: {name}")
+
+
+def _resolve_topics(names: list[str], user_id: int) -> list[str]:
+    return [_resolve_topic(name, user_id) for name in names if name.strip()]
+
+
+async def _read_commands(websocket: WebSocket, sub: Subscription, user_id: int) -> None:
+    """Команды клиента; ответы идут через ту же очередь, что и события."""
+    try:
+        while True:
+            try:
+                command = await websocket.receive_json()
+                action = command.get("action")
+                topics = _resolve_topics(list(command.get("topics") or []), user_id)
+                if action == "subscribe":
+                    sub.subscribe(*topics)
+                elif action == "unsubscribe":
+                    sub.unsubscribe(*topics)
+                else:
+                    raise ValueError(f"Неизвестное действие: {action}")
+                reply = {"type": action + "d", "topics": command.get("topics")}
+            except (ValueError, TypeError, AttributeError) as exc:
+                # В т.ч. невалидный JSON (json.JSONDecodeError — подкласс ValueError)
+                reply = {"type": "error", "detail": str(exc)}
+            sub.push(json.dumps(reply, ensure_ascii=False))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sub.close()
+
+
+@router.websocket("/ws")
+async def stream_ws(websocket: WebSocket, token: str | None = None):
+    user = await authenticate_token(token) if token else None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    sub = event_hub.subscription()
+    reader = asyncio.create_task(_read_commands(websocket, sub, user.id))
+    try:
+        while True:
+            batch = await sub.next_batch()
+            if not batch:
+                break
+            for message in batch:
+                await websocket.send_text(_PING if message is HEARTBEAT else message)
+        if sub.overflowed:
+            # Клиент не успевает читать: пусть переподключится и перечитает состояние
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        sub.close()
+        reader.cancel()
+
+
+@router.get("/stream")
+async def stream_sse(
+    topics: str = Query(..., description="Темы через запятую: book:BTC:USD,orders,tx:ETH:0x..."),
+    current_user: models.User = Depends(get_streaming_user),
+):
+    sub = event_hub.subscription()
+    try:
+        sub.subscribe(*_resolve_topics(topics.split(","), current_user.id))
+    except ValueError as exc:
+        sub.close()
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                batch = await sub.next_batch()
+                if not batch:
+                    if sub.overflowed:
+                        yield 'event: overflow\ndata: {"type":"overflow"}\n\n'
+                    break
+                yield "".join(": ping\n\n" if m is HEARTBEAT else f"data: {m}\n\n" for m in batch)
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
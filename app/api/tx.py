@@ -1,36 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+import hashlib
 
-from app.db import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_async_db
 from app import models
-from app.schemas.tx import TxBroadcastIn, TxOut
+from app.schemas.tx import (
+    TxBroadcastBatchIn,
+    TxBroadcastBatchOut,
+    TxBroadcastIn,
+    TxBroadcastItemOut,
+    TxOut,
+)
 from app.services.security import get_current_user
 from app.services import tatum_client
+from app.services.event_hub import publish_tx_status
+from app.services.network_registry import network_registry
 from app.core.config import settings
 
 router = APIRouter()
 
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Ставится, если ответ взят из ранее сохранённой транзакции, без Tatum
+REPLAYED_HEADER = "Idempotent-Replayed"
 
-@router.post("/tx/broadcast", response_model=TxOut)
-async def broadcast_tx(
-    payload: TxBroadcastIn,
-    db: Session = Depends(get_db),
-    current_user: models.User | None = Depends(get_current_user),
-):
-    net = payload.network.upper()
 
-    # Проверяем, что сеть есть в справочнике
-    network = db.query(models.Network).filter(models.Network.code == net).first()
-    if not network:
-        raise HTTPException(status_code=400, detail=f"Неизвестная сеть: {net}")
+def request_deadline(
+    x_request_timeout: float | None = Header(default=None, gt=0, description="Бюджет запроса, секунды"),
+) -> float:
+    """Дедлайн для исходящих вызовов: вызовы Tatum не переживут этот запрос."""
+    budget = settings.TX_REQUEST_DEADLINE_SECONDS
+    if x_request_timeout is not None:
+        budget = min(budget, x_request_timeout)
+    return tatum_client.deadline_after(budget)
+
 
+async def _send_signed_tx(net: str, signed_tx: str, deadline: float | None = None) -> tuple[str, str]:
+    """Отправить транзакцию, вернуть (tx_hash, status). Ошибки — HTTPException."""
     # Пытаемся отправить транзакцию в Tatum, если он настроен
     if settings.tatum_api_key:
         try:
-            tx_hash = await tatum_client.broadcast_signed_tx(net, payload.signed_tx)
+            tx_hash = await tatum_client.broadcast_signed_tx(net, signed_tx, deadline=deadline)
             status = "pending"
         except tatum_client.TatumNotConfigured:
-            tx_hash = payload.signed_tx  # fallback
+            tx_hash = signed_tx  # fallback
             status = "pending"
         except HTTPException as exc:
             raise exc
@@ -40,56 +56,297 @@ async def broadcast_tx(
     else:
         # Если Tatum не настроен, оставляем поведение как у тестового стенда
         # и используем псевдо-хеш
-        import hashlib
-        tx_hash = hashlib.sha256(payload.signed_tx.encode()).hexdigest()
+        tx_hash = hashlib.sha256(signed_tx.encode()).hexdigest()
         status = "pending"
+    return tx_hash, status
+
+
+def _signed_tx_sha256(signed_tx: str) -> str:
+    return hashlib.sha256(signed_tx.encode()).hexdigest()
+
 
-    tx = models.Transaction(
-        user_id=current_user.id if current_user else None,
-        network_code=net,
-        tx_hash=tx_hash,
-        signed_tx=payload.signed_tx,
-        to_address=payload.to_address,
-        from_address=payload.from_address,
-        amount=payload.amount,
-        status=status,
+def _insert_ignore(db: AsyncSession):
+    """INSERT ... ON CONFLICT DO NOTHING для transactions.
+
+    Параллельный повтор той же транзакции упирается в уникальные индексы;
+    вместо IntegrityError просто не вставляем вторую строку. Core-таблица,
+    а не ORM-класс: так у результата есть rowcount.
+    """
+    table = models.Transaction.__table__
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def _stored_tables():
+    """Где искать сохранённые отправки: горячая таблица, затем архив.
+
+    Уникальные индексы есть только у горячей таблицы, но повтор старой
+    транзакции (или старого Idempotency-Key) после архивации тоже должен
+    отдать сохранённый результат, а не уйти в Tatum второй раз.
+    """
+    return (models.Transaction.__table__, models.transactions_archive)
+
+
+async def _find_stored(
+    db: AsyncSession,
+    user_id: int | None,
+    net: str,
+    digest: str,
+    idempotency_key: str | None,
+):
+    """Ранее сохранённая отправка: по Idempotency-Key или по тем же байтам."""
+    for table in _stored_tables():
+        columns = (table.c.network_code, table.c.signed_tx_sha256, table.c.tx_hash, table.c.status)
+        if idempotency_key:
+            row = (
+                await db.execute(
+                    select(*columns)
+                    .where(
+                        table.c.user_id.is_(None) if user_id is None else table.c.user_id == user_id,
+                        table.c.idempotency_key == idempotency_key,
+                    )
+                    .limit(1)
+                )
+            ).first()
+            if row is not None:
+                if row.network_code != net or row.signed_tx_sha256 != digest:
+                    raise HTTPException(
+                        status_code=422,
+                        detail=f"{IDEMPOTENCY_HEADER} уже использован для другой транзакции",
+                    )
+                return row
+        row = (
+            await db.execute(
+                select(*columns)
+                .where(table.c.network_code == net, table.c.signed_tx_sha256 == digest)
+                .limit(1)
+            )
+        ).first()
+        if row is not None:
+            return row
+    return None
+
+
+@router.post("/tx/broadcast", response_model=TxOut)
+async def broadcast_tx(
+    payload: TxBroadcastIn,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias=IDEMPOTENCY_HEADER, max_length=255),
+    deadline: float = Depends(request_deadline),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User | None = Depends(get_current_user),
+):
+    """Отправить подписанную транзакцию.
+
+    Повтор (тот же Idempotency-Key или тот же signed_tx в той же сети)
+    отдаёт сохранённый результат и в Tatum не ходит. От гонки двух
+    запросов с одним Idempotency-Key защищает уникальный индекс
+    (user_id, idempotency_key); NULL в нём не сравниваются, так что это
+    работает только потому, что эндпоинт требует аутентификации.
+    """
+    net = payload.network.upper()
+    user_id = current_user.id if current_user else None
+    digest = _signed_tx_sha256(payload.signed_tx)
+
+    # Проверяем, что сеть есть в справочнике
+    if net not in network_registry:
+        raise HTTPException(status_code=400, detail=f"Неизвестная сеть: {net}")
+
+    stored = await _find_stored(db, user_id, net, digest, idempotency_key)
+    if stored is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+        return TxOut(network=net, tx_hash=stored.tx_hash, status=stored.status)
+
+    tx_hash, status = await _send_signed_tx(net, payload.signed_tx, deadline)
+
+    result = await db.execute(
+        _insert_ignore(db),
+        {
+            "user_id": user_id,
+            "network_code": net,
+            "tx_hash": tx_hash,
+            "signed_tx": payload.signed_tx,
+            "signed_tx_sha256": digest,
+            "idempotency_key": idempotency_key,
+            "to_address": payload.to_address,
+            "from_address": payload.from_address,
+            "amount": payload.amount,
+            "status": status,
+        },
     )
-    db.add(tx)
-    db.commit()
-    db.refresh(tx)
+    await db.commit()
+
+    if result.rowcount == 0:
+        # Параллельный запрос успел сохранить раньше ту же транзакцию или
+        # другую под тем же Idempotency-Key (тогда — 422)
+        stored = await _find_stored(db, user_id, net, digest, idempotency_key)
+        if stored is None:
+            stored = await db.scalar(
+                select(models.Transaction).where(
+                    models.Transaction.network_code == net,
+                    models.Transaction.tx_hash == tx_hash,
+                )
+            )
+        if stored is None:
+            # Без строки reconciler транзакцию не отследит — не делаем вид,
+            # что она сохранена
+            raise HTTPException(status_code=409, detail="Транзакция не сохранена, повторите запрос")
+        response.headers[REPLAYED_HEADER] = "true"
+        return TxOut(network=net, tx_hash=stored.tx_hash, status=stored.status)
 
+    publish_tx_status(net, tx_hash, status)
     return TxOut(network=net, tx_hash=tx_hash, status=status)
 
 
+@router.post("/tx/broadcast/batch", response_model=TxBroadcastBatchOut)
+async def broadcast_tx_batch(
+    payload: TxBroadcastBatchIn,
+    deadline: float = Depends(request_deadline),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User | None = Depends(get_current_user),
+):
+    """Отправить пачку подписанных транзакций.
+
+    Сети проверяются по справочнику в памяти, отправка в Tatum идёт параллельно
+    (не больше TX_BROADCAST_CONCURRENCY одновременно), успешные транзакции
+    пишутся одним INSERT. Ошибка одной транзакции не валит остальные.
+    Уже сохранённые транзакции (тот же signed_tx в той же сети, в том числе
+    архивные) и дубли внутри пачки в Tatum повторно не отправляются.
+    """
+    if len(payload.items) > settings.TX_BROADCAST_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не больше {settings.TX_BROADCAST_BATCH_MAX} транзакций за запрос",
+        )
+
+    nets = [item.network.upper() for item in payload.items]
+    digests = [_signed_tx_sha256(item.signed_tx) for item in payload.items]
+    keys = list(zip(nets, digests))
+    known = {net for net in nets if net in network_registry}
+    stored = {}
+    for table in _stored_tables():
+        missing = set(keys) - stored.keys()
+        if not missing:
+            break
+        for row in await db.execute(
+            select(table.c.network_code, table.c.signed_tx_sha256, table.c.tx_hash, table.c.status).where(
+                tuple_(table.c.network_code, table.c.signed_tx_sha256).in_(missing)
+            )
+        ):
+            stored.setdefault((row.network_code, row.signed_tx_sha256), row)
+    sem = asyncio.Semaphore(settings.TX_BROADCAST_CONCURRENCY)
+
+    async def send(net: str, item: TxBroadcastIn) -> tuple[str, str] | str:
+        async with sem:
+            try:
+                return await _send_signed_tx(net, item.signed_tx, deadline)
+            except HTTPException as exc:
+                return str(exc.detail)
+
+    # Одна отправка на уникальную (сеть, signed_tx), если её ещё нет в БД
+    first_index: dict[tuple[str, str], int] = {}
+    for index, key in enumerate(keys):
+        if key[0] in known and key not in stored:
+            first_index.setdefault(key, index)
+    sent = dict(
+        zip(
+            first_index,
+            await asyncio.gather(*(send(key[0], payload.items[i]) for key, i in first_index.items())),
+        )
+    )
+
+    results: list[TxBroadcastItemOut] = []
+    rows = []
+    for index, (key, item) in enumerate(zip(keys, payload.items)):
+        net = key[0]
+        if net not in known:
+            results.append(TxBroadcastItemOut(index=index, network=net, error=f"Неизвестная сеть: {net}"))
+        elif key in stored:
+            row = stored[key]
+            results.append(TxBroadcastItemOut(index=index, network=net, tx_hash=row.tx_hash, status=row.status))
+        elif isinstance(sent[key], str):
+            results.append(TxBroadcastItemOut(index=index, network=net, error=sent[key]))
+        else:
+            tx_hash, status = sent[key]
+            results.append(TxBroadcastItemOut(index=index, network=net, tx_hash=tx_hash, status=status))
+            if first_index[key] == index:
+                rows.append(
+                    {
+                        "user_id": current_user.id if current_user else None,
+                        "network_code": net,
+                        "tx_hash": tx_hash,
+                        "signed_tx": item.signed_tx,
+                        "signed_tx_sha256": key[1],
+                        "idempotency_key": None,
+                        "to_address": item.to_address,
+                        "from_address": item.from_address,
+                        "amount": item.amount,
+                        "status": status,
+                    }
+                )
+    if rows:
+        table = models.Transaction.__table__
+        # События — только по строкам, которые вставил этот запрос: параллельно
+        # сохранённые ON CONFLICT DO NOTHING пропускает, их опубликовал тот запрос
+        inserted = (
+            await db.execute(
+                _insert_ignore(db).returning(table.c.network_code, table.c.tx_hash, table.c.status), rows
+            )
+        ).all()
+        await db.commit()
+        for row in inserted:
+            publish_tx_status(row.network_code, row.tx_hash, row.status)
+
+    return TxBroadcastBatchOut(results=results)
+
+
 @router.get("/tx/{network}/{tx_hash}", response_model=TxOut)
 async def get_tx_status(
     network: str,
     tx_hash: str,
-    db: Session = Depends(get_db),
+    refresh: bool = False,
+    deadline: float = Depends(request_deadline),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """Статус транзакции из БД.
+
+    Актуальность статусов pending-транзакций поддерживает фоновый
+    reconciler; `?refresh=true` принудительно спрашивает Tatum.
+    """
     net = network.upper()
-    tx = (
-        db.query(models.Transaction)
-        .filter(models.Transaction.network_code == net, models.Transaction.tx_hash == tx_hash)
-        .first()
+    tx = await db.scalar(
+        select(models.Transaction)
+        .where(models.Transaction.network_code == net, models.Transaction.tx_hash == tx_hash)
     )
     if not tx:
-        # Даже если в БД нет, можем попробовать спросить у Tatum
-        if settings.tatum_api_key:
-            chain_status = await tatum_client.get_tx_status(net, tx_hash)
+        # Подтверждённые/упавшие транзакции со временем уезжают в архив;
+        # их статус окончательный, Tatum не спрашиваем
+        archive = models.transactions_archive
+        archived = await db.scalar(
+            select(archive.c.status).where(archive.c.network_code == net, archive.c.tx_hash == tx_hash)
+        )
+        if archived is not None:
+            return TxOut(network=net, tx_hash=tx_hash, status=archived)
+        # Даже если в БД нет, по явному запросу можем спросить у Tatum
+        if refresh and settings.tatum_api_key:
+            chain_status = await tatum_client.get_tx_status(net, tx_hash, deadline=deadline)
             return TxOut(network=net, tx_hash=tx_hash, status=chain_status)
         raise HTTPException(status_code=404, detail="Транзакция не найдена")
 
     status = tx.status
 
-    if settings.tatum_api_key:
+    if refresh and settings.tatum_api_key:
         try:
-            chain_status = await tatum_client.get_tx_status(net, tx_hash)
+            chain_status = await tatum_client.get_tx_status(net, tx_hash, deadline=deadline)
             # Обновляем статус, если он изменился
             if chain_status and chain_status != tx.status:
                 tx.status = chain_status
-                db.commit()
-                db.refresh(tx)
+                await db.commit()
+                publish_tx_status(net, tx_hash, chain_status)
             status = tx.status
         except Exception:
             # В боевом коде логировалось бы в Sentry/лог, но API не ломаем
@@ -13,20 +13,156 @@ class Settings(BaseSettings):
 
     # Значения, которые берём из .env
     DB_URL: str
+    # Необязательно: отдельный URL для async-движка (по умолчанию выводится
+    # из DB_URL: asyncpg для Postgres, aiosqlite для SQLite)
+    ASYNC_DB_URL: str | None = None
     SECRET_KEY: str = "super-secret-key-change-me"  # ⚠️ в проде ОБЯЗАТЕЛЬНО поменять
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 3
+    # Кэш проверенных токенов и пользователей в get_current_user
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    # Хеширование паролей: cost bcrypt (при изменении хеши обновляются при
+    # логине) и отдельный пул потоков с ограниченной очередью (сверх — 429)
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    PASSWORD_HASH_RETRY_AFTER: int = 1
     TATUM_API_KEY: str | None = None
     # В README указан именно TATUM_BASE_URL, поэтому держим поле в UPPER_SNAKE
     # и даём совместимый алиас-свойство ниже.
     TATUM_BASE_URL: str = "https://api.tatum.io"
 
+    # Пул исходящих соединений к Tatum (один клиент на процесс)
+    TATUM_HTTP2: bool = True
+    TATUM_MAX_CONNECTIONS: int = 100
+    TATUM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    TATUM_KEEPALIVE_EXPIRY: float = 30.0
+    TATUM_TIMEOUT: float = 20.0
+    TATUM_CONNECT_TIMEOUT: float = 5.0
+    TATUM_POOL_TIMEOUT: float = 5.0
+    # Circuit breaker на сеть Tatum: открывается, если в окне набралось
+    # не меньше MIN_REQUESTS вызовов и доля ошибок >= ERROR_RATE
+    TATUM_BREAKER_WINDOW_SECONDS: float = 30.0
+    TATUM_BREAKER_MIN_REQUESTS: int = 20
+    TATUM_BREAKER_ERROR_RATE: float = 0.5
+    TATUM_BREAKER_OPEN_SECONDS: float = 15.0
+    # Повторы чтения статуса: экспоненциальная задержка с jitter
+    TATUM_STATUS_RETRIES: int = 2
+    TATUM_RETRY_BASE_SECONDS: float = 0.2
+    TATUM_RETRY_MAX_SECONDS: float = 2.0
+    # Общий бюджет исходящих вызовов Tatum на процесс (или на все воркеры
+    # при RATE_LIMIT_REDIS_URL): запросов в секунду, запас и сколько вызов
+    # может ждать своей очереди, прежде чем получить 503. 0 — без бюджета
+    TATUM_BUDGET_PER_SECOND: float = 50.0
+    TATUM_BUDGET_BURST: float = 50.0
+    TATUM_BUDGET_MAX_WAIT_SECONDS: float = 2.0
+    # Бюджет времени tx-эндпоинта на вызовы Tatum (клиент может сократить
+    # заголовком X-Request-Timeout)
+    TX_REQUEST_DEADLINE_SECONDS: float = 15.0
+    # Пакетная отправка транзакций
+    TX_BROADCAST_BATCH_MAX: int = 100
+    TX_BROADCAST_CONCURRENCY: int = 10
+
+    # Rate limit входящих запросов: token bucket на пользователя (по JWT)
+    # или IP для каждого класса маршрутов; rate — токенов в секунду,
+    # burst — ёмкость бакета. Класс без записи в RATE_LIMITS не лимитируется.
+    # RATE_LIMIT_REDIS_URL — общие бакеты для нескольких воркеров
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: dict[str, dict[str, float]] = {
+        "tx_broadcast": {"rate": 1.0, "burst": 10},
+        "tx_status": {"rate": 5.0, "burst": 30},
+        "auth": {"rate": 0.2, "burst": 10},
+        "rates": {"rate": 2.0, "burst": 20},
+        "default": {"rate": 20.0, "burst": 100},
+    }
+    RATE_LIMIT_REDIS_URL: str | None = None
+    # Брать IP клиента из X-Forwarded-For (только за доверенным прокси)
+    RATE_LIMIT_TRUST_PROXY: bool = False
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+
+    # Курсы CoinGecko: TTL и stale — у каждой пары (монета, фиат) свои.
+    # Всегда отслеживаются все монеты в RATES_DEFAULT_FIATS, остальные пары —
+    # из стакана и запросов; пара без обращений PAIR_IDLE секунд выбывает.
+    # RATES_FIATS — какие фиаты можно спрашивать (пусто — список CoinGecko
+    # /simple/supported_vs_currencies)
+    COINGECKO_BASE_URL: str = "https://api.coingecko.com/api/v3"
+    RATES_TTL_SECONDS: float = 60.0
+    RATES_STALE_SECONDS: float = 600.0
+    RATES_REFRESH_AHEAD_SECONDS: float = 10.0
+    RATES_DEFAULT_FIATS: list[str] = ["usd"]
+    RATES_PAIR_IDLE_SECONDS: float = 86400.0
+    RATES_MAX_PAIRS: int = 1000
+    RATES_FIATS: list[str] = []
+
+    # Оракул комиссий: TTL котировки Tatum по сети (фоновое обновление за
+    # REFRESH_AHEAD до истечения), после TTL + STALE — статичная base_fee
+    FEES_TTL_SECONDS: dict[str, float] = {
+        "bitcoin": 60.0,
+        "litecoin": 60.0,
+        "ethereum": 12.0,
+        "bsc": 6.0,
+    }
+    FEES_STALE_SECONDS: float = 300.0
+    FEES_REFRESH_AHEAD_SECONDS: float = 2.0
+    FEES_BATCH_MAX: int = 1000
+
+    # Push-события (WebSocket /ws, SSE /stream): очередь на подписчика
+    # (при переполнении клиент отключается), лимит тем, период heartbeat
+    STREAM_QUEUE_SIZE: int = 100
+    STREAM_MAX_TOPICS: int = 50
+    STREAM_HEARTBEAT_SECONDS: float = 25.0
+
+    # Справочник сетей: Cache-Control max-age для GET /networks
+    NETWORKS_CACHE_MAX_AGE: int = 300
+
+    # Выгрузки /export/*: кому разрешены (email) и размер пачки серверного курсора
+    EXPORT_ALLOWED_EMAILS: list[str] = []
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Валидация адресов. Без нативного keccak (pycryptodome/pysha3) EIP-55
+    # считается на чистом Python, ~1 мс на адрес под GIL — пакет держим небольшим
+    ADDRESS_BATCH_MAX: int = 200
+    ADDRESS_CACHE_SIZE: int = 100_000
+
+    # Фоновая сверка pending-транзакций. Интервал опроса сети, секунды, —
+    # networks.reconcile_interval из справочника; RECONCILER_INTERVALS
+    # переопределяет его по коду сети, DEFAULT — для сетей без значения
+    RECONCILER_ENABLED: bool = True
+    RECONCILER_BATCH_SIZE: int = 200
+    RECONCILER_CONCURRENCY: int = 10
+    RECONCILER_TICK_SECONDS: float = 5.0
+    RECONCILER_DEFAULT_INTERVAL_SECONDS: float = 30.0
+    RECONCILER_INTERVALS: dict[str, float] = {}
+
+    # Архив: терминальные ордера/транзакции, не менявшиеся ARCHIVE_AFTER_DAYS,
+    # переносятся в *_archive пачками по ARCHIVE_BATCH_SIZE (пауза между
+    # пачками — чтобы не держать блокировки), проход раз в INTERVAL секунд
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_AFTER_DAYS: float = 30.0
+    ARCHIVE_BATCH_SIZE: int = 1000
+    ARCHIVE_BATCH_PAUSE_SECONDS: float = 0.05
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+
+    # Общий кэш воркеров хоста (курсы, комиссии, инвалидации пользователей):
+    # memory — в пределах процесса, shm — каталог CACHE_SHM_DIR на tmpfs.
+    # Обновление ключа ведёт один воркер, остальные ждут его не дольше
+    # LEASE_WAIT секунд; инвалидации дочитываются раз в POLL секунд
+    CACHE_BACKEND: str = "memory"
+    CACHE_SHM_DIR: str = "/dev/shm/crypto-p2p-cache"
+    CACHE_POLL_SECONDS: float = 0.2
+    CACHE_LEASE_WAIT_SECONDS: float = 15.0
+
     # --- alias-ы, которыми пользуется остальной код (snake_case) ---
 
     @property
     def db_url(self) -> str:
         return self.DB_URL
 
+    @property
+    def async_db_url(self) -> str | None:
+        return self.ASYNC_DB_URL
+
     @property
     def secret_key(self) -> str:
         return self.SECRET_KEY
@@ -47,6 +183,10 @@ class Settings(BaseSettings):
     def tatum_base_url(self) -> str:
         return self.TATUM_BASE_URL
 
+    @property
+    def coingecko_base_url(self) -> str:
+        return self.COINGECKO_BASE_URL.rstrip("/")
+
 
 @lru_cache
 def get_settings() -> "Settings":
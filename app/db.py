@@ -1,7 +1,9 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.core.config import settings
+from app.services.metrics import instrument_engine
 
 _connect_args = {}
 # Удобно для локальной разработки/тестов на SQLite.
@@ -13,9 +15,44 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _to_async_url(url: str) -> str:
+    # Тот же DB_URL, но с асинхронным драйвером:
+    # psycopg2 -> asyncpg для Postgres, pysqlite -> aiosqlite для SQLite.
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect in {"postgresql", "postgres"}:
+        return f"postgresql+asyncpg{sep}{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+async_engine = create_async_engine(
+    settings.async_db_url or _to_async_url(settings.db_url),
+    connect_args=_connect_args,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+# Число и время SQL-запросов в пределах HTTP-запроса (см. MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    # Для async-эндпоинтов: запросы не блокируют event loop
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -7,6 +7,8 @@ from sqlalchemy import (
     Boolean,
     Float,
     ForeignKey,
+    Index,
+    Table,
 )
 from sqlalchemy.orm import relationship
 
@@ -31,6 +33,17 @@ class Network(Base):
     native_symbol = Column(String, nullable=False)
     is_token = Column(Boolean, default=False)
     parent_chain = Column(String, nullable=True)
+    # Имя сети в путях Tatum (/v3/{chain}/...); по нему же выбирается формат адреса
+    chain = Column(String, nullable=True)
+    # Базовая комиссия для /fees/estimate — в монете, которой платится
+    # комиссия (для токенов — в монете родительской сети)
+    base_fee = Column(Float, nullable=True)
+    # Типичный размер транзакции для живой оценки комиссии: vbytes для
+    # UTXO-сетей, лимит газа для EVM (NULL — только base_fee)
+    tx_units = Column(Float, nullable=True)
+    # Как часто сверять pending-транзакции сети с Tatum, секунды
+    # (NULL — RECONCILER_DEFAULT_INTERVAL_SECONDS)
+    reconcile_interval = Column(Float, nullable=True)
 
 
 class Transaction(Base):
@@ -38,9 +51,13 @@ class Transaction(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    network_code = Column(String, nullable=False, index=True)
-    tx_hash = Column(String, nullable=False, index=True)
+    network_code = Column(String, nullable=False)
+    tx_hash = Column(String, nullable=False)
     signed_tx = Column(String, nullable=False)
+    # sha256(signed_tx): повторная отправка тех же байт находится без Tatum
+    signed_tx_sha256 = Column(String, nullable=True)
+    # Заголовок Idempotency-Key, уникален в пределах пользователя
+    idempotency_key = Column(String, nullable=True)
     status = Column(String, nullable=False, default="pending")
     to_address = Column(String, nullable=True)
     from_address = Column(String, nullable=True)
@@ -50,6 +67,19 @@ class Transaction(Base):
 
     user = relationship("User")
 
+    __table_args__ = (
+        # Одна запись на транзакцию; заодно покрывает поиск в GET /tx/{network}/{tx_hash}
+        # и фильтр по сети в reconciler (network_code — префикс индекса)
+        Index("uq_transactions_network_hash", "network_code", "tx_hash", unique=True),
+        Index("uq_transactions_network_signed", "network_code", "signed_tx_sha256", unique=True),
+        Index("uq_transactions_idempotency", "user_id", "idempotency_key", unique=True),
+        # Выборка по статусу: pending для reconciler, терминальные для архиватора
+        Index("ix_transactions_status_id", "status", "id"),
+        # id не переиспользуются после архивации строк с максимальным id
+        # (в SQLite без AUTOINCREMENT новый id = max(id) + 1 горячей таблицы)
+        {"sqlite_autoincrement": True},
+    )
+
 
 class P2POrder(Base):
     __tablename__ = "p2p_orders"
@@ -73,3 +103,52 @@ class P2POrder(Base):
 
     maker = relationship("User", foreign_keys=[maker_id])
     taker = relationship("User", foreign_keys=[taker_id])
+
+    __table_args__ = (
+        # Стакан: фильтр по паре/стороне + keyset-пагинация по цене
+        Index(
+            "ix_p2p_orders_book",
+            "status", "crypto_currency", "fiat_currency", "side", "price", "id",
+        ),
+        # Листинг без фильтров: по id и по цене
+        Index("ix_p2p_orders_status_id", "status", "id"),
+        Index("ix_p2p_orders_status_price", "status", "price", "id"),
+        # История пользователя: по индексу на каждую роль, id — для порядка
+        # и keyset-пагинации (см. list_history)
+        Index("ix_p2p_orders_maker_id", "maker_id", "id"),
+        Index("ix_p2p_orders_taker_id", "taker_id", "id"),
+        # См. Transaction: id уникален в горячей и архивной таблицах вместе
+        {"sqlite_autoincrement": True},
+    )
+
+
+def _archive_table(source: Table, name: str, *indexes: Index) -> Table:
+    """Архивная копия таблицы: те же колонки (без FK и default-ов) + archived_at.
+
+    id переносится как есть, поэтому строку можно найти по тому же id,
+    а UNION ALL горячей и архивной таблиц сохраняет порядок по id.
+    """
+    columns = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+        for c in source.columns
+    ]
+    return Table(name, Base.metadata, *columns, Column("archived_at", DateTime, nullable=False), *indexes)
+
+
+# Завершённые/отменённые ордера и подтверждённые/упавшие транзакции старше
+# ARCHIVE_AFTER_DAYS переносит app.services.archiver; горячие таблицы и их
+# индексы остаются маленькими
+p2p_orders_archive = _archive_table(
+    P2POrder.__table__,
+    "p2p_orders_archive",
+    Index("ix_p2p_orders_archive_maker_id", "maker_id", "id"),
+    Index("ix_p2p_orders_archive_taker_id", "taker_id", "id"),
+)
+transactions_archive = _archive_table(
+    Transaction.__table__,
+    "transactions_archive",
+    Index("ix_transactions_archive_network_hash", "network_code", "tx_hash"),
+    # Повторы после архивации: по тем же байтам и по Idempotency-Key
+    Index("ix_transactions_archive_network_signed", "network_code", "signed_tx_sha256"),
+    Index("ix_transactions_archive_idempotency", "user_id", "idempotency_key"),
+)
@@ -26,3 +26,36 @@ class P2POrderOut(BaseModel):
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class OrderBookLevel(BaseModel):
+    price: float
+    amount: float
+    orders: int
+
+
+class OrderBookOut(BaseModel):
+    crypto_currency: str
+    fiat_currency: str
+    best_bid: float | None = None
+    best_ask: float | None = None
+    # Рыночный курс пары по CoinGecko (из кэша курсов), если он уже есть
+    market_price: float | None = None
+    bids: list[OrderBookLevel]
+    asks: list[OrderBookLevel]
+
+
+class OrderBookMatch(BaseModel):
+    id: int
+    maker_id: int
+    amount: float
+    price: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderBookMatchOut(BaseModel):
+    side: str
+    amount: float
+    filled: float
+    orders: list[OrderBookMatch]
@@ -15,3 +15,20 @@ class TxOut(BaseModel):
     status: str
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class TxBroadcastBatchIn(BaseModel):
+    items: list[TxBroadcastIn]
+
+
+class TxBroadcastItemOut(BaseModel):
+    index: int
+    network: str
+    tx_hash: str | None = None
+    status: str | None = None
+    # Текст ошибки, если именно эта транзакция не отправлена
+    error: str | None = None
+
+
+class TxBroadcastBatchOut(BaseModel):
+    results: list[TxBroadcastItemOut]
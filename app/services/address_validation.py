@@ -0,0 +1,306 @@
+"""Проверка адресов кошельков с разбором контрольных сумм.
+
+- BTC / LTC: base58check (версии P2PKH/P2SH) или bech32/bech32m (BIP-173/350);
+- ETH / USDT_ERC20 / BNB: 20 байт в hex, для адресов в смешанном регистре — EIP-55;
+- TRX / USDT_TRC20: base58check с версией 0x41;
+- TON: user-friendly (base64/base64url, CRC16-XMODEM) или raw `wc:hex`.
+
+Результат — пара (is_valid, reason), где reason — машинный код причины.
+Сеть сопоставляется с форматом через справочник сетей; сама проверка —
+чистая функция, поэтому повторные адреса обслуживаются из LRU-кэша.
+"""
+import base64
+import hashlib
+from functools import lru_cache
+
+from app.core.config import settings
+from app.services.network_registry import network_registry
+
+# Нативный keccak, если установлен (pycryptodome или pysha3): чистый Python
+# ниже ~1 мс на адрес и держит GIL, пакет адресов останавливает воркер
+try:
+    from Crypto.Hash import keccak as _crypto_keccak
+except ImportError:  # pragma: no cover - зависит от окружения
+    _crypto_keccak = None
+try:
+    import sha3 as _pysha3
+except ImportError:  # pragma: no cover - зависит от окружения
+    _pysha3 = None
+
+# --- base58check ---------------------------------------------------------
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(_B58_ALPHABET)}
+
+
+def _b58decode_check(s: str) -> bytes | None:
+    """Декодировать base58check. None — если символы или checksum неверны."""
+    num = 0
+    for ch in s:
+        idx = _B58_INDEX.get(ch)
+        if idx is None:
+            return None
+        num = num * 58 + idx
+    raw = num.to_bytes((num.bit_length() + 7) // 8, "big")
+    pad = len(s) - len(s.lstrip("1"))
+    raw = b"\x00" * pad + raw
+    if len(raw) < 5:
+        return None
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        return None
+    return payload
+
+
+# --- bech32 / bech32m (BIP-173, BIP-350) ---------------------------------
+
+_BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_BECH32_CONST = 1
+_BECH32M_CONST = 0x2BC830A3
+
+
+def _bech32_polymod(values: list[int]) -> int:
+    gen = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+    chk = 1
+    for v in values:
+        top = chk >> 25
+        chk = (chk & 0x1FFFFFF) << 5 ^ v
+        for i in range(5):
+            chk ^= gen[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def _bech32_hrp_expand(hrp: str) -> list[int]:
+    return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+
+
+def _convertbits(data: list[int], frombits: int, tobits: int) -> list[int] | None:
+    acc = 0
+    bits = 0
+    ret = []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            ret.append((acc >> bits) & maxv)
+    if bits >= frombits or ((acc << (tobits - bits)) & maxv):
+        return None
+    return ret
+
+
+def _segwit_reason(hrp: str, addr: str) -> str | None:
+    """None — если addr корректный segwit-адрес с данным hrp, иначе код причины."""
+    if addr.lower() != addr and addr.upper() != addr:
+        return "mixed_case"
+    addr = addr.lower()
+    pos = addr.rfind("1")
+    if pos < 1 or pos + 7 > len(addr) or len(addr) > 90:
+        return "invalid_format"
+    if addr[:pos] != hrp:
+        return "invalid_prefix"
+    data = []
+    for ch in addr[pos + 1:]:
+        idx = _BECH32_CHARSET.find(ch)
+        if idx < 0:
+            return "invalid_character"
+        data.append(idx)
+
+    const = _bech32_polymod(_bech32_hrp_expand(hrp) + data)
+    if const not in (_BECH32_CONST, _BECH32M_CONST):
+        return "invalid_checksum"
+    witver = data[0]
+    program = _convertbits(data[1:-6], 5, 8)
+    if program is None or witver > 16 or not 2 <= len(program) <= 40:
+        return "invalid_length"
+    if witver == 0 and len(program) not in (20, 32):
+        return "invalid_length"
+    # v0 — bech32, v1+ — bech32m
+    if (witver == 0) != (const == _BECH32_CONST):
+        return "invalid_checksum"
+    return None
+
+
+# --- keccak-256 (для EIP-55; hashlib.sha3_256 — это другой паддинг) ------
+
+_KECCAK_RC = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_KECCAK_ROT = [
+    [0, 36, 3, 41, 18], [1, 44, 10, 45, 2], [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56], [27, 20, 39, 8, 14],
+]
+_MASK64 = (1 << 64) - 1
+
+
+def _rol(x: int, n: int) -> int:
+    return ((x << n) | (x >> (64 - n))) & _MASK64 if n else x
+
+
+def _keccak_f(state: list[list[int]]) -> None:
+    for rc in _KECCAK_RC:
+        c = [state[x][0] ^ state[x][1] ^ state[x][2] ^ state[x][3] ^ state[x][4] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rol(c[(x + 1) % 5], 1) for x in range(5)]
+        for x in range(5):
+            for y in range(5):
+                state[x][y] ^= d[x]
+        b = [[0] * 5 for _ in range(5)]
+        for x in range(5):
+            for y in range(5):
+                b[y][(2 * x + 3 * y) % 5] = _rol(state[x][y], _KECCAK_ROT[x][y])
+        for x in range(5):
+            for y in range(5):
+                state[x][y] = b[x][y] ^ ((~b[(x + 1) % 5][y]) & b[(x + 2) % 5][y])
+        state[0][0] ^= rc
+
+
+def _keccak256_py(data: bytes) -> bytes:
+    rate = 136
+    padded = bytearray(data) + b"\x01" + b"\x00" * ((rate - (len(data) + 1) % rate) % rate)
+    padded[-1] |= 0x80
+    state = [[0] * 5 for _ in range(5)]
+    for off in range(0, len(padded), rate):
+        block = padded[off:off + rate]
+        for i in range(rate // 8):
+            state[i % 5][i // 5] ^= int.from_bytes(block[8 * i:8 * i + 8], "little")
+        _keccak_f(state)
+    out = b"".join(state[i % 5][i // 5].to_bytes(8, "little") for i in range(4))
+    return out
+
+
+def keccak256(data: bytes) -> bytes:
+    if _crypto_keccak is not None:
+        return _crypto_keccak.new(digest_bits=256, data=data).digest()
+    if _pysha3 is not None:
+        return _pysha3.keccak_256(data).digest()
+    return _keccak256_py(data)
+
+
+# --- CRC16-XMODEM (TON) --------------------------------------------------
+
+def _crc16_xmodem(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+# --- валидаторы по сетям -------------------------------------------------
+
+def _validate_base58_versions(addr: str, versions: set[int]) -> str | None:
+    if len(addr) > 64:
+        return "invalid_length"
+    payload = _b58decode_check(addr)
+    if payload is None:
+        return "invalid_checksum" if all(c in _B58_INDEX for c in addr) else "invalid_character"
+    if len(payload) != 21:
+        return "invalid_length"
+    if payload[0] not in versions:
+        return "invalid_version"
+    return None
+
+
+def _validate_btc(addr: str) -> str | None:
+    if addr[:3].lower() == "bc1":
+        return _segwit_reason("bc", addr)
+    return _validate_base58_versions(addr, {0x00, 0x05})
+
+
+def _validate_ltc(addr: str) -> str | None:
+    if addr[:4].lower() == "ltc1":
+        return _segwit_reason("ltc", addr)
+    # L... (P2PKH), M... (P2SH), 3... (устаревший P2SH)
+    return _validate_base58_versions(addr, {0x30, 0x32, 0x05})
+
+
+def _validate_evm(addr: str) -> str | None:
+    if not addr.startswith("0x") or len(addr) != 42:
+        return "invalid_format"
+    body = addr[2:]
+    try:
+        bytes.fromhex(body)
+    except ValueError:
+        return "invalid_character"
+    if body.islower() or body.isupper():
+        # Адрес без checksum в регистре (все строчные/прописные) допустим
+        return None
+    digest = keccak256(body.lower().encode()).hex()
+    for ch, h in zip(body, digest):
+        if ch.isalpha() and ch.isupper() != (int(h, 16) >= 8):
+            return "invalid_checksum"
+    return None
+
+
+def _validate_tron(addr: str) -> str | None:
+    if not addr.startswith("T") or len(addr) != 34:
+        return "invalid_format"
+    return _validate_base58_versions(addr, {0x41})
+
+
+def _validate_ton(addr: str) -> str | None:
+    if ":" in addr:
+        wc, _, account = addr.partition(":")
+        if wc not in {"0", "-1"} or len(account) != 64:
+            return "invalid_format"
+        try:
+            bytes.fromhex(account)
+        except ValueError:
+            return "invalid_character"
+        return None
+
+    if len(addr) != 48:
+        return "invalid_length"
+    try:
+        raw = base64.b64decode(addr.replace("+", "-").replace("/", "_"), altchars=b"-_", validate=True)
+    except ValueError:
+        return "invalid_character"
+    if len(raw) != 36:
+        return "invalid_length"
+    # 0x11 — bounceable, 0x51 — non-bounceable, +0x80 — testnet
+    if raw[0] & 0x7F not in (0x11, 0x51):
+        return "invalid_version"
+    if raw[1] not in (0x00, 0xFF):
+        return "invalid_workchain"
+    if _crc16_xmodem(raw[:34]) != int.from_bytes(raw[34:], "big"):
+        return "invalid_checksum"
+    return None
+
+
+# Формат адреса определяется сетью-носителем (Network.chain), поэтому
+# токены (USDT_ERC20, USDT_TRC20, ...) проверяются как адреса своей сети.
+VALIDATORS = {
+    "bitcoin": _validate_btc,
+    "litecoin": _validate_ltc,
+    "ethereum": _validate_evm,
+    "bsc": _validate_evm,
+    "tron": _validate_tron,
+    "ton": _validate_ton,
+}
+
+
+@lru_cache(maxsize=settings.ADDRESS_CACHE_SIZE)
+def _validate_for_chain(chain: str, address: str) -> tuple[bool, str | None]:
+    validator = VALIDATORS.get(chain)
+    if validator is None:
+        return False, "unsupported_network"
+    if not address:
+        return False, "empty"
+    reason = validator(address)
+    return reason is None, reason
+
+
+def validate_address(network: str, address: str) -> tuple[bool, str | None]:
+    """Проверить адрес: (is_valid, reason). Ожидает нормализованные network/address."""
+    info = network_registry.get(network)
+    if info is None or not info.chain:
+        return False, "unsupported_network"
+    return _validate_for_chain(info.chain, address)
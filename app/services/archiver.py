@@ -0,0 +1,137 @@
+"""Перенос старых терминальных строк в архивные таблицы.
+
+Завершённые и отменённые P2P-ордера, подтверждённые и упавшие транзакции,
+которые не менялись дольше ARCHIVE_AFTER_DAYS, переезжают в
+p2p_orders_archive / transactions_archive. Каждая пачка — одна транзакция
+(INSERT ... SELECT + DELETE по тем же id), поэтому прерванный проход
+ничего не теряет и не дублирует: следующий просто продолжит с оставшихся
+строк. На Postgres пачка берётся через FOR UPDATE SKIP LOCKED, и
+архиваторы нескольких хостов не мешают друг другу; из воркеров одного
+хоста проход за интервал делает один (shared_cache.periodic).
+
+Однократный прогон (например, из cron при ARCHIVE_ENABLED=false):
+
+    python -m app.services.archiver
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import Table, literal, select
+
+from app import models
+from app.core.config import settings
+from app.db import engine
+from app.services.metrics import Counter, registry
+from app.services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+archived_rows = registry.register(Counter("archived_rows_total", "Строки, перенесённые в архив", ("table",)))
+
+# Горячая таблица, её архив и терминальные статусы
+ARCHIVES: list[tuple[Table, Table, tuple[str, ...]]] = [
+    (models.P2POrder.__table__, models.p2p_orders_archive, ("completed", "cancelled")),
+    (models.Transaction.__table__, models.transactions_archive, ("confirmed", "failed")),
+]
+
+
+def _archive_batch(hot: Table, archive: Table, statuses: tuple[str, ...], cutoff: datetime, limit: int) -> int:
+    with engine.begin() as conn:
+        ids = conn.scalars(
+            select(hot.c.id)
+            .where(hot.c.status.in_(statuses), hot.c.updated_at < cutoff)
+            .order_by(hot.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            return 0
+        names = [c.name for c in hot.columns]
+        conn.execute(
+            archive.insert().from_select(
+                names + ["archived_at"],
+                select(*hot.c, literal(datetime.utcnow(), archive.c.archived_at.type)).where(hot.c.id.in_(ids)),
+            )
+        )
+        conn.execute(hot.delete().where(hot.c.id.in_(ids)))
+    return len(ids)
+
+
+class Archiver:
+    def __init__(
+        self,
+        after_days: float,
+        batch_size: int = 1000,
+        batch_pause_seconds: float = 0.05,
+        interval_seconds: float = 3600.0,
+    ):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+        self.interval_seconds = interval_seconds
+        self._task: asyncio.Task | None = None
+
+    async def archive_table(self, hot: Table, archive: Table, statuses: tuple[str, ...]) -> int:
+        """Перенести все подходящие строки таблицы, вернуть их число."""
+        cutoff = datetime.utcnow() - timedelta(days=self.after_days)
+        moved = 0
+        while True:
+            count = await asyncio.to_thread(_archive_batch, hot, archive, statuses, cutoff, self.batch_size)
+            archived_rows.inc(hot.name, amount=count)
+            moved += count
+            if count < self.batch_size:
+                break
+            # Даём пройти запросам API между пачками
+            await asyncio.sleep(self.batch_pause_seconds)
+        return moved
+
+    async def run_once(self) -> dict[str, int]:
+        moved = {}
+        for hot, archive, statuses in ARCHIVES:
+            try:
+                moved[hot.name] = await self.archive_table(hot, archive, statuses)
+            except Exception:
+                logger.exception("Ошибка архивации %s", hot.name)
+        return moved
+
+    async def _run_forever(self) -> None:
+        while True:
+            wait = self.interval_seconds
+            try:
+                async with shared_cache.periodic("archive", self.interval_seconds) as wait:
+                    if not wait:
+                        moved = await self.run_once()
+                        if any(moved.values()):
+                            logger.info("Перенесено в архив: %s", moved)
+            except Exception:
+                logger.exception("Ошибка прохода архивации")
+            await asyncio.sleep(wait or self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+archiver = Archiver(
+    after_days=settings.ARCHIVE_AFTER_DAYS,
+    batch_size=settings.ARCHIVE_BATCH_SIZE,
+    batch_pause_seconds=settings.ARCHIVE_BATCH_PAUSE_SECONDS,
+    interval_seconds=settings.ARCHIVE_INTERVAL_SECONDS,
+)
+
+
+if __name__ == "__main__":
+    print(asyncio.run(archiver.run_once()))
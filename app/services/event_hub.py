@@ -0,0 +1,217 @@
+"""Раздача событий подписчикам WebSocket/SSE во всех воркерах хоста.
+
+Темы:
+- `book:{CRYPTO}:{FIAT}` — изменения ордеров пары;
+- `user:{id}`            — ордера, где пользователь мейкер или тейкер;
+- `tx:{NETWORK}:{hash}`  — смена статуса транзакции.
+
+Событие сериализуется в JSON один раз и уходит через shared_cache: в
+своём воркере доставляется сразу, в соседних — из журнала инвалидаций
+(ордер создан в одном воркере, а клиент подключён к другому; статусы
+транзакций сверяет один воркер хоста). По подписчикам раскладывается
+без await: каждому — append в его deque и set() его asyncio.Event.
+Простаивающее соединение — это одна корутина, ждущая свой Event; таймер
+heartbeat на весь хаб один, а не по одному на соединение.
+
+Медленный клиент, у которого накопилось больше `queue_size` событий,
+отключается (флаг overflowed), чтобы не держать память и не тормозить
+раздачу остальным. Публиковать можно из любого потока: sync-эндпоинты
+работают в threadpool, поэтому доставка переносится в event loop через
+call_soon_threadsafe.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Any
+
+from app.core.config import settings
+from app.services.metrics import Counter, Gauge, registry
+from app.services.shared_cache import shared_cache
+
+HEARTBEAT = object()
+# Канал shared_cache, по которому события расходятся по воркерам
+SHARED_CHANNEL = "stream"
+
+stream_connections = registry.register(Gauge("stream_connections", "Открытые WebSocket/SSE подписки"))
+stream_events = registry.register(Counter("stream_events_total", "Опубликованные события", ("kind",)))
+stream_dropped = registry.register(
+    Counter("stream_slow_consumers_total", "Подписчики, отключённые из-за переполнения очереди")
+)
+
+
+def book_topic(crypto_currency: str, fiat_currency: str) -> str:
+    return f"book:{crypto_currency.upper()}:{fiat_currency.upper()}"
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def tx_topic(network: str, tx_hash: str) -> str:
+    return f"tx:{network.upper()}:{tx_hash}"
+
+
+class Subscription:
+    __slots__ = ("hub", "topics", "queue_size", "_pending", "_wakeup", "overflowed", "closed")
+
+    def __init__(self, hub: "EventHub", queue_size: int):
+        self.hub = hub
+        self.topics: set[str] = set()
+        self.queue_size = queue_size
+        self._pending: deque = deque()
+        self._wakeup = asyncio.Event()
+        self.overflowed = False
+        self.closed = False
+
+    def push(self, message: Any) -> None:
+        if self.overflowed or self.closed:
+            return
+        if message is not HEARTBEAT and len(self._pending) >= self.queue_size:
+            self.overflowed = True
+            stream_dropped.inc()
+        elif message is HEARTBEAT and self._pending:
+            # Есть и так что отправить — heartbeat не нужен
+            return
+        else:
+            self._pending.append(message)
+        self._wakeup.set()
+
+    async def next_batch(self) -> list[Any]:
+        """Дождаться событий; [] — подписка закрыта или переполнена."""
+        while not self._pending and not (self.overflowed or self.closed):
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        if self.overflowed or self.closed:
+            return []
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+
+    def subscribe(self, *topics: str) -> None:
+        new = [t for t in topics if t not in self.topics]
+        if len(self.topics) + len(new) > self.hub.max_topics:
+            raise ValueError(f"Не больше {self.hub.max_topics} тем на подписку")
+        for topic in new:
+            self.topics.add(topic)
+            self.hub._topics[topic].add(self)
+
+    def unsubscribe(self, *topics: str) -> None:
+        for topic in topics:
+            if topic in self.topics:
+                self.topics.discard(topic)
+                self.hub._drop(topic, self)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.unsubscribe(*list(self.topics))
+        self.hub._subscriptions.discard(self)
+        stream_connections.dec()
+        self._wakeup.set()
+
+
+class EventHub:
+    def __init__(self, queue_size: int = 100, max_topics: int = 50, heartbeat_seconds: float = 25.0):
+        self.queue_size = queue_size
+        self.max_topics = max_topics
+        self.heartbeat_seconds = heartbeat_seconds
+        self._topics: dict[str, set[Subscription]] = defaultdict(set)
+        self._subscriptions: set[Subscription] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+
+    def _drop(self, topic: str, sub: Subscription) -> None:
+        subs = self._topics.get(topic)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._topics[topic]
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self) -> None:
+        for sub in list(self._subscriptions):
+            sub.close()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        self._heartbeat_task = None
+        self._loop = None
+        self._loop_thread = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            for sub in list(self._subscriptions):
+                sub.push(HEARTBEAT)
+
+    def subscription(self) -> Subscription:
+        sub = Subscription(self, self.queue_size)
+        self._subscriptions.add(sub)
+        stream_connections.inc()
+        return sub
+
+    def _fanout(self, topics: tuple[str, ...], message: str) -> None:
+        if len(topics) == 1:
+            for sub in tuple(self._topics.get(topics[0], ())):
+                sub.push(message)
+            return
+        seen: set[Subscription] = set()
+        for topic in topics:
+            for sub in self._topics.get(topic, ()):
+                # Подписчик на несколько тем события получает событие один раз
+                if sub not in seen:
+                    seen.add(sub)
+                    sub.push(message)
+
+    def publish(self, topics: tuple[str, ...] | list[str], event: dict[str, Any]) -> None:
+        """Отправить событие подписчикам тем во всех воркерах. Безопасно из любого потока."""
+        stream_events.inc(str(event.get("type", "")))
+        message = json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str)
+        shared_cache.publish(SHARED_CHANNEL, {"topics": list(topics), "message": message})
+
+    def deliver(self, payload: dict[str, Any]) -> None:
+        """Разложить событие из shared_cache по подписчикам этого воркера."""
+        loop = self._loop
+        if loop is None:
+            # Хаб не запущен (скрипты, консоль) — подписчиков всё равно нет
+            return
+        topics, message = tuple(payload["topics"]), payload["message"]
+        if threading.get_ident() == self._loop_thread:
+            self._fanout(topics, message)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._fanout, topics, message)
+            except RuntimeError:
+                # loop уже закрыт (останов процесса)
+                pass
+
+    def stats(self) -> dict[str, int]:
+        return {"subscriptions": len(self._subscriptions), "topics": len(self._topics)}
+
+
+event_hub = EventHub(
+    queue_size=settings.STREAM_QUEUE_SIZE,
+    max_topics=settings.STREAM_MAX_TOPICS,
+    heartbeat_seconds=settings.STREAM_HEARTBEAT_SECONDS,
+)
+shared_cache.subscribe(SHARED_CHANNEL, event_hub.deliver)
+
+
+def publish_tx_status(network: str, tx_hash: str, status: str) -> None:
+    event_hub.publish(
+        [tx_topic(network, tx_hash)],
+        {"type": "tx", "network": network.upper(), "tx_hash": tx_hash, "status": status},
+    )
@@ -0,0 +1,57 @@
+"""Быстрая отдача списков: строки БД сразу в JSON, без Pydantic.
+
+Списочные эндпоинты выбирают кортежи колонок в порядке полей схемы
+ответа и кодируют их одним вызовом orjson. response_model у роута
+остаётся прежним (схема OpenAPI та же), но FastAPI не проверяет и не
+сериализует ответ: эндпоинт возвращает готовый Response. Поэтому
+колонки должны совпадать с полями схемы — см. columns_for().
+
+orjson — в requirements.txt; стандартный json остаётся запасным путём на
+случай окружения без него (тот же результат, только медленнее).
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Iterable, Mapping, Sequence
+
+from pydantic import BaseModel
+from sqlalchemy import Column
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson в requirements, это страховка
+    orjson = None
+
+
+def columns_for(model: type[BaseModel], columns: Mapping[str, Column]) -> list[Column]:
+    """Колонки таблицы/подзапроса под поля схемы ответа, в том же порядке."""
+    return [columns[name] for name in model.model_fields]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+def dumps_rows(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    items = [dict(zip(keys, row)) for row in rows]
+    if orjson is not None:
+        return orjson.dumps(items)
+    return json.dumps(items, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RowsResponse(Response):
+    """JSON-массив объектов из кортежей `rows` с ключами `keys`."""
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        rows: Iterable[Sequence[Any]],
+        headers: Mapping[str, str] | None = None,
+    ):
+        super().__init__(dumps_rows(keys, rows), headers=headers)
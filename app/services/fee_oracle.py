@@ -0,0 +1,206 @@
+"""Оракул комиссий: рекомендованные комиссии сетей из Tatum в памяти.
+
+Фоновый refresher на каждую сеть из FEES_TTL_SECONDS держит свежую
+котировку (slow/medium/fast в единицах Tatum) и обновляет её заранее,
+до истечения TTL сети. При нескольких воркерах в Tatum за сетью ходит
+один из них, остальные берут котировку из shared_cache.
+
+Оценка комиссии — только чтение из памяти: котировка × типичный размер
+транзакции (networks.tx_units) → сумма в монете, которой платится комиссия
+(для токенов — монета родительской сети).
+
+Если котировки нет (Tatum не настроен, сеть без fee-эндпоинта или без
+tx_units) или она старше TTL + FEES_STALE_SECONDS, отдаём статичную
+base_fee из справочника сетей с source="static" — в той же монете.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from app.core.config import settings
+from app.services import tatum_client
+from app.services.network_registry import network_registry
+from app.services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Для сетей без base_fee в справочнике
+DEFAULT_BASE_FEE = 0.001
+
+# Перевод единиц Tatum в монету: сатоши и wei
+UNIT_SCALE: dict[str, float] = {
+    "bitcoin": 1e-8,
+    "litecoin": 1e-8,
+    "ethereum": 1e-18,
+    "bsc": 1e-18,
+}
+
+
+@dataclass(frozen=True)
+class FeeQuote:
+    slow: float
+    medium: float
+    fast: float
+    fetched_at: float
+
+
+@dataclass(frozen=True)
+class FeeEstimate:
+    network: str
+    fee_currency: str
+    slow: float
+    normal: float
+    fast: float
+    # tatum | static
+    source: str
+    age_seconds: float | None
+
+
+class FeeOracle:
+    def __init__(self, ttls: dict[str, float], stale_seconds: float = 300, refresh_ahead_seconds: float = 2):
+        self.ttls = ttls
+        self.stale = stale_seconds
+        self.refresh_ahead = refresh_ahead_seconds
+        self._quotes: dict[str, FeeQuote] = {}
+        self._refreshers: dict[str, asyncio.Task] = {}
+
+        self.refresh_ok = 0
+        self.refresh_errors = 0
+        # Котировки, взятые из общего кэша (их получил другой воркер)
+        self.shared_adopted = 0
+        self.served_live = 0
+        self.served_static = 0
+
+    async def _adopt_shared(self, chain: str) -> bool:
+        """Взять котировку, которую уже получил другой воркер."""
+        item = (await shared_cache.get_many([f"fees:{chain}"])).get(f"fees:{chain}")
+        if item is None:
+            return False
+        slow, medium, fast, fetched_at = item
+        age = max(time.time() - fetched_at, 0.0)
+        # Котировку, которую и так пора обновлять, не берём
+        if age >= self.ttls[chain] - self.refresh_ahead:
+            return False
+        self._quotes[chain] = FeeQuote(slow, medium, fast, time.monotonic() - age)
+        self.shared_adopted += 1
+        return True
+
+    async def _fetch(self, chain: str) -> None:
+        try:
+            tiers = await tatum_client.get_blockchain_fees(chain)
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        self._quotes[chain] = FeeQuote(tiers["slow"], tiers["medium"], tiers["fast"], time.monotonic())
+        self.refresh_ok += 1
+        await shared_cache.set_many(
+            {f"fees:{chain}": [tiers["slow"], tiers["medium"], tiers["fast"], time.time()]},
+            ttl_seconds=self.ttls[chain] + self.stale,
+        )
+
+    async def refresh(self, chain: str) -> FeeQuote:
+        # Из воркеров хоста в Tatum идёт один, остальные берут его котировку
+        await shared_cache.refresh(f"fees:{chain}", lambda: self._adopt_shared(chain), lambda: self._fetch(chain))
+        return self._quotes[chain]
+
+    def _age(self, chain: str) -> float | None:
+        quote = self._quotes.get(chain)
+        if quote is None:
+            return None
+        return time.monotonic() - quote.fetched_at
+
+    async def _run_refresher(self, chain: str) -> None:
+        ttl = self.ttls[chain]
+        while True:
+            age = self._age(chain)
+            delay = 0.0 if age is None else max(ttl - self.refresh_ahead - age, 0.0)
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh(chain)
+            except Exception as exc:
+                logger.warning("Не удалось обновить комиссии %s: %s", chain, exc)
+                # Не долбим Tatum в цикле при ошибке
+                await asyncio.sleep(max(self.refresh_ahead, 1.0))
+
+    def start(self) -> None:
+        if not settings.tatum_api_key:
+            return
+        for chain in self.ttls:
+            if chain not in tatum_client.FEE_SYMBOLS:
+                logger.warning("Для сети %s у Tatum нет комиссий, используем base_fee", chain)
+                continue
+            task = self._refreshers.get(chain)
+            if task is None or task.done():
+                self._refreshers[chain] = asyncio.create_task(self._run_refresher(chain))
+
+    async def stop(self) -> None:
+        for task in self._refreshers.values():
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._refreshers.clear()
+
+    def _fee_currency(self, info) -> str:
+        if info.is_token and info.parent_chain:
+            parent = network_registry.get(info.parent_chain)
+            if parent is not None:
+                return parent.native_symbol
+        return info.native_symbol
+
+    def estimate(self, network: str) -> FeeEstimate:
+        """Оценка комиссии сети без обращения к Tatum (только память)."""
+        net = network.upper()
+        info = network_registry.get(net)
+        if info is not None and info.tx_units and info.chain in UNIT_SCALE:
+            quote = self._quotes.get(info.chain)
+            age = self._age(info.chain)
+            ttl = self.ttls.get(info.chain)
+            if quote is not None and ttl is not None and age < ttl + self.stale:
+                scale = info.tx_units * UNIT_SCALE[info.chain]
+                self.served_live += 1
+                return FeeEstimate(
+                    network=net,
+                    fee_currency=self._fee_currency(info),
+                    slow=quote.slow * scale,
+                    normal=quote.medium * scale,
+                    fast=quote.fast * scale,
+                    source="tatum",
+                    age_seconds=round(age, 3),
+                )
+
+        # Статичная комиссия — в той же монете, что и живая (для USDT_ERC20 — ETH)
+        self.served_static += 1
+        base_fee = info.base_fee if info is not None and info.base_fee is not None else DEFAULT_BASE_FEE
+        return FeeEstimate(
+            network=net,
+            fee_currency=self._fee_currency(info) if info is not None else net,
+            slow=base_fee,
+            normal=base_fee,
+            fast=base_fee,
+            source="static",
+            age_seconds=None,
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "refresh_ok": self.refresh_ok,
+            "refresh_errors": self.refresh_errors,
+            "shared_adopted": self.shared_adopted,
+            "served_live": self.served_live,
+            "served_static": self.served_static,
+            "age_seconds": {chain: self._age(chain) for chain in self.ttls},
+        }
+
+
+fee_oracle = FeeOracle(
+    ttls=settings.FEES_TTL_SECONDS,
+    stale_seconds=settings.FEES_STALE_SECONDS,
+    refresh_ahead_seconds=settings.FEES_REFRESH_AHEAD_SECONDS,
+)
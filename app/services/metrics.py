@@ -0,0 +1,287 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Счётчики, gauge и гистограммы с метками; запись — это пара обращений
+к словарю и bisect по границам бакетов под локом, т.е. единицы микросекунд.
+Значения, которые уже считаются в других сервисах (кэши, пул Tatum),
+подтягиваются в момент скрейпа через register_collector().
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def expose(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def expose(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count по бакетам (+Inf последним), sum, count]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def expose(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """collector() возвращает готовые строки экспозиции на момент скрейпа."""
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(
+    Histogram("http_request_duration_seconds", "Латентность HTTP-запросов", ("method", "route", "status"))
+)
+http_in_flight = registry.register(Gauge("http_requests_in_flight", "Запросы в обработке", ("method",)))
+db_queries_per_request = registry.register(
+    Histogram("db_queries_per_request", "Число SQL-запросов на HTTP-запрос", ("route",), buckets=COUNT_BUCKETS)
+)
+db_time_per_request = registry.register(
+    Histogram("db_time_per_request_seconds", "Суммарное время SQL на HTTP-запрос", ("route",))
+)
+db_query_seconds = registry.register(Histogram("db_query_duration_seconds", "Латентность SQL-запросов"))
+cache_lookup_seconds = registry.register(
+    Histogram(
+        "cache_lookup_duration_seconds",
+        "Время обращения к кэшу (включая ожидание обновления)",
+        ("cache", "result"),
+    )
+)
+outbound_seconds = registry.register(
+    Histogram(
+        "outbound_request_duration_seconds",
+        "Латентность исходящих вызовов",
+        ("service", "chain", "endpoint", "outcome"),
+    )
+)
+
+
+# --- учёт SQL в пределах HTTP-запроса -----------------------------------
+
+@dataclass
+class RequestDbStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+current_db_stats: ContextVar[RequestDbStats | None] = ContextVar("current_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("query_start")
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    db_query_seconds.observe(value=elapsed)
+    stats = current_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine) -> None:
+    """Повесить хуки на Engine (для AsyncEngine — на его sync_engine)."""
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- исходящие вызовы ---------------------------------------------------
+
+class track_outbound:
+    """Контекстный менеджер: время исходящего вызова с меткой outcome.
+
+    outcome по умолчанию 'ok', при исключении — 'error'; можно выставить
+    вручную (например, по HTTP-статусу) через атрибут .outcome.
+    """
+
+    __slots__ = ("service", "chain", "endpoint", "outcome", "_started")
+
+    def __init__(self, service: str, chain: str, endpoint: str):
+        self.service = service
+        self.chain = chain
+        self.endpoint = endpoint
+        self.outcome = "ok"
+
+    def __enter__(self) -> "track_outbound":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = "error"
+        outbound_seconds.observe(
+            self.service, self.chain, self.endpoint, self.outcome,
+            value=time.perf_counter() - self._started,
+        )
+
+
+# --- ASGI middleware ----------------------------------------------------
+
+class MetricsMiddleware:
+    """Чистый ASGI-middleware (без BaseHTTPMiddleware — он заметно дороже)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        stats = RequestDbStats()
+        token = current_db_stats.set(stats)
+        http_in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec(method)
+            current_db_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(method, path, str(status_holder[0]), value=elapsed)
+            db_queries_per_request.observe(path, value=stats.queries)
+            db_time_per_request.observe(path, value=stats.seconds)
+
+
+def gauge_lines(name: str, documentation: str, values: dict[str, float], label: str = "key") -> list[str]:
+    """Строки экспозиции для gauge из словаря (для register_collector)."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f'{name}{{{label}="{_escape(str(key))}"}} {value}')
+    return lines
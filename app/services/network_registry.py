@@ -0,0 +1,151 @@
+"""Справочник сетей в памяти процесса.
+
+Таблица networks — статичные данные, которые засевает init_db.py, поэтому
+читаем её один раз при старте и отдаём неизменяемый снимок: проверка
+кода сети, имя сети в Tatum, базовая комиссия и формат адреса берутся
+отсюда без запросов к БД. Тело GET /networks и его ETag тоже считаются
+при загрузке.
+
+Перечитать справочник без рестарта — SIGHUP процессу (или reload()).
+Новый снимок подменяет старый одной операцией присваивания, так что
+читатели видят либо старый, либо новый справочник целиком.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import signal
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app import models
+from app.db import SessionLocal
+from app.schemas.network import NetworkOut
+
+logger = logging.getLogger(__name__)
+
+_networks_json = TypeAdapter(list[NetworkOut])
+
+
+@dataclass(frozen=True)
+class NetworkInfo:
+    code: str
+    name: str
+    native_symbol: str
+    is_token: bool
+    parent_chain: str | None
+    chain: str | None
+    base_fee: float | None
+    reconcile_interval: float | None
+    tx_units: float | None
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    by_code: Mapping[str, NetworkInfo]
+    # Предсериализованный ответ GET /networks и его ETag
+    body: bytes
+    etag: str
+
+
+def _build_snapshot(rows: list[NetworkInfo]) -> _Snapshot:
+    body = _networks_json.dump_json([NetworkOut.model_validate(n, from_attributes=True) for n in rows])
+    return _Snapshot(
+        by_code=MappingProxyType({n.code: n for n in rows}),
+        body=body,
+        etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+    )
+
+
+def _load_rows() -> list[NetworkInfo]:
+    db = SessionLocal()
+    try:
+        nets = db.scalars(select(models.Network).order_by(models.Network.id)).all()
+        return [
+            NetworkInfo(
+                code=n.code.upper(),
+                name=n.name,
+                native_symbol=n.native_symbol,
+                is_token=bool(n.is_token),
+                parent_chain=n.parent_chain,
+                chain=n.chain,
+                base_fee=n.base_fee,
+                reconcile_interval=n.reconcile_interval,
+                tx_units=n.tx_units,
+            )
+            for n in nets
+        ]
+    finally:
+        db.close()
+
+
+class NetworkRegistry:
+    def __init__(self):
+        self._snapshot: _Snapshot | None = None
+        self._load_lock = threading.Lock()
+
+    def load(self) -> None:
+        """Прочитать справочник из БД (синхронно; из async-кода — через to_thread)."""
+        with self._load_lock:
+            self._snapshot = _build_snapshot(_load_rows())
+        logger.info("Справочник сетей загружен: %s", ", ".join(self._snapshot.by_code))
+
+    async def reload(self) -> None:
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception:
+            # Остаёмся на предыдущем снимке
+            logger.exception("Не удалось перечитать справочник сетей")
+
+    def install_reload_signal(self, sig: int = getattr(signal, "SIGHUP", 0)) -> bool:
+        """Перечитывать справочник по сигналу (по умолчанию SIGHUP)."""
+        if not sig:
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(sig, lambda: loop.create_task(self.reload()))
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Windows или не главный поток (например, TestClient)
+            return False
+        return True
+
+    def remove_reload_signal(self, sig: int = getattr(signal, "SIGHUP", 0)) -> None:
+        if sig:
+            try:
+                asyncio.get_running_loop().remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+
+    @property
+    def snapshot(self) -> _Snapshot:
+        snap = self._snapshot
+        if snap is None:
+            # Скрипты и консоль без lifespan: загружаем при первом обращении
+            self.load()
+            snap = self._snapshot
+        return snap
+
+    def get(self, code: str) -> NetworkInfo | None:
+        return self.snapshot.by_code.get(code.upper())
+
+    def __contains__(self, code: str) -> bool:
+        return code.upper() in self.snapshot.by_code
+
+    def all(self) -> tuple[NetworkInfo, ...]:
+        return tuple(self.snapshot.by_code.values())
+
+    def chain(self, code: str) -> str:
+        """Имя сети в Tatum; ValueError, если сеть неизвестна или не поддерживается."""
+        info = self.get(code)
+        if info is None or not info.chain:
+            raise ValueError(f"Unsupported network for Tatum: {code}")
+        return info.chain
+
+
+network_registry = NetworkRegistry()
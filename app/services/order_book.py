@@ -0,0 +1,250 @@
+"""In-memory стакан P2P-ордеров с приоритетом цена-время.
+
+Стаканы ведутся по ключу (crypto_currency, fiat_currency, side): в каждом
+отсортированный список ценовых уровней, на уровне — FIFO-очередь ордеров.
+Книга собирается из БД при старте и обновляется из мутаций в app/api/p2p.py,
+поэтому чтения (лучшая цена, глубина, подбор ордеров под сумму) не ходят в БД.
+
+Книга своя у каждого процесса, а изменения (sync/remove) расходятся через
+shared_cache: воркер, сделавший мутацию, применяет её сразу, остальные —
+из журнала (не позже CACHE_POLL_SECONDS при CACHE_BACKEND=shm).
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterator
+
+from app import models
+from app.db import SessionLocal
+from app.services.shared_cache import shared_cache
+
+BookKey = tuple[str, str, str]
+
+# Канал shared_cache с изменениями книги
+SHARED_CHANNEL = "order_book"
+
+
+@dataclass
+class BookOrder:
+    id: int
+    maker_id: int
+    amount: float
+    price: float
+
+
+class PriceLevel:
+    __slots__ = ("price", "orders", "amount")
+
+    def __init__(self, price: float):
+        self.price = price
+        self.orders: OrderedDict[int, BookOrder] = OrderedDict()
+        self.amount = 0.0
+
+
+class BookSide:
+    """Одна сторона стакана. Для 'sell' лучшая цена — минимальная, для 'buy' — максимальная."""
+
+    def __init__(self, side: str):
+        self.side = side
+        self._prices: list[float] = []  # по возрастанию
+        self._levels: dict[float, PriceLevel] = {}
+        self._orders: dict[int, float] = {}  # order_id -> price
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    @property
+    def level_count(self) -> int:
+        return len(self._prices)
+
+    def add(self, order: BookOrder) -> None:
+        level = self._levels.get(order.price)
+        if level is None:
+            level = self._levels[order.price] = PriceLevel(order.price)
+            insort(self._prices, order.price)
+        level.orders[order.id] = order
+        level.amount += order.amount
+        self._orders[order.id] = order.price
+
+    def remove(self, order_id: int) -> BookOrder | None:
+        price = self._orders.pop(order_id, None)
+        if price is None:
+            return None
+        level = self._levels[price]
+        order = level.orders.pop(order_id)
+        level.amount -= order.amount
+        if not level.orders:
+            del self._levels[price]
+            del self._prices[bisect_left(self._prices, price)]
+        return order
+
+    def levels(self) -> Iterator[PriceLevel]:
+        prices = reversed(self._prices) if self.side == "buy" else iter(self._prices)
+        for price in prices:
+            yield self._levels[price]
+
+    def best(self) -> PriceLevel | None:
+        if not self._prices:
+            return None
+        price = self._prices[-1] if self.side == "buy" else self._prices[0]
+        return self._levels[price]
+
+
+class OrderBookEngine:
+    def __init__(self):
+        self._books: dict[BookKey, BookSide] = {}
+        self._where: dict[int, BookKey] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(crypto_currency: str, fiat_currency: str, side: str) -> BookKey:
+        return crypto_currency.upper(), fiat_currency.upper(), side
+
+    def _book(self, key: BookKey) -> BookSide:
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = BookSide(key[2])
+        return book
+
+    def _remove_locked(self, order_id: int) -> None:
+        key = self._where.pop(order_id, None)
+        if key is not None:
+            self._books[key].remove(order_id)
+
+    def load(self) -> int:
+        """Пересобрать книгу из активных ордеров в БД (в порядке создания)."""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.P2POrder)
+                .filter(models.P2POrder.status == "active", models.P2POrder.taker_id.is_(None))
+                .order_by(models.P2POrder.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        books: dict[BookKey, BookSide] = {}
+        where: dict[int, BookKey] = {}
+        for row in rows:
+            key = self._key(row.crypto_currency, row.fiat_currency, row.side)
+            book = books.get(key)
+            if book is None:
+                book = books[key] = BookSide(row.side)
+            book.add(BookOrder(id=row.id, maker_id=row.maker_id, amount=row.amount, price=row.price))
+            where[row.id] = key
+
+        with self._lock:
+            self._books = books
+            self._where = where
+        return len(where)
+
+    def sync(self, order: models.P2POrder) -> None:
+        """Привести книги всех воркеров в соответствие с ордером после любой мутации.
+
+        В стакане лежат только активные ордера без тейкера; повторный sync
+        того же ордера сохраняет его место в очереди.
+        """
+        shared_cache.publish(
+            SHARED_CHANNEL,
+            {
+                "id": order.id,
+                "maker_id": order.maker_id,
+                "crypto_currency": order.crypto_currency,
+                "fiat_currency": order.fiat_currency,
+                "side": order.side,
+                "amount": order.amount,
+                "price": order.price,
+                "in_book": order.status == "active" and order.taker_id is None,
+            },
+        )
+
+    def remove(self, order_id: int) -> None:
+        shared_cache.publish(SHARED_CHANNEL, {"id": order_id, "in_book": False})
+
+    def apply(self, change: dict) -> None:
+        """Применить sync/remove, сделанный этим или соседним воркером."""
+        with self._lock:
+            if not change["in_book"]:
+                self._remove_locked(change["id"])
+                return
+            key = self._key(change["crypto_currency"], change["fiat_currency"], change["side"])
+            if self._where.get(change["id"]) == key:
+                return
+            self._remove_locked(change["id"])
+            self._book(key).add(
+                BookOrder(id=change["id"], maker_id=change["maker_id"], amount=change["amount"], price=change["price"])
+            )
+            self._where[change["id"]] = key
+
+    def best_bid_ask(self, crypto_currency: str, fiat_currency: str) -> tuple[float | None, float | None]:
+        with self._lock:
+            bid = self._books.get(self._key(crypto_currency, fiat_currency, "buy"))
+            ask = self._books.get(self._key(crypto_currency, fiat_currency, "sell"))
+            best_bid = bid.best() if bid else None
+            best_ask = ask.best() if ask else None
+            return (
+                best_bid.price if best_bid else None,
+                best_ask.price if best_ask else None,
+            )
+
+    def depth(self, crypto_currency: str, fiat_currency: str, levels: int = 20) -> dict[str, list[tuple[float, float, int]]]:
+        """Снимок глубины: по `levels` лучших уровней (цена, объём, число ордеров)."""
+        result: dict[str, list[tuple[float, float, int]]] = {}
+        with self._lock:
+            for side, name in (("buy", "bids"), ("sell", "asks")):
+                book = self._books.get(self._key(crypto_currency, fiat_currency, side))
+                snapshot = []
+                if book is not None:
+                    for level in book.levels():
+                        if len(snapshot) >= levels:
+                            break
+                        snapshot.append((level.price, level.amount, len(level.orders)))
+                result[name] = snapshot
+        return result
+
+    def best_matches(
+        self,
+        crypto_currency: str,
+        fiat_currency: str,
+        side: str,
+        amount: float,
+        exclude_maker_id: int | None = None,
+    ) -> list[BookOrder]:
+        """Лучшие ордера стороны `side`, покрывающие `amount` (цена, затем время)."""
+        matched: list[BookOrder] = []
+        remaining = amount
+        with self._lock:
+            book = self._books.get(self._key(crypto_currency, fiat_currency, side))
+            if book is None:
+                return matched
+            for level in book.levels():
+                for order in level.orders.values():
+                    if order.maker_id == exclude_maker_id:
+                        continue
+                    matched.append(order)
+                    remaining -= order.amount
+                    if remaining <= 0:
+                        return matched
+        return matched
+
+    def pairs(self) -> set[tuple[str, str]]:
+        """Пары (crypto_currency, fiat_currency), по которым в книге есть ордера."""
+        with self._lock:
+            return {(key[0], key[1]) for key, book in self._books.items() if len(book)}
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "books": len(self._books),
+                "orders": len(self._where),
+                "levels": sum(b.level_count for b in self._books.values()),
+            }
+
+
+order_book = OrderBookEngine()
+shared_cache.subscribe(SHARED_CHANNEL, order_book.apply)
@@ -0,0 +1,35 @@
+import base64
+import json
+from typing import Any
+
+from fastapi import HTTPException
+
+# Заголовок, в котором отдаём курсор следующей страницы: тело ответа
+# остаётся обычным списком, схемы OpenAPI не меняются.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> list[Any]:
+    """Разобрать курсор keyset-пагинации: значения типов `types`, по порядку.
+
+    Типы проверяем, иначе чужое значение доедет до сравнения в SQL
+    (`id > 'x'`), и Postgres ответит ошибкой, то есть 500.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    for i, (value, expected) in enumerate(zip(values, types)):
+        # bool в JSON — не число; целое годится и там, где ждём float
+        if isinstance(value, bool) or not isinstance(value, (int, float) if expected is float else expected):
+            raise HTTPException(status_code=400, detail="Некорректный cursor")
+        values[i] = expected(value)
+    return values
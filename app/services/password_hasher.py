@@ -0,0 +1,122 @@
+"""Хеширование паролей в отдельном пуле потоков.
+
+bcrypt намеренно медленный (сотни миллисекунд при cost 12). Если гонять его
+в общем threadpool FastAPI, всплеск логинов занимает все потоки и встают
+остальные sync-эндпоинты. Поэтому у хеширования свой пул фиксированного
+размера и ограниченная очередь: при переполнении сразу отвечаем 429
+с Retry-After, а не копим ожидающих.
+
+bcrypt отпускает GIL на время вычисления, поэтому потоков достаточно,
+процессы не нужны.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.core.config import settings
+from app.services.metrics import Counter, Gauge, Histogram, registry
+
+T = TypeVar("T")
+
+hash_seconds = registry.register(
+    Histogram("password_hash_duration_seconds", "Время bcrypt-операции в пуле", ("op",))
+)
+hash_wait_seconds = registry.register(
+    Histogram("password_hash_wait_seconds", "Ожидание свободного потока в пуле хеширования", ("op",))
+)
+hash_queue_depth = registry.register(
+    Gauge("password_hash_queue_depth", "Операции хеширования в работе и в очереди")
+)
+hash_rejected = registry.register(
+    Counter("password_hash_rejected_total", "Отказы 429 из-за переполненной очереди хеширования", ("op",))
+)
+
+
+def build_context(rounds: int) -> CryptContext:
+    # min = max = default: хеш с любым другим cost считается устаревшим,
+    # и verify_and_update вернёт новый хеш (rehash-on-login)
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+class PasswordHasher:
+    def __init__(self, context: CryptContext, workers: int, queue_size: int, retry_after: int):
+        self.context = context
+        self.workers = workers
+        # Сколько операций может ждать сверх занятых потоков
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor: ThreadPoolExecutor | None = None
+        # Меняется только из event loop, лок не нужен
+        self._pending = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, op: str, fn: Callable[..., T], *args) -> T:
+        if self._pending >= self.workers + self.queue_size:
+            hash_rejected.inc(op)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Сервер перегружен, повторите запрос позже",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        submitted = time.perf_counter()
+
+        def timed() -> T:
+            started = time.perf_counter()
+            hash_wait_seconds.observe(op, value=started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                hash_seconds.observe(op, value=time.perf_counter() - started)
+
+        self._pending += 1
+        hash_queue_depth.set(value=self._pending)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), timed)
+        finally:
+            self._pending -= 1
+            hash_queue_depth.set(value=self._pending)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(верен ли пароль, новый хеш — если cost в настройках изменился)."""
+        return await self._run("verify", self.context.verify_and_update, password, hashed)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+        }
+
+
+password_hasher = PasswordHasher(
+    build_context(settings.PASSWORD_BCRYPT_ROUNDS),
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+    retry_after=settings.PASSWORD_HASH_RETRY_AFTER,
+)
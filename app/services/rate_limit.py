@@ -0,0 +1,286 @@
+"""Ограничение частоты запросов token bucket'ами.
+
+- RateLimitMiddleware: лимит на (класс маршрута, пользователь из JWT или IP).
+  Классы и их rate/burst — в settings.RATE_LIMITS; в ответ кладём
+  заголовки RateLimit-Limit/-Remaining/-Reset/-Policy, при отказе — 429
+  с Retry-After.
+- tatum_budget: общий бюджет исходящих вызовов Tatum в секунду. Вызов
+  не отклоняется сразу, а резервирует токен «в долг» и ждёт своей очереди,
+  если ожидание укладывается в TATUM_BUDGET_MAX_WAIT_SECONDS и дедлайн.
+
+Состояние бакетов по умолчанию в памяти процесса. При нескольких воркерах
+можно указать RATE_LIMIT_REDIS_URL — тогда бакеты общие (нужен пакет redis).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.metrics import Counter, Histogram, registry
+from app.services.security import decode_user_id
+
+logger = logging.getLogger(__name__)
+
+rate_limited = registry.register(
+    Counter("rate_limited_total", "Запросы, отклонённые rate limit", ("route_class",))
+)
+tatum_budget_wait = registry.register(
+    Histogram("tatum_budget_wait_seconds", "Ожидание токена из общего бюджета Tatum")
+)
+tatum_budget_rejected = registry.register(
+    Counter("tatum_budget_rejected_total", "Вызовы Tatum, не дождавшиеся бюджета")
+)
+
+
+@dataclass(frozen=True)
+class Grant:
+    granted: bool
+    # Токенов осталось после списания (для бюджета может быть < 0 — очередь)
+    tokens: float
+    # Сколько ждать до своей очереди (только при max_wait > 0)
+    wait: float
+
+
+class MemoryBucketStore:
+    """Бакеты в памяти процесса с LRU-вытеснением редких ключей."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1.0, max_wait: float = 0.0) -> Grant:
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None:
+                state = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(burst, state[0] + (now - state[1]) * rate)
+            state[1] = now
+            after = tokens - cost
+            if after >= -rate * max_wait:
+                state[0] = after
+                return Grant(True, after, max(-after / rate, 0.0))
+            state[0] = tokens
+            return Grant(False, tokens, 0.0)
+
+    async def close(self) -> None:
+        pass
+
+
+# Тот же алгоритм атомарно на стороне Redis; время — redis TIME, чтобы
+# часы воркеров не расходились
+_REDIS_CONSUME = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(s[1])
+local ts = tonumber(s[2])
+if tokens == nil then
+  tokens = burst
+  ts = now
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local after = tokens - cost
+local granted = 0
+local wait = 0
+if after >= -rate * max_wait then
+  granted = 1
+  tokens = after
+  if after < 0 then wait = -after / rate end
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + max_wait) * 1000) + 1000)
+return {granted, tostring(tokens), tostring(wait)}
+"""
+
+
+class RedisBucketStore:
+    """Общие бакеты для нескольких воркеров. При недоступности Redis пропускаем (fail-open)."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as exc:  # pragma: no cover - зависит от окружения
+            raise RuntimeError("RATE_LIMIT_REDIS_URL задан, но пакет redis не установлен") from exc
+        self._redis = redis_asyncio.from_url(url)
+        self._script = self._redis.register_script(_REDIS_CONSUME)
+        self.prefix = prefix
+
+    async def consume(self, key: str, rate: float, burst: float, cost: float = 1.0, max_wait: float = 0.0) -> Grant:
+        try:
+            granted, tokens, wait = await self._script(keys=[self.prefix + key], args=[rate, burst, cost, max_wait])
+        except Exception as exc:
+            logger.warning("Rate limit: Redis недоступен, запрос пропущен: %s", exc)
+            return Grant(True, burst, 0.0)
+        return Grant(bool(int(granted)), float(tokens), float(wait))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def build_store():
+    if settings.RATE_LIMIT_REDIS_URL:
+        return RedisBucketStore(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryBucketStore(settings.RATE_LIMIT_MAX_KEYS)
+
+
+bucket_store = build_store()
+
+
+# --- лимиты входящих запросов -------------------------------------------
+
+# (метод, путь без API-префикса) -> класс маршрута; первое совпадение
+ROUTE_CLASSES: list[tuple[str, re.Pattern, str]] = [
+    ("POST", re.compile(r"^/tx/broadcast(/batch)?$"), "tx_broadcast"),
+    ("GET", re.compile(r"^/tx/[^/]+/[^/]+$"), "tx_status"),
+    ("POST", re.compile(r"^/auth/"), "auth"),
+    # Без аутентификации и с походом в CoinGecko на промахе
+    ("GET", re.compile(r"^/rates(/convert)?$"), "rates"),
+]
+
+
+def route_class(method: str, path: str) -> str | None:
+    """Класс маршрута для лимита; None — маршрут вне API и не лимитируется."""
+    prefix = settings.API_V1_STR
+    if not path.startswith(prefix + "/"):
+        return None
+    path = path[len(prefix):]
+    for rule_method, pattern, name in ROUTE_CLASSES:
+        if method == rule_method and pattern.match(path):
+            return name
+    return "default"
+
+
+def _client_key(scope) -> str:
+    headers = dict(scope.get("headers") or ())
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if auth[:7].lower() == "bearer ":
+        user_id = decode_user_id(auth[7:].strip())
+        if user_id is not None:
+            return f"u{user_id}"
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1")
+        if forwarded:
+            return "ip" + forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return "ip" + (client[0] if client else "unknown")
+
+
+def _limit_headers(limit: dict, grant: Grant) -> list[tuple[bytes, bytes]]:
+    rate, burst = float(limit["rate"]), float(limit["burst"])
+    remaining = max(int(grant.tokens), 0)
+    # Через сколько секунд бакет снова полный
+    reset = math.ceil((burst - max(grant.tokens, 0.0)) / rate)
+    window = math.ceil(burst / rate)
+    headers = [
+        (b"ratelimit-limit", str(int(burst)).encode()),
+        (b"ratelimit-remaining", str(remaining).encode()),
+        (b"ratelimit-reset", str(reset).encode()),
+        (b"ratelimit-policy", f"{int(burst)};w={window}".encode()),
+    ]
+    if not grant.granted:
+        headers.append((b"retry-after", str(max(math.ceil((1 - grant.tokens) / rate), 1)).encode()))
+    return headers
+
+
+class RateLimitMiddleware:
+    """Чистый ASGI-middleware: лимит до роутинга, без чтения тела запроса."""
+
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        limit = settings.RATE_LIMITS.get(name) if name else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        store = self.store or bucket_store
+        grant = await store.consume(f"{name}:{_client_key(scope)}", float(limit["rate"]), float(limit["burst"]))
+        headers = _limit_headers(limit, grant)
+
+        if not grant.granted:
+            rate_limited.inc(name)
+            body = json.dumps({"detail": "Слишком много запросов"}, ensure_ascii=False).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        *headers,
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), *headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# --- общий бюджет исходящих вызовов Tatum -------------------------------
+
+class OutboundBudget:
+    """Токены в секунду на все вызовы внешнего API, с очередью ожидания."""
+
+    def __init__(self, key: str, rate: float, burst: float, max_wait: float):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+
+    async def acquire(self, deadline: float | None = None) -> None:
+        if self.rate <= 0:
+            return
+        max_wait = self.max_wait
+        if deadline is not None:
+            max_wait = min(max_wait, max(deadline - time.monotonic(), 0.0))
+        grant = await bucket_store.consume(self.key, self.rate, self.burst, max_wait=max_wait)
+        if not grant.granted:
+            tatum_budget_rejected.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Исчерпан бюджет запросов к Tatum, повторите позже",
+                headers={"Retry-After": str(max(math.ceil(-grant.tokens / self.rate), 1))},
+            )
+        tatum_budget_wait.observe(value=grant.wait)
+        if grant.wait > 0:
+            await asyncio.sleep(grant.wait)
+
+
+tatum_budget = OutboundBudget(
+    "tatum:budget",
+    rate=settings.TATUM_BUDGET_PER_SECOND,
+    burst=settings.TATUM_BUDGET_BURST,
+    max_wait=settings.TATUM_BUDGET_MAX_WAIT_SECONDS,
+)
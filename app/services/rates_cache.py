@@ -1,34 +1,556 @@
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Iterable
+
 import httpx
+from fastapi import HTTPException
 
 from app.core.config import settings
+from app.services.metrics import cache_lookup_seconds, track_outbound
+from app.services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Символ монеты (как в справочнике сетей и ордерах) -> id в CoinGecko
+COIN_IDS = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "BNB": "binancecoin",
+    "USDT": "tether",
+    "TRX": "tron",
+    "LTC": "litecoin",
+    "TON": "toncoin",
+}
+_SYMBOLS = {coin_id: symbol for symbol, coin_id in COIN_IDS.items()}
+# Через что пересчитываются фиат -> фиат и монета -> монета
+PIVOT_COIN = "BTC"
+PIVOT_FIAT = "USD"
+
+_FIAT_RE = re.compile(r"^[a-z]{3,5}$")
+
+# (id монеты в CoinGecko, фиат в нижнем регистре): ("bitcoin", "usd")
+Pair = tuple[str, str]
+
+
+@dataclass(frozen=True)
+class RateQuote:
+    coin: str
+    fiat: str
+    price: float
+    age_seconds: float
+    stale: bool
+
+
+@dataclass(frozen=True)
+class Conversion:
+    amount: float
+    from_currency: str
+    to_currency: str
+    rate: float
+    result: float
+    age_seconds: float
+    stale: bool
+
+
+def is_coin(code: str) -> bool:
+    return code.upper() in COIN_IDS
 
 
 class RatesCache:
-    def __init__(self, ttl_seconds: int = 60):
-        self.ttl = timedelta(seconds=ttl_seconds)
-        self._data: Dict[str, Any] = {}
-        self._ts: datetime | None = None
-
-    async def get_rates(self) -> Dict[str, Any]:
-        now = datetime.utcnow()
-        if self._ts and now - self._ts < self.ttl:
-            return self._data
-
-        ids = "bitcoin,ethereum,binancecoin,tether,tron,litecoin,toncoin"
-        vs = "usd"
+    """Кэш курсов CoinGecko по парам (монета, фиат).
+
+    - отслеживаются пары, которые реально используются: RATES_DEFAULT_FIATS
+      для всех монет, пары стакана P2P и всё, что спрашивали через API;
+      пара без обращений дольше `pair_idle_seconds` выбывает;
+    - у каждой пары своя свежесть: после TTL отдаём последнее значение и
+      обновляем его в фоне (stale-while-revalidate), но не дольше `stale_seconds`;
+    - фоновый refresher заранее, до истечения TTL, обновляет все
+      подошедшие пары одним запросом simple/price (ids x vs_currencies);
+    - на одну пару одновременно идёт не больше одного запроса (single-flight),
+      а из воркеров хоста в CoinGecko ходит один (см. shared_cache).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 60,
+        stale_seconds: float = 600,
+        refresh_ahead_seconds: float = 10,
+        default_fiats: Iterable[str] = ("usd",),
+        pair_idle_seconds: float = 86400,
+        max_pairs: int = 1000,
+        fiats: Iterable[str] = (),
+    ):
+        self.ttl = ttl_seconds
+        self.stale = stale_seconds
+        self.refresh_ahead = refresh_ahead_seconds
+        self.pair_idle = pair_idle_seconds
+        self.max_pairs = max_pairs
+        self._pinned: set[Pair] = {(cid, f.lower()) for cid in COIN_IDS.values() for f in default_fiats}
+        # Пара -> (цена, время получения)
+        self._quotes: Dict[Pair, tuple[float, float]] = {}
+        # Отслеживаемые пары -> время последнего обращения (LRU)
+        self._tracked: OrderedDict[Pair, float] = OrderedDict((p, time.monotonic()) for p in sorted(self._pinned))
+        # Фиаты, которые можно спрашивать: заданный список или
+        # supported_vs_currencies CoinGecko (грузится один раз); None — пока
+        # не загружен, проверяется только формат кода
+        self._fiats: frozenset[str] | None = frozenset(f.lower() for f in fiats) or None
+        self._fiats_task: asyncio.Task | None = None
+        self._fiats_retry_at = 0.0
+        # Пары, которых CoinGecko не знает -> когда это выяснилось (LRU,
+        # не больше max_pairs)
+        self._unsupported: OrderedDict[Pair, float] = OrderedDict()
+        self._inflight: Dict[Pair, asyncio.Task] = {}
+        self._refresher: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Пары трогают и event loop, и потоки sync-эндпоинтов (стакан, ордера)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.refresh_ok = 0
+        self.refresh_errors = 0
+        # Пары, взятые из общего кэша (их обновил другой воркер)
+        self.shared_adopted = 0
+        self.refresh_latency_last = 0.0
+        self.refresh_latency_total = 0.0
+
+    # --- пары ---
+
+    def _pair(self, coin: str, fiat: str) -> Pair:
+        coin_id = COIN_IDS.get(coin.upper())
+        fiat = fiat.lower()
+        if coin_id is None:
+            raise HTTPException(status_code=400, detail=f"Неизвестная монета: {coin}")
+        if not _FIAT_RE.match(fiat):
+            raise HTTPException(status_code=400, detail=f"Некорректный код валюты: {fiat}")
+        if self._fiats is not None and fiat not in self._fiats:
+            raise HTTPException(status_code=400, detail=f"Неподдерживаемая валюта: {fiat}")
+        return coin_id, fiat
+
+    def _is_unsupported(self, pair: Pair, now: float) -> bool:
+        ts = self._unsupported.get(pair)
+        if ts is None:
+            return False
+        if now - ts < self.ttl:
+            return True
+        del self._unsupported[pair]
+        return False
+
+    def _touch(self, pair: Pair, now: float) -> None:
+        with self._lock:
+            if pair in self._tracked:
+                self._tracked[pair] = now
+                self._tracked.move_to_end(pair)
+                return
+            if self._is_unsupported(pair, now):
+                return
+            self._tracked[pair] = now
+            while len(self._tracked) > self.max_pairs:
+                # Самая давно не нужная пара, кроме закреплённых
+                victim = next((p for p in self._tracked if p not in self._pinned), None)
+                if victim is None:
+                    break
+                self._forget(victim)
+        # Новую пару refresher заберёт со следующим пакетным запросом
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _forget(self, pair: Pair) -> None:
+        self._tracked.pop(pair, None)
+        self._quotes.pop(pair, None)
+
+    def track(self, coin: str, fiat: str) -> None:
+        """Начать отслеживать пару (без сетевых запросов); неизвестное молча пропускаем."""
+        try:
+            pair = self._pair(coin, fiat)
+        except HTTPException:
+            return
+        self._touch(pair, time.monotonic())
+
+    # --- загрузка ---
+
+    async def _load_fiats(self) -> None:
+        url = f"{settings.coingecko_base_url}/simple/supported_vs_currencies"
+        try:
+            with track_outbound("coingecko", "", "supported_vs_currencies") as call:
+                async with httpx.AsyncClient(timeout=10) as client:
+                    resp = await client.get(url)
+                    if resp.status_code >= 400:
+                        call.outcome = f"http_{resp.status_code // 100}xx"
+                    resp.raise_for_status()
+                    data = resp.json()
+            fiats = frozenset(str(f).lower() for f in data)
+        except Exception as exc:
+            # Без списка работаем по формату кода; повторим не раньше чем через TTL
+            logger.warning("Не удалось загрузить список валют CoinGecko: %s", exc)
+            self._fiats_retry_at = time.monotonic() + self.ttl
+            return
+        if fiats:
+            self._fiats = fiats
+
+    async def _ensure_fiats(self) -> None:
+        """Загрузить список фиатов CoinGecko, если он ещё не загружен."""
+        if self._fiats is not None or time.monotonic() < self._fiats_retry_at:
+            return
+        if self._fiats_task is None or self._fiats_task.done():
+            self._fiats_task = asyncio.create_task(self._load_fiats())
+        await asyncio.shield(self._fiats_task)
+
+    async def _fetch(self, pairs: set[Pair]) -> Dict[str, Any]:
+        ids = ",".join(sorted({coin_id for coin_id, _ in pairs}))
+        vs = ",".join(sorted({fiat for _, fiat in pairs}))
         url = f"{settings.coingecko_base_url}/simple/price"
         params = {"ids": ids, "vs_currencies": vs}
 
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            data = resp.json()
+        with track_outbound("coingecko", "", "simple_price") as call:
+            async with httpx.AsyncClient(timeout=10) as client:
+                resp = await client.get(url, params=params)
+                if resp.status_code >= 400:
+                    call.outcome = f"http_{resp.status_code // 100}xx"
+                resp.raise_for_status()
+                return resp.json()
+
+    def _store(self, pair: Pair, price: float | None, ts: float) -> None:
+        if price is not None:
+            self._quotes[pair] = (float(price), ts)
+            return
+        # Такой пары у CoinGecko нет — не спрашиваем её снова до TTL
+        self._unsupported[pair] = ts
+        self._unsupported.move_to_end(pair)
+        while len(self._unsupported) > self.max_pairs:
+            self._unsupported.popitem(last=False)
+        self._quotes.pop(pair, None)
+        if pair not in self._pinned:
+            self._tracked.pop(pair, None)
+
+    async def _adopt_shared(self, pairs: set[Pair]) -> set[Pair]:
+        """Пары, которые уже обновил другой воркер: берём их значения себе."""
+        found = await shared_cache.get_many(_shared_key(pair) for pair in pairs)
+        wall, now = time.time(), time.monotonic()
+        adopted = set()
+        with self._lock:
+            for pair in pairs:
+                item = found.get(_shared_key(pair))
+                if item is None:
+                    continue
+                price, fetched_at = item
+                age = max(wall - fetched_at, 0.0)
+                # Значение, которое и само подошло к обновлению (см. _due), не берём
+                if age >= self.ttl - 2 * self.refresh_ahead:
+                    continue
+                self._store(pair, price, now - age)
+                adopted.add(pair)
+        self.shared_adopted += len(adopted)
+        return adopted
+
+    async def _fetch_and_store(self, pairs: set[Pair]) -> None:
+        started = time.perf_counter()
+        try:
+            data = await self._fetch(pairs)
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.refresh_latency_last = elapsed
+            self.refresh_latency_total += elapsed
+
+        wall, now = time.time(), time.monotonic()
+        prices: Dict[Pair, float | None] = {}
+        for pair in pairs:
+            coin_id, fiat = pair
+            price = (data.get(coin_id) or {}).get(fiat)
+            prices[pair] = float(price) if isinstance(price, (int, float)) else None
+        with self._lock:
+            for pair, price in prices.items():
+                self._store(pair, price, now)
+        self.refresh_ok += 1
+        await shared_cache.set_many(
+            {_shared_key(pair): [price, wall] for pair, price in prices.items()},
+            ttl_seconds=self.ttl + self.stale,
+        )
+
+    async def _do_refresh(self, pairs: set[Pair]) -> None:
+        # Из воркеров хоста в CoinGecko идёт один, остальные берут его
+        # результат из общего кэша
+        remaining = set(pairs)
+
+        async def adopt() -> bool:
+            remaining.difference_update(await self._adopt_shared(remaining))
+            return not remaining
+
+        await shared_cache.refresh("rates", adopt, lambda: self._fetch_and_store(remaining))
 
-        self._data = data
-        self._ts = now
+    def _start_refresh(self, pairs: set[Pair]) -> list[asyncio.Task]:
+        # Между проверкой и созданием задачи нет await, поэтому в пределах
+        # event loop это атомарно: пары, которые уже грузятся, ждут ту же задачу.
+        tasks = {self._inflight[p] for p in pairs if p in self._inflight}
+        missing = {p for p in pairs if p not in self._inflight}
+        if missing:
+            task = asyncio.create_task(self._do_refresh(missing))
+            task.add_done_callback(_consume_exception)
+            task.add_done_callback(lambda t, ps=missing: self._clear_inflight(ps, t))
+            for p in missing:
+                self._inflight[p] = task
+            tasks.add(task)
+        return list(tasks)
+
+    def _clear_inflight(self, pairs: set[Pair], task: asyncio.Task) -> None:
+        for p in pairs:
+            if self._inflight.get(p) is task:
+                del self._inflight[p]
+
+    def _age(self, pair: Pair, now: float) -> float | None:
+        quote = self._quotes.get(pair)
+        return None if quote is None else now - quote[1]
+
+    def _quote(self, pair: Pair, now: float) -> RateQuote | None:
+        quote = self._quotes.get(pair)
+        if quote is None:
+            return None
+        age = now - quote[1]
+        if age >= self.ttl + self.stale:
+            return None
+        return RateQuote(coin=_SYMBOLS[pair[0]], fiat=pair[1].upper(), price=quote[0], age_seconds=age, stale=age >= self.ttl)
+
+    # --- чтение ---
+
+    def quote(self, coin: str, fiat: str) -> RateQuote | None:
+        """Курс пары из памяти, без сетевых запросов.
+
+        None — курса нет или он старше TTL + stale; пара при этом
+        начинает отслеживаться и появится после ближайшего обновления.
+        """
+        try:
+            pair = self._pair(coin, fiat)
+        except HTTPException:
+            return None
+        now = time.monotonic()
+        self._touch(pair, now)
+        return self._quote(pair, now)
+
+    async def get_quotes(self, pairs: Iterable[tuple[str, str]], partial: bool = False) -> Dict[Pair, RateQuote]:
+        """Курсы нескольких пар; недостающие догружаются одним запросом.
+
+        Пара, которой нет у CoinGecko, — 503; с partial=True такие пары
+        просто пропускаются, и возвращаются остальные.
+        """
+        started = time.perf_counter()
+        await self._ensure_fiats()
+        now = time.monotonic()
+        wanted = {self._pair(coin, fiat) for coin, fiat in pairs}
+        for pair in wanted:
+            self._touch(pair, now)
+        unsupported = sorted(p for p in wanted if self._is_unsupported(p, now))
+        if unsupported:
+            if not partial:
+                raise _unavailable(unsupported[0])
+            wanted.difference_update(unsupported)
+
+        result: Dict[Pair, RateQuote] = {}
+        missing, stale = set(), set()
+        for pair in wanted:
+            quote = self._quote(pair, now)
+            if quote is None:
+                missing.add(pair)
+                continue
+            result[pair] = quote
+            if quote.stale:
+                stale.add(pair)
+
+        if stale:
+            # Отдаём последние значения, обновление идёт в фоне
+            self._start_refresh(stale)
+        if not missing:
+            if stale:
+                self.stale_served += 1
+            else:
+                self.hits += 1
+            cache_lookup_seconds.observe("rates", "stale" if stale else "hit", value=time.perf_counter() - started)
+            return result
+
+        self.misses += 1
+        outcome = "miss"
+        try:
+            # shield: отмена одного клиента не должна отменять общий запрос
+            await asyncio.shield(asyncio.gather(*self._start_refresh(missing)))
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            cache_lookup_seconds.observe("rates", outcome, value=time.perf_counter() - started)
+
+        now = time.monotonic()
+        for pair in missing:
+            quote = self._quote(pair, now)
+            if quote is None:
+                if partial:
+                    continue
+                raise _unavailable(pair)
+            result[pair] = quote
+        return result
+
+    async def get_quote(self, coin: str, fiat: str) -> RateQuote:
+        pair = self._pair(coin, fiat)
+        return (await self.get_quotes([(coin, fiat)]))[pair]
+
+    async def get_rates(self, vs: Iterable[str] = ("usd",)) -> Dict[str, Any]:
+        """Все монеты в фиатах `vs`, в формате CoinGecko: {"bitcoin": {"usd": ...}}.
+
+        Как и сам CoinGecko, отдаём то, что есть: пар без курса в ответе нет.
+        """
+        quotes = await self.get_quotes(((coin, fiat) for coin in COIN_IDS for fiat in vs), partial=True)
+        data: Dict[str, Any] = {}
+        for (coin_id, fiat), quote in sorted(quotes.items()):
+            data.setdefault(coin_id, {})[fiat] = quote.price
         return data
 
+    async def convert(self, amount: float, from_currency: str, to_currency: str) -> Conversion:
+        """Пересчёт между монетами и фиатами.
+
+        Монета -> фиат и обратно — по курсу пары; монета -> монета через
+        PIVOT_FIAT, фиат -> фиат через PIVOT_COIN.
+        """
+        src, dst = from_currency.upper(), to_currency.upper()
+        if src == dst:
+            return Conversion(amount, src, dst, 1.0, amount, 0.0, False)
+        if is_coin(src) and is_coin(dst):
+            legs = [(src, PIVOT_FIAT), (dst, PIVOT_FIAT)]
+        elif is_coin(src):
+            legs = [(src, dst)]
+        elif is_coin(dst):
+            legs = [(dst, src)]
+        else:
+            legs = [(PIVOT_COIN, dst), (PIVOT_COIN, src)]
+
+        quotes = await self.get_quotes(legs)
+        prices = [quotes[self._pair(coin, fiat)] for coin, fiat in legs]
+        if len(prices) == 1:
+            rate = prices[0].price if is_coin(src) else 1 / prices[0].price
+        else:
+            # src в PIVOT_FIAT / dst в PIVOT_FIAT или PIVOT_COIN в dst / PIVOT_COIN в src
+            rate = prices[0].price / prices[1].price
+        return Conversion(
+            amount=amount,
+            from_currency=src,
+            to_currency=dst,
+            rate=rate,
+            result=amount * rate,
+            age_seconds=max(q.age_seconds for q in prices),
+            stale=any(q.stale for q in prices),
+        )
+
+    # --- фоновое обновление ---
+
+    def _due(self, now: float) -> tuple[set[Pair], float]:
+        """Пары, которым пора обновиться, и через сколько подойдёт следующая."""
+        waits: dict[Pair, float] = {}
+        with self._lock:
+            for pair, last_used in list(self._tracked.items()):
+                if pair not in self._pinned and now - last_used > self.pair_idle:
+                    self._forget(pair)
+                    continue
+                if self._is_unsupported(pair, now):
+                    continue
+                age = self._age(pair, now)
+                waits[pair] = 0.0 if age is None else self.ttl - self.refresh_ahead - age
+        if not waits:
+            return set(), self.ttl
+        if min(waits.values()) > 0:
+            return set(), min(waits.values())
+        # Заодно берём пары, которым срок подойдёт в ближайшие refresh_ahead
+        # секунд: так пары, добавленные в разное время, сходятся в один запрос
+        return {pair for pair, wait in waits.items() if wait < self.refresh_ahead}, 0.0
+
+    async def _run_refresher(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self._ensure_fiats()
+        while True:
+            self._wakeup.clear()
+            due, delay = self._due(time.monotonic())
+            if due:
+                try:
+                    await asyncio.shield(asyncio.gather(*self._start_refresh(due)))
+                except Exception as exc:
+                    logger.warning("Не удалось обновить курсы: %s", exc)
+                    # Не долбим upstream в цикле при ошибке
+                    await asyncio.sleep(max(self.refresh_ahead, 1.0))
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._run_refresher())
+
+    async def stop(self) -> None:
+        for task in (self._refresher, self._fiats_task, *set(self._inflight.values())):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._refresher = None
+        self._fiats_task = None
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        refreshes = self.refresh_ok + self.refresh_errors
+        now = time.monotonic()
+        ages = [now - ts for _, ts in self._quotes.values()]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "refresh_ok": self.refresh_ok,
+            "refresh_errors": self.refresh_errors,
+            "shared_adopted": self.shared_adopted,
+            "refresh_latency_last_ms": round(self.refresh_latency_last * 1000, 3),
+            "refresh_latency_avg_ms": (
+                round(self.refresh_latency_total / refreshes * 1000, 3) if refreshes else 0.0
+            ),
+            "pairs_tracked": len(self._tracked),
+            "pairs_cached": len(self._quotes),
+            "pairs_unsupported": len(self._unsupported),
+            "fiats_known": len(self._fiats) if self._fiats is not None else None,
+            # Возраст самой старой котировки
+            "age_seconds": max(ages) if ages else None,
+        }
+
+
+def _shared_key(pair: Pair) -> str:
+    return f"rates:{pair[0]}:{pair[1]}"
+
+
+def _unavailable(pair: Pair) -> HTTPException:
+    # Пробел в данных CoinGecko, а не ошибка клиента
+    return HTTPException(status_code=503, detail=f"Курс {_SYMBOLS[pair[0]]}/{pair[1].upper()} недоступен")
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # Ошибка фонового обновления уже учтена в счётчиках; не даём asyncio
+    # ругаться "Task exception was never retrieved".
+    if not task.cancelled():
+        task.exception()
+
 
-rates_cache = RatesCache()
+rates_cache = RatesCache(
+    ttl_seconds=settings.RATES_TTL_SECONDS,
+    stale_seconds=settings.RATES_STALE_SECONDS,
+    refresh_ahead_seconds=settings.RATES_REFRESH_AHEAD_SECONDS,
+    default_fiats=settings.RATES_DEFAULT_FIATS,
+    pair_idle_seconds=settings.RATES_PAIR_IDLE_SECONDS,
+    max_pairs=settings.RATES_MAX_PAIRS,
+    fiats=settings.RATES_FIATS,
+)
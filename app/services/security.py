@@ -1,17 +1,23 @@
+import time
 from datetime import datetime, timedelta
 from typing import Any, Union
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
 from app.core.config import settings
-from app.db import get_db
+from app.db import AsyncSessionLocal, get_async_db
 from app import models
+from app.services.password_hasher import password_hasher
+from app.services.shared_cache import shared_cache
+from app.services.ttl_cache import TTLCache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Синхронные хелперы ниже — для скриптов; эндпоинты ходят через password_hasher
+pwd_context = password_hasher.context
 
 # URL логина для Swagger (соответствует реальному роуту /api/v1/auth/login)
 oauth2_scheme = OAuth2PasswordBearer(
@@ -46,19 +52,59 @@ def create_access_token(
     return encoded_jwt
 
 
-def _get_user_by_id(db: Session, user_id: int) -> models.User | None:
-    return db.query(models.User).filter(models.User.id == user_id).first()
+# Кэш проверенных токенов (token -> user_id) и загруженных пользователей
+# (user_id -> User): в типичном случае аутентификация не ходит ни в JWT, ни в БД.
+token_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS)
+principal_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Не удалось проверить учетные данные",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def invalidate_user(user_id: int) -> None:
+    # Сбрасываем пользователя во всех воркерах: в этом — сразу, соседям
+    # запись в журнал shm уходит в пул потоков (вызов идёт из flush ORM,
+    # часто в потоке event loop)
+    shared_cache.publish("principal", user_id)
+
+
+shared_cache.subscribe("principal", principal_cache.pop)
+
+# id пользователей, изменённых в сессии (session.info). Сбрасываем их после
+# COMMIT, а не при flush: до коммита параллельный запрос ещё читает старую
+# строку и положил бы её в кэш уже после сброса
+_CHANGED_USERS = "changed_user_ids"
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _on_user_changed(_mapper, _connection, target: models.User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_USERS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop(_CHANGED_USERS, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session) -> None:
+    session.info.pop(_CHANGED_USERS, None)
+
+
+def auth_cache_stats() -> dict[str, Any]:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
+
+
+async def _get_user_by_id(db: AsyncSession, user_id: int) -> models.User | None:
+    return await db.get(models.User, user_id)
+
+
+def decode_user_id(token: str) -> int | None:
+    """id пользователя из JWT (с кэшем проверенных токенов); None — токен невалиден."""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
 
     try:
         payload = jwt.decode(
@@ -68,12 +114,74 @@ async def get_current_user(
         )
         sub = payload.get("sub")
         if sub is None:
-            raise credentials_exception
+            return None
         user_id = int(sub)
     except (JWTError, ValueError):
+        return None
+
+    # Токен не должен жить в кэше дольше своего exp
+    exp = payload.get("exp")
+    ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+    token_cache.set(token, user_id, ttl_seconds=ttl)
+    return user_id
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> models.User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Не удалось проверить учетные данные",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    user_id = decode_user_id(token)
+    if user_id is None:
         raise credentials_exception
 
-    user = _get_user_by_id(db, user_id=user_id)
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = await _get_user_by_id(db, user_id=user_id)
     if user is None:
         raise credentials_exception
+    # Отвязываем от сессии запроса: объект переживёт её в кэше
+    db.expunge(user)
+    principal_cache.set(user_id, user)
+    return user
+
+
+async def authenticate_token(token: str) -> models.User | None:
+    """Пользователь по токену без сессии запроса.
+
+    Для долгоживущих соединений (WebSocket/SSE): get_current_user держал бы
+    сессию и соединение с БД открытыми всё время стрима, здесь же сессия
+    короткая и только при промахе кэша.
+    """
+    user_id = decode_user_id(token)
+    if user_id is None:
+        return None
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
+    async with AsyncSessionLocal() as db:
+        user = await _get_user_by_id(db, user_id=user_id)
+        if user is None:
+            return None
+        db.expunge(user)
+    principal_cache.set(user_id, user)
+    return user
+
+
+async def get_streaming_user(token: str = Depends(oauth2_scheme)) -> models.User:
+    """Зависимость для долгих ответов (SSE, выгрузки): как get_current_user, но без сессии."""
+    user = await authenticate_token(token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Не удалось проверить учетные данные",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
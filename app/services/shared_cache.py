@@ -0,0 +1,408 @@
+"""Общий кэш воркеров одного хоста.
+
+У каждого воркера uvicorn свои синглтоны (курсы, комиссии, пользователи), и
+без общего слоя каждый сам ходит в CoinGecko/Tatum и не знает об
+инвалидациях в соседях. SharedCache даёт им:
+
+- get_many / set_many — значения (JSON) с TTL, видимые всем воркерам;
+- lease(key) — право обновить ключ: из конкурирующих воркеров его получает
+  один, остальные ждут и берут готовое (см. refresh());
+- publish / subscribe — инвалидации: сообщение получают подписчики во всех
+  воркерах, включая свой;
+- periodic(key, interval) — фоновая работа (сверка, архивация), которую за
+  интервал выполняет один воркер хоста.
+
+CACHE_BACKEND=memory — всё в пределах процесса (один воркер, разработка).
+CACHE_BACKEND=shm — каталог CACHE_SHM_DIR на tmpfs: значение — файл
+(запись через os.replace, читатели не видят половину), lease — flock
+(снимается и при падении процесса), инвалидации — журнал событий, который
+каждый воркер дочитывает раз в CACHE_POLL_SECONDS.
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Mapping
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер без lease проверяет, не дописал ли владелец значение
+LEASE_POLL_SECONDS = 0.05
+# Как часто shm-бэкенд удаляет просроченные значения и брошенные .tmp
+SWEEP_SECONDS = 60.0
+
+
+class SharedCache(abc.ABC):
+    """Общая часть реализаций: подписчики на инвалидации и refresh()."""
+
+    backend = "base"
+
+    def __init__(self, lease_wait_seconds: float = 15.0):
+        self.lease_wait = lease_wait_seconds
+        self._subscribers: dict[str, list[Callable[[Any], None]]] = defaultdict(list)
+
+        self.published = 0
+        self.received = 0
+        self.leases_acquired = 0
+        self.leases_busy = 0
+
+    @abc.abstractmethod
+    async def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Непросроченные значения найденных ключей."""
+
+    @abc.abstractmethod
+    async def set_many(self, items: Mapping[str, Any], ttl_seconds: float) -> None:
+        """Записать значения с общим TTL."""
+
+    @abc.abstractmethod
+    def lease(self, key: str):
+        """async with cache.lease(key) as acquired: ... — владеем ли ключом."""
+
+    @abc.abstractmethod
+    def publish(self, channel: str, message: Any) -> None:
+        """Доставить сообщение подписчикам всех воркеров; свои — сразу.
+
+        Вызывается и из event loop (в том числе из событий ORM), поэтому
+        не должен блокироваться на вводе-выводе.
+        """
+
+    def subscribe(self, channel: str, callback: Callable[[Any], None]) -> None:
+        self._subscribers[channel].append(callback)
+
+    def _deliver(self, channel: str, message: Any) -> None:
+        for callback in list(self._subscribers.get(channel, ())):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Ошибка обработки инвалидации %s", channel)
+
+    async def refresh(self, key: str, adopt: Callable[[], Awaitable[bool]], fetch: Callable[[], Awaitable[None]]) -> None:
+        """Обновить данные так, чтобы на хосте в источник шёл один воркер.
+
+        adopt() берёт готовое из общего кэша и возвращает True, если
+        обновлять больше нечего; fetch() идёт в источник и пишет результат
+        в общий кэш. Без lease ждём, пока владелец допишет значение, но не
+        дольше lease_wait — потом обновляем сами.
+        """
+        if await adopt():
+            return
+        deadline = time.monotonic() + self.lease_wait
+        while True:
+            async with self.lease(key) as acquired:
+                if acquired:
+                    # Пока ждали, значение мог дописать предыдущий владелец
+                    if not await adopt():
+                        await fetch()
+                    return
+                if time.monotonic() >= deadline:
+                    logger.warning("Lease %s занят дольше %.0f с, обновляем сами", key, self.lease_wait)
+                    await fetch()
+                    return
+            await asyncio.sleep(LEASE_POLL_SECONDS)
+            if await adopt():
+                return
+
+    @asynccontextmanager
+    async def periodic(self, key: str, interval: float) -> AsyncIterator[float]:
+        """Периодическая работа, которую на хосте делает один воркер.
+
+        async with cache.periodic(key, interval) as wait: ... — wait == 0:
+        работа за этим воркером (lease держится до выхода из блока, время
+        запуска уже записано); иначе через сколько секунд спросить снова —
+        работу делает или недавно сделал другой воркер.
+        """
+        async with self.lease(key) as acquired:
+            if not acquired:
+                wait = interval
+            else:
+                last = (await self.get_many([key])).get(key)
+                elapsed = interval if last is None else time.time() - last
+                wait = max(interval - elapsed, 0.0)
+                if not wait:
+                    await self.set_many({key: time.time()}, ttl_seconds=interval)
+            yield wait
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "published": self.published,
+            "received": self.received,
+            "leases_acquired": self.leases_acquired,
+            "leases_busy": self.leases_busy,
+        }
+
+
+class MemorySharedCache(SharedCache):
+    """В пределах процесса: то же поведение для одного воркера."""
+
+    backend = "memory"
+
+    def __init__(self, lease_wait_seconds: float = 15.0):
+        super().__init__(lease_wait_seconds)
+        self._data: dict[str, tuple[float, Any]] = {}
+        self._leases: set[str] = set()
+        self._lock = threading.Lock()
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is not None and item[0] > now:
+                    found[key] = item[1]
+        return found
+
+    async def set_many(self, items: Mapping[str, Any], ttl_seconds: float) -> None:
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (expires_at, value)
+
+    @asynccontextmanager
+    async def lease(self, key: str) -> AsyncIterator[bool]:
+        with self._lock:
+            acquired = key not in self._leases
+            self._leases.add(key)
+        if acquired:
+            self.leases_acquired += 1
+        else:
+            self.leases_busy += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._lock:
+                    self._leases.discard(key)
+
+    def publish(self, channel: str, message: Any) -> None:
+        self.published += 1
+        self._deliver(channel, message)
+
+
+class ShmSharedCache(SharedCache):
+    """Файлы на tmpfs, общие для всех процессов хоста.
+
+    Ключей немного (пары курсов, сети комиссий), поэтому значение —
+    отдельный файл. Просроченные файлы раз в SWEEP_SECONDS удаляет
+    слушатель журнала (иначе ключи выбывших пар копились бы на tmpfs).
+    """
+
+    backend = "shm"
+
+    def __init__(
+        self,
+        directory: str,
+        poll_seconds: float = 0.2,
+        log_max_bytes: int = 1 << 20,
+        lease_wait_seconds: float = 15.0,
+    ):
+        super().__init__(lease_wait_seconds)
+        self.dir = Path(directory)
+        self.poll_seconds = poll_seconds
+        self.log_max_bytes = log_max_bytes
+        for sub in ("values", "leases"):
+            (self.dir / sub).mkdir(parents=True, exist_ok=True)
+        self._log_path = self.dir / "events.log"
+        self._log_lock_path = self.dir / "events.lock"
+        self._log_path.touch(exist_ok=True)
+        # Свои события из журнала не применяем повторно
+        self._origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._log = None
+        self._pending = b""
+        self._listener: asyncio.Task | None = None
+        # Дописывания в журнал, ушедшие в пул потоков (см. publish)
+        self._appends: set[asyncio.Future] = set()
+        self.swept = 0
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.dir / kind / hashlib.sha1(key.encode()).hexdigest()
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        now = time.time()
+        found = {}
+        for key in keys:
+            try:
+                expires_at, value = json.loads(self._path("values", key).read_bytes())
+            except (FileNotFoundError, ValueError):
+                continue
+            if expires_at > now:
+                found[key] = value
+        return found
+
+    async def set_many(self, items: Mapping[str, Any], ttl_seconds: float) -> None:
+        expires_at = time.time() + ttl_seconds
+        for key, value in items.items():
+            path = self._path("values", key)
+            tmp = path.with_name(f"{path.name}.{self._origin}.tmp")
+            tmp.write_bytes(json.dumps([expires_at, value]).encode())
+            os.replace(tmp, path)
+
+    @asynccontextmanager
+    async def lease(self, key: str) -> AsyncIterator[bool]:
+        fd = os.open(self._path("leases", key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                self.leases_acquired += 1
+            except BlockingIOError:
+                acquired = False
+                self.leases_busy += 1
+            yield acquired
+        finally:
+            # Закрытие дескриптора снимает flock
+            os.close(fd)
+
+    def publish(self, channel: str, message: Any) -> None:
+        self.published += 1
+        self._deliver(channel, message)
+        line = json.dumps({"origin": self._origin, "channel": channel, "message": message}).encode() + b"\n"
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Не в event loop (поток sync-эндпоинта, CLI): можно и подождать
+            self._append(line)
+            return
+        # flock ждёт другие воркеры — не в потоке event loop. Порядок
+        # событий не важен: инвалидации идемпотентны
+        future = loop.run_in_executor(None, self._append, line)
+        self._appends.add(future)
+        future.add_done_callback(self._append_done)
+
+    def _append_done(self, future: asyncio.Future) -> None:
+        self._appends.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Не удалось записать инвалидацию в журнал", exc_info=future.exception())
+
+    def _append(self, line: bytes) -> None:
+        with open(self._log_lock_path, "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._log_path.stat().st_size + len(line) > self.log_max_bytes:
+                # Ротация под тем же lock, что и запись: читатели дочитывают
+                # старый файл до конца и переходят на новый (см. _drain)
+                tmp = self.dir / f"events.{self._origin}.tmp"
+                tmp.write_bytes(b"")
+                os.replace(tmp, self._log_path)
+            with open(self._log_path, "ab") as log:
+                log.write(line)
+
+    def _dispatch(self, data: bytes) -> None:
+        if not data:
+            return
+        *lines, self._pending = (self._pending + data).split(b"\n")
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get("origin") == self._origin:
+                continue
+            self.received += 1
+            self._deliver(event["channel"], event.get("message"))
+
+    def _drain(self) -> None:
+        self._dispatch(self._log.read())
+        try:
+            current = os.stat(self._log_path).st_ino
+        except FileNotFoundError:
+            return
+        if current != os.fstat(self._log.fileno()).st_ino:
+            # Журнал ротирован: дочитываем старый, новый — с начала. Двух
+            # ротаций за poll_seconds не бывает: это log_max_bytes событий
+            self._dispatch(self._log.read())
+            self._log.close()
+            self._pending = b""
+            self._log = open(self._log_path, "rb")
+            self._dispatch(self._log.read())
+
+    def _sweep(self) -> None:
+        """Удалить просроченные значения и .tmp, брошенные упавшими процессами."""
+        now = time.time()
+        for path in (self.dir / "values").iterdir():
+            try:
+                st = path.stat()
+                if path.suffix == ".tmp":
+                    expired = st.st_mtime < now - SWEEP_SECONDS
+                else:
+                    expires_at, _ = json.loads(path.read_bytes())
+                    expired = expires_at <= now
+                # Файл мог быть заменён свежим значением, пока мы его читали
+                if expired and path.stat().st_mtime_ns == st.st_mtime_ns:
+                    path.unlink()
+                    self.swept += 1
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # Битый файл: перезапишется при следующем set_many
+                continue
+
+    async def _listen(self) -> None:
+        next_sweep = time.monotonic() + SWEEP_SECONDS
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                self._drain()
+            except Exception:
+                logger.exception("Не удалось прочитать журнал инвалидаций")
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + SWEEP_SECONDS
+                try:
+                    await asyncio.to_thread(self._sweep)
+                except Exception:
+                    logger.exception("Не удалось удалить просроченные значения")
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            # События до старта не нужны: кэши процесса ещё пустые
+            self._log = open(self._log_path, "rb")
+            self._log.seek(0, os.SEEK_END)
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._appends:
+            await asyncio.gather(*self._appends, return_exceptions=True)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def stats(self) -> dict[str, Any]:
+        return {**super().stats(), "swept": self.swept, "log_bytes": self._log_path.stat().st_size}
+
+
+def build_shared_cache() -> SharedCache:
+    if settings.CACHE_BACKEND == "shm":
+        return ShmSharedCache(
+            settings.CACHE_SHM_DIR,
+            poll_seconds=settings.CACHE_POLL_SECONDS,
+            lease_wait_seconds=settings.CACHE_LEASE_WAIT_SECONDS,
+        )
+    return MemorySharedCache(lease_wait_seconds=settings.CACHE_LEASE_WAIT_SECONDS)
+
+
+shared_cache = build_shared_cache()
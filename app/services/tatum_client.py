@@ -1,60 +1,390 @@
 from __future__ import annotations
 
-from typing import Literal
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any
 
 import httpx
 from fastapi import HTTPException
 
 from app.core.config import settings
-
-SupportedNetwork = Literal[
-    "BTC",
-    "LTC",
-    "ETH",
-    "USDT_ERC20",
-    "BNB",
-    "TRX",
-    "USDT_TRC20",
-    "TON",
-]
+from app.services.metrics import Counter, registry, track_outbound
+from app.services.network_registry import network_registry
+from app.services.rate_limit import tatum_budget
 
 
 class TatumNotConfigured(Exception):
     pass
 
 
+# Один долгоживущий клиент на процесс: TCP/TLS-рукопожатие с Tatum
+# выполняется один раз, дальше соединения переиспользуются из пула.
+_transport: httpx.AsyncHTTPTransport | None = None
+_client: httpx.AsyncClient | None = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    global _transport
+
+    limits = httpx.Limits(
+        max_connections=settings.TATUM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.TATUM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.TATUM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        settings.TATUM_TIMEOUT,
+        connect=settings.TATUM_CONNECT_TIMEOUT,
+        pool=settings.TATUM_POOL_TIMEOUT,
+    )
+    _transport = httpx.AsyncHTTPTransport(http2=settings.TATUM_HTTP2, limits=limits)
+
+    headers = {}
+    if settings.tatum_api_key:
+        headers["x-api-key"] = settings.tatum_api_key
+
+    return httpx.AsyncClient(
+        transport=_transport,
+        base_url=settings.tatum_base_url.rstrip("/"),
+        headers=headers,
+        timeout=timeout,
+    )
+
+
+async def open_client() -> httpx.AsyncClient:
+    """Создать общий клиент (вызывается из lifespan приложения)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_client() -> None:
+    """Закрыть общий клиент и все соединения пула."""
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _transport = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # Если lifespan не запускался (скрипты, консоль) — создаём клиент лениво.
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+# Запросы, которые сейчас внутри client.request (ждут соединение из пула
+# или уже обслуживаются) — считаем сами, не полагаясь на внутренности httpx
+_in_flight = 0
+
+
+def pool_stats() -> dict[str, Any]:
+    """Текущая загрузка пула соединений к Tatum (для подбора лимитов).
+
+    in_flight и queued_requests считаются по нашим вызовам. Для HTTP/1.1
+    соединение обслуживает один запрос, поэтому всё сверх max_connections
+    ждёт в очереди пула; для HTTP/2 очередь видна только из пула httpcore.
+    Разбивка соединений (connections/active/idle) — тоже из httpcore, по
+    возможности: при смене его внутреннего API поля будут None.
+    """
+    stats: dict[str, Any] = {
+        "http2": settings.TATUM_HTTP2,
+        "max_connections": settings.TATUM_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.TATUM_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": settings.TATUM_KEEPALIVE_EXPIRY,
+        "in_flight": _in_flight,
+        "queued_requests": None if settings.TATUM_HTTP2 else max(_in_flight - settings.TATUM_MAX_CONNECTIONS, 0),
+        "connections": None,
+        "active": None,
+        "idle": None,
+        "http2_connections": None,
+    }
+    pool = getattr(_transport, "_pool", None)
+    if _client is None or _client.is_closed or pool is None:
+        return stats
+
+    try:
+        connections = list(pool.connections)
+        stats["connections"] = len(connections)
+        stats["idle"] = sum(1 for conn in connections if conn.is_idle())
+        stats["active"] = stats["connections"] - stats["idle"]
+        stats["http2_connections"] = sum(1 for conn in connections if "HTTP/2" in conn.info())
+        if settings.TATUM_HTTP2:
+            # Запросы, которым пул ещё не назначил соединение
+            stats["queued_requests"] = sum(1 for r in pool._requests if r.connection is None)
+    except Exception:
+        pass
+    return stats
+
+
+# --- circuit breaker ----------------------------------------------------
+
+breaker_rejections = registry.register(
+    Counter("tatum_breaker_rejections_total", "Вызовы Tatum, отклонённые открытым breaker", ("chain",))
+)
+
+
+class CircuitBreaker:
+    """Breaker на одну сеть Tatum.
+
+    Исходы считаются в скользящем окне `window_seconds` (корзины по секунде).
+    Если запросов в окне не меньше `min_requests` и доля ошибок достигла
+    `error_rate`, breaker открывается и `open_seconds` сразу отказывает.
+    Потом пропускает один пробный запрос (half-open): успех закрывает
+    breaker, ошибка снова открывает. Работает только из event loop.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window_seconds: float, min_requests: int, error_rate: float, open_seconds: float):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probe_in_flight = False
+        # [секунда, всего, ошибок]
+        self._buckets: deque[list[int]] = deque()
+
+    def _trim(self, now: float) -> None:
+        horizon = int(now - self.window_seconds)
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+
+    def _counts(self, now: float) -> tuple[int, int]:
+        self._trim(now)
+        return sum(b[1] for b in self._buckets), sum(b[2] for b in self._buckets)
+
+    def retry_after(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(self.opened_at + self.open_seconds - now, 0.0)
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if self.retry_after(now) > 0:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                self.state = self.CLOSED
+                self._buckets.clear()
+            else:
+                self._open(now)
+            return
+
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        if not ok:
+            bucket[2] += 1
+            total, errors = self._counts(now)
+            if self.state == self.CLOSED and total >= self.min_requests and errors / total >= self.error_rate:
+                self._open(now)
+
+    def release(self) -> None:
+        """Пробный запрос не состоялся (например, истёк дедлайн) — не считаем его."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self, now: float) -> None:
+        self.state = self.OPEN
+        self.opened_at = now
+        self.opens += 1
+        self._buckets.clear()
+
+    def stats(self) -> dict[str, Any]:
+        total, errors = self._counts(time.monotonic())
+        return {
+            "state": self.state,
+            "requests_in_window": total,
+            "errors_in_window": errors,
+            "opens": self.opens,
+            "retry_after": round(self.retry_after(), 3) if self.state == self.OPEN else 0.0,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(chain: str) -> CircuitBreaker:
+    breaker = _breakers.get(chain)
+    if breaker is None:
+        breaker = _breakers[chain] = CircuitBreaker(
+            window_seconds=settings.TATUM_BREAKER_WINDOW_SECONDS,
+            min_requests=settings.TATUM_BREAKER_MIN_REQUESTS,
+            error_rate=settings.TATUM_BREAKER_ERROR_RATE,
+            open_seconds=settings.TATUM_BREAKER_OPEN_SECONDS,
+        )
+    return breaker
+
+
+def breaker_stats() -> dict[str, dict[str, Any]]:
+    """Состояние breaker-ов по сетям Tatum (для мониторинга)."""
+    return {chain: b.stats() for chain, b in sorted(_breakers.items())}
+
+
+def breaker_open(network: str) -> bool:
+    """Открыт ли breaker сети: вызовы будут отклонены без обращения к Tatum."""
+    breaker = _breakers.get(network_registry.chain(network))
+    return breaker is not None and breaker.state == CircuitBreaker.OPEN and breaker.retry_after() > 0
+
+
+# --- дедлайны и повторы -------------------------------------------------
+
+def deadline_after(seconds: float | None) -> float | None:
+    """Абсолютный дедлайн (time.monotonic) через `seconds`; None — без дедлайна."""
+    return None if seconds is None else time.monotonic() + seconds
+
+
+def _retryable(resp: httpx.Response | None) -> bool:
+    # None — транспортная ошибка (таймаут, обрыв соединения)
+    return resp is None or resp.status_code >= 500 or resp.status_code == 429
+
+
+def _backoff(attempt: int) -> float:
+    # Экспоненциальная задержка с full jitter
+    cap = min(settings.TATUM_RETRY_MAX_SECONDS, settings.TATUM_RETRY_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _deadline_exceeded(chain: str) -> HTTPException:
+    return HTTPException(status_code=504, detail=f"Истёк дедлайн запроса к Tatum ({chain})")
+
+
+async def _request(
+    chain: str,
+    endpoint: str,
+    method: str,
+    path: str,
+    *,
+    deadline: float | None = None,
+    retries: int = 0,
+    **kwargs,
+) -> httpx.Response:
+    """HTTP-вызов Tatum через breaker сети, с дедлайном и повторами.
+
+    Каждая попытка берёт токен из общего бюджета Tatum (tatum_budget).
+    Повторы (`retries`) — только для идемпотентных чтений. Каждая попытка
+    получает таймаут не больше остатка до `deadline`, так что исходящий
+    вызов не переживёт входящий запрос. Ответы 5xx/429 после исчерпания
+    повторов возвращаются как есть, транспортные ошибки пробрасываются.
+    """
+    global _in_flight
+    breaker = get_breaker(chain)
+    client = get_client()
+    attempt = 0
+    while True:
+        # Сначала очередь общего бюджета, чтобы не держать пробу half-open на ожидании
+        await tatum_budget.acquire(deadline)
+        if not breaker.allow():
+            breaker_rejections.inc(chain)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Tatum ({chain}) временно недоступен",
+                headers={"Retry-After": str(max(1, round(breaker.retry_after())))},
+            )
+
+        timeout = client.timeout
+        shortened = False
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                breaker.release()
+                raise _deadline_exceeded(chain)
+            if remaining < settings.TATUM_TIMEOUT:
+                shortened = True
+                timeout = httpx.Timeout(
+                    remaining,
+                    connect=min(settings.TATUM_CONNECT_TIMEOUT, remaining),
+                    pool=min(settings.TATUM_POOL_TIMEOUT, remaining),
+                )
+
+        resp: httpx.Response | None = None
+        error: Exception | None = None
+        with track_outbound("tatum", chain, endpoint) as call:
+            _in_flight += 1
+            try:
+                resp = await client.request(method, path, timeout=timeout, **kwargs)
+                call.outcome = _outcome(resp.status_code)
+            except httpx.TimeoutException as exc:
+                call.outcome = "timeout"
+                error = exc
+            except httpx.TransportError as exc:
+                call.outcome = "error"
+                error = exc
+            except BaseException:
+                # Отмена (клиент ушёл) и прочее — не исход Tatum, пробу освобождаем
+                breaker.release()
+                raise
+            finally:
+                _in_flight -= 1
+
+        if isinstance(error, httpx.TimeoutException) and shortened:
+            # Упёрлись в собственный дедлайн, а не в медленный Tatum
+            breaker.release()
+            raise _deadline_exceeded(chain) from error
+        breaker.record(ok=not _retryable(resp))
+
+        if not _retryable(resp) or attempt >= retries:
+            if error is not None:
+                raise error
+            return resp
+
+        delay = _backoff(attempt)
+        attempt += 1
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            # На ещё одну попытку времени не осталось
+            if error is not None:
+                raise error
+            return resp
+        await asyncio.sleep(delay)
+
+
 def _require_tatum():
     if not settings.tatum_api_key:
         raise TatumNotConfigured("TATUM_API_KEY не задан, интеграция с Tatum отключена")
 
 
-def _chain_from_network(network: str) -> str:
-    n = network.upper()
-    if n in {"BTC"}:
-        return "bitcoin"
-    if n in {"LTC"}:
-        return "litecoin"
-    if n in {"ETH", "USDT_ERC20"}:
-        return "ethereum"
-    if n in {"BNB"}:
-        return "bsc"
-    if n in {"TRX", "USDT_TRC20"}:
-        return "tron"
-    if n in {"TON"}:
-        return "ton"
-    raise ValueError(f"Unsupported network for Tatum: {network}")
-
-
-async def broadcast_signed_tx(network: str, signed_tx: str) -> str:
+def _outcome(status_code: int) -> str:
+    if status_code == 404:
+        return "not_found"
+    if status_code >= 500:
+        return "http_5xx"
+    if status_code >= 400:
+        return "http_4xx"
+    return "ok"
+
+
+async def broadcast_signed_tx(network: str, signed_tx: str, deadline: float | None = None) -> str:
     """Отправить уже подписанную транзакцию в Tatum.
 
     Для UTXO-сетей (BTC/LTC) используется /v3/bitcoin|litecoin/broadcast с txData.
     Для EVM (ETH/BNB) и Tron/TON используются соответствующие *broadcast*-эндпоинты.
     См. актуальную документацию Tatum для точных путей и полей.
+
+    `deadline` — момент time.monotonic(), позже которого вызов не ждём (504).
+    При открытом breaker сети — сразу 503 с Retry-After.
     """
     _require_tatum()
-    chain = _chain_from_network(network)
-    base = settings.tatum_base_url.rstrip("/")
+    chain = network_registry.chain(network)
 
     # Подбираем endpoint по chain
     if chain in {"bitcoin", "litecoin"}:
@@ -73,17 +403,15 @@ async def broadcast_signed_tx(network: str, signed_tx: str) -> str:
     else:
         raise ValueError(f"Unsupported chain: {chain}")
 
-    headers = {"x-api-key": settings.tatum_api_key}
-
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.post(f"{base}{path}", json=payload, headers=headers)
-        if resp.status_code >= 400:
-            try:
-                detail = resp.json()
-            except Exception:
-                detail = resp.text
-            raise HTTPException(status_code=502, detail={"tatum_error": detail})
-        data = resp.json()
+    # Отправка не идемпотентна на нашей стороне — без повторов
+    resp = await _request(chain, "broadcast", "POST", path, deadline=deadline, json=payload)
+    if resp.status_code >= 400:
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise HTTPException(status_code=502, detail={"tatum_error": detail})
+    data = resp.json()
 
     # В большинстве эндпоинтов Tatum хеш транзакции лежит в поле txId или txHash
     tx_hash = data.get("txId") or data.get("txHash") or data.get("hash")
@@ -93,7 +421,7 @@ async def broadcast_signed_tx(network: str, signed_tx: str) -> str:
     return tx_hash
 
 
-async def get_tx_status(network: str, tx_hash: str) -> str:
+async def get_tx_status(network: str, tx_hash: str, deadline: float | None = None) -> str:
     """Получить статус транзакции через Tatum.
 
     Здесь мы используем простую эвристику:
@@ -103,11 +431,12 @@ async def get_tx_status(network: str, tx_hash: str) -> str:
 
     Точные эндпоинты и поля зависят от конкретной сети, этот код можно
     детализировать под требования продакшена.
+
+    Чтение идемпотентно, поэтому таймауты, 5xx и 429 повторяются
+    (TATUM_STATUS_RETRIES, с jitter) в пределах `deadline`.
     """
     _require_tatum()
-    chain = _chain_from_network(network)
-    base = settings.tatum_base_url.rstrip("/")
-    headers = {"x-api-key": settings.tatum_api_key}
+    chain = network_registry.chain(network)
 
     # Простейший вариант: использовать /v3/{chain}/transaction/{hash} где доступно.
     if chain in {"bitcoin", "litecoin"}:
@@ -121,14 +450,15 @@ async def get_tx_status(network: str, tx_hash: str) -> str:
     else:
         raise ValueError(f"Unsupported chain: {chain}")
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(f"{base}{path}", headers=headers)
-        if resp.status_code == 404:
-            return "pending"
-        if resp.status_code >= 400:
-            # В спорных случаях не ломаем API, просто оставляем pending
-            return "pending"
-        data = resp.json()
+    resp = await _request(
+        chain, "status", "GET", path, deadline=deadline, retries=settings.TATUM_STATUS_RETRIES
+    )
+    if resp.status_code == 404:
+        return "pending"
+    if resp.status_code >= 400:
+        # В спорных случаях не ломаем API, просто оставляем pending
+        return "pending"
+    data = resp.json()
 
     # Очень грубая нормализация статуса
     status = "pending"
@@ -145,3 +475,30 @@ async def get_tx_status(network: str, tx_hash: str) -> str:
                 break
 
     return status
+
+
+# Сети, для которых у Tatum есть рекомендованные комиссии (/v3/blockchain/fee)
+FEE_SYMBOLS = {"bitcoin": "BTC", "litecoin": "LTC", "ethereum": "ETH", "bsc": "BSC"}
+
+
+async def get_blockchain_fees(chain: str) -> dict[str, float]:
+    """Рекомендованные комиссии сети: {"slow", "medium", "fast"}.
+
+    Единицы — как у Tatum: сатоши за байт для BTC/LTC, wei за единицу газа
+    для ETH/BSC. Ошибка Tatum — HTTPException 502.
+    """
+    _require_tatum()
+    symbol = FEE_SYMBOLS.get(chain)
+    if symbol is None:
+        raise ValueError(f"Tatum не отдаёт комиссии для сети: {chain}")
+
+    resp = await _request(
+        chain, "fee", "GET", f"/v3/blockchain/fee/{symbol}", retries=settings.TATUM_STATUS_RETRIES
+    )
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=502, detail={"tatum_error": resp.text})
+    data = resp.json()
+    try:
+        return {tier: float(data[tier]) for tier in ("slow", "medium", "fast")}
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=502, detail={"tatum_response": data})
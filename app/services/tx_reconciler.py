@@ -0,0 +1,182 @@
+"""Фоновая сверка статусов pending-транзакций с Tatum.
+
+Вместо опроса Tatum на каждый GET /tx/{network}/{tx_hash} воркер сам
+периодически проходит по транзакциям со статусом 'pending', пачками
+опрашивает Tatum с ограниченной конкурентностью и одним запросом
+записывает изменившиеся статусы. Reconciler запущен в каждом воркере, но
+сеть за интервал сверяет один из них (shared_cache.periodic).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import bindparam, select, update
+
+from app import models
+from app.core.config import settings
+from app.db import SessionLocal
+from app.services import tatum_client
+from app.services.event_hub import publish_tx_status
+from app.services.network_registry import network_registry
+from app.services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _load_pending(network_code: str, after_id: int, limit: int) -> list[tuple[int, str]]:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.Transaction.id, models.Transaction.tx_hash)
+            .where(
+                models.Transaction.status == "pending",
+                models.Transaction.network_code == network_code,
+                models.Transaction.id > after_id,
+            )
+            .order_by(models.Transaction.id)
+            .limit(limit)
+        ).all()
+        return [(row.id, row.tx_hash) for row in rows]
+    finally:
+        db.close()
+
+
+def _store_statuses(changes: list[dict]) -> list[dict]:
+    """Записать новые статусы; вернуть те, что действительно в БД.
+
+    Обновляем только всё ещё pending-строки: финальный статус, который
+    параллельно записал GET /tx?refresh=true, сверка не перетирает.
+    """
+    if not changes:
+        return []
+    tx = models.Transaction.__table__
+    stmt = (
+        update(tx)
+        .where(tx.c.id == bindparam("b_id"), tx.c.status == "pending")
+        .values(status=bindparam("b_status"))
+    )
+    db = SessionLocal()
+    try:
+        # Один UPDATE на пачку (executemany)
+        db.execute(stmt, [{"b_id": c["id"], "b_status": c["status"]} for c in changes])
+        stored = dict(
+            db.execute(select(tx.c.id, tx.c.status).where(tx.c.id.in_([c["id"] for c in changes]))).all()
+        )
+        db.commit()
+    finally:
+        db.close()
+    return [c for c in changes if stored.get(c["id"]) == c["status"]]
+
+
+class TxReconciler:
+    def __init__(
+        self,
+        overrides: dict[str, float] | None = None,
+        default_interval: float = 30.0,
+        batch_size: int = 200,
+        concurrency: int = 10,
+        tick_seconds: float = 5.0,
+    ):
+        self.overrides = {k.upper(): v for k, v in (overrides or {}).items()}
+        self.default_interval = default_interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.tick_seconds = tick_seconds
+        self._next_run: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def intervals(self) -> dict[str, float]:
+        """Интервал сверки по сетям справочника, у которых есть сеть Tatum."""
+        return {
+            info.code: self.overrides.get(info.code) or info.reconcile_interval or self.default_interval
+            for info in network_registry.all()
+            if info.chain
+        }
+
+    async def _poll(self, sem: asyncio.Semaphore, net: str, tx_id: int, tx_hash: str) -> dict | None:
+        async with sem:
+            try:
+                status = await tatum_client.get_tx_status(net, tx_hash)
+            except Exception as exc:
+                logger.warning("Не удалось получить статус %s/%s: %s", net, tx_hash, exc)
+                return None
+        if status and status != "pending":
+            return {"id": tx_id, "status": status}
+        return None
+
+    async def reconcile_network(self, net: str) -> int:
+        """Пройти все pending-транзакции сети, вернуть число обновлённых."""
+        sem = asyncio.Semaphore(self.concurrency)
+        updated = 0
+        after_id = 0
+        while True:
+            if tatum_client.breaker_open(net):
+                # Tatum по этой сети лежит — не тратим пачку на мгновенные отказы
+                logger.warning("Сверка %s пропущена: breaker Tatum открыт", net)
+                break
+            batch = await asyncio.to_thread(_load_pending, net, after_id, self.batch_size)
+            if not batch:
+                break
+            after_id = batch[-1][0]
+
+            results = await asyncio.gather(
+                *(self._poll(sem, net, tx_id, tx_hash) for tx_id, tx_hash in batch)
+            )
+            changes = await asyncio.to_thread(_store_statuses, [r for r in results if r is not None])
+            hashes = dict(batch)
+            for change in changes:
+                publish_tx_status(net, hashes[change["id"]], change["status"])
+            updated += len(changes)
+
+            if len(batch) < self.batch_size:
+                break
+        return updated
+
+    async def run_once(self) -> int:
+        updated = 0
+        now = time.monotonic()
+        # Справочник читаем на каждом тике: после SIGHUP новые сети и
+        # интервалы подхватываются без рестарта
+        for net, interval in self.intervals().items():
+            if self._next_run.get(net, 0.0) > now:
+                continue
+            try:
+                # Из воркеров хоста сеть сверяет один: трафик к Tatum не
+                # растёт с числом воркеров
+                async with shared_cache.periodic(f"reconcile:{net}", interval) as wait:
+                    self._next_run[net] = time.monotonic() + (wait or interval)
+                    if not wait:
+                        updated += await self.reconcile_network(net)
+            except Exception:
+                logger.exception("Ошибка сверки транзакций сети %s", net)
+        return updated
+
+    async def _run_forever(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+tx_reconciler = TxReconciler(
+    overrides=settings.RECONCILER_INTERVALS,
+    default_interval=settings.RECONCILER_DEFAULT_INTERVAL_SECONDS,
+    batch_size=settings.RECONCILER_BATCH_SIZE,
+    concurrency=settings.RECONCILER_CONCURRENCY,
+    tick_seconds=settings.RECONCILER_TICK_SECONDS,
+)
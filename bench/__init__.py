@@ -0,0 +1 @@
+# Нагрузочные сценарии и бенчмарки (запускаются как `python -m bench.<имя>`)
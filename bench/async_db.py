@@ -0,0 +1,153 @@
+"""Смешанная нагрузка: влияние блокирующих запросов к БД на event loop.
+
+Приложение `main:app` запускается в том же процессе (httpx + ASGITransport)
+на временной SQLite. Каждому SQL-запросу добавляется искусственная задержка
+(`--db-latency-ms`), которая выполняется в том потоке, где реально работает
+драйвер: для синхронной сессии в async-эндпоинте это поток event loop,
+для AsyncSession — поток aiosqlite. Маршрут `GET /` в БД не ходит, поэтому
+его p99 показывает, насколько event loop блокируется чужими запросами.
+
+    python -m bench.async_db --concurrency 50 --duration 10 --db-latency-ms 5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+
+def _inject_latency(seconds: float) -> None:
+    from sqlalchemy import event
+
+    import app.db as db
+
+    def _on_connect(dbapi_conn, _record):
+        # sqlite3.Connection напрямую или через обёртки aiosqlite
+        raw = getattr(dbapi_conn, "driver_connection", dbapi_conn)
+        raw = getattr(raw, "_conn", raw)
+        raw.set_trace_callback(lambda _sql: time.sleep(seconds))
+
+    event.listen(db.engine, "connect", _on_connect)
+    async_engine = getattr(db, "async_engine", None)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "connect", _on_connect)
+
+
+def _seed(n_tx: int) -> tuple[str, list[str]]:
+    import init_db
+    from app import models
+    from app.db import SessionLocal
+    from app.services.security import create_access_token, get_password_hash
+
+    init_db.init_db()
+    db = SessionLocal()
+    try:
+        maker = models.User(email="maker@bench.local", hashed_password=get_password_hash("x"))
+        taker = models.User(email="taker@bench.local", hashed_password=get_password_hash("x"))
+        db.add_all([maker, taker])
+        db.flush()
+        hashes = [f"{i:064x}" for i in range(n_tx)]
+        db.add_all(
+            models.Transaction(network_code="BTC", tx_hash=h, signed_tx=h, status="pending")
+            for h in hashes
+        )
+        db.add_all(
+            models.P2POrder(
+                maker_id=maker.id,
+                side="sell",
+                fiat_currency="USD",
+                crypto_currency="BTC",
+                amount=1.0,
+                price=100.0 + i,
+            )
+            for i in range(20)
+        )
+        db.commit()
+        token = create_access_token(subject=taker.id)
+    finally:
+        db.close()
+    return token, hashes
+
+
+async def _run(args) -> dict:
+    import httpx
+
+    import main
+    from bench.report import Recorder, build_report
+
+    token, hashes = _seed(args.transactions)
+    headers = {"Authorization": f"Bearer {token}"}
+    prefix = "/api/v1"
+
+    mix = [
+        ("GET /tx/{network}/{tx_hash}", 0.5),
+        ("GET /orders", 0.3),
+        ("GET /", 0.2),
+    ]
+    routes, weights = zip(*mix)
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one(route: str) -> None:
+            if route == "GET /":
+                req = client.get("/")
+            elif route == "GET /orders":
+                req = client.get(f"{prefix}/orders", headers=headers)
+            else:
+                req = client.get(f"{prefix}/tx/BTC/{random.choice(hashes)}")
+            started = time.perf_counter()
+            resp = await req
+            recorder.record(route, time.perf_counter() - started, ok=resp.status_code < 400)
+
+        deadline = time.perf_counter() + args.duration
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                await one(random.choices(routes, weights)[0])
+
+        recorder = Recorder()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        recorder.stop()
+
+    config = {
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "db_latency_ms": args.db_latency_ms,
+        "transactions": args.transactions,
+    }
+    return build_report(recorder.summary(), config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--transactions", type=int, default=1000)
+    parser.add_argument("--json", dest="json_path", help="куда записать JSON-отчёт ('-' — stdout)")
+    args = parser.parse_args()
+
+    from bench.report import print_table, write_json
+
+    # Настройки читаются при импорте app.*, поэтому окружение готовим заранее
+    tmpdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["DB_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ.pop("TATUM_API_KEY", None)
+    # Меряем сервис, а не лимиты на одного пользователя
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    _inject_latency(args.db_latency_ms / 1000)
+    report = asyncio.run(_run(args))
+
+    if args.json_path:
+        write_json(report, args.json_path)
+    if args.json_path != "-":
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Сравнение двух JSON-отчётов bench.load (например, двух коммитов).
+
+    python -m bench.compare base.json head.json --threshold 10
+
+Код возврата 1, если p95/p99 какого-либо маршрута выросли больше чем
+на threshold процентов или появились новые ошибки.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _delta(base: float, head: float) -> float:
+    if base == 0:
+        return 0.0 if head == 0 else float("inf")
+    return (head - base) / base * 100
+
+
+def compare(base: dict, head: dict, threshold: float) -> list[str]:
+    regressions = []
+    print(f"base {base.get('revision')}  ->  head {head.get('revision')}")
+    print(f"{'route':44} {'p95 base':>9} {'p95 head':>9} {'Δ%':>7} {'p99 base':>9} {'p99 head':>9} {'Δ%':>7}")
+    for route in sorted(set(base["routes"]) | set(head["routes"])):
+        b = base["routes"].get(route)
+        h = head["routes"].get(route)
+        if b is None or h is None:
+            print(f"{route:44} {'-' if b is None else 'only in base':>9}")
+            continue
+        d95 = _delta(b["p95_ms"], h["p95_ms"])
+        d99 = _delta(b["p99_ms"], h["p99_ms"])
+        print(
+            f"{route:44} {b['p95_ms']:>9} {h['p95_ms']:>9} {d95:>7.1f} "
+            f"{b['p99_ms']:>9} {h['p99_ms']:>9} {d99:>7.1f}"
+        )
+        if d95 > threshold or d99 > threshold:
+            regressions.append(f"{route}: p95 {d95:+.1f}%, p99 {d99:+.1f}%")
+        b_err = b["errors"] / b["count"] if b["count"] else 0
+        h_err = h["errors"] / h["count"] if h["count"] else 0
+        if h_err > b_err:
+            regressions.append(f"{route}: доля ошибок {b_err:.2%} -> {h_err:.2%}")
+    print(f"throughput: {base.get('throughput_rps')} -> {head.get('throughput_rps')} rps")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимый рост p95/p99, %%")
+    args = parser.parse_args()
+
+    regressions = compare(_load(args.base), _load(args.head), args.threshold)
+    if regressions:
+        print("\nРегрессии:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Нагрузочный прогон `main:app` против локальных заглушек Tatum и CoinGecko.
+
+Приложение работает в этом же процессе (httpx + ASGITransport, с настоящим
+lifespan), исходящие вызовы уходят в bench.stubs. Виртуальные пользователи
+крутят смесь сценариев:
+
+- p2p       — create -> list -> accept -> confirm x2 -> history;
+- broadcast — POST /tx/broadcast;
+- batch     — POST /tx/broadcast/batch;
+- status    — GET /tx/{network}/{tx_hash} (часть с ?refresh=true);
+- rates     — GET /rates.
+
+Отчёт: throughput и p50/p95/p99 по маршрутам; `--json out.json` пишет его
+в машиночитаемом виде для сравнения через `python -m bench.compare`.
+
+    python -m bench.load --duration 30 --concurrency 50 --mix p2p=1,status=5,rates=2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+
+SCENARIOS = ("p2p", "broadcast", "batch", "status", "rates")
+NETWORKS = ("BTC", "ETH", "TRX", "TON", "LTC", "BNB", "USDT_TRC20", "USDT_ERC20")
+PREFIX = "/api/v1"
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _seed(users: int, transactions: int) -> tuple[list[str], list[tuple[str, str]]]:
+    import init_db
+    from app import models
+    from app.db import SessionLocal
+    from app.services.security import create_access_token, get_password_hash
+
+    init_db.init_db()
+    db = SessionLocal()
+    try:
+        # bcrypt дорогой, поэтому один хеш на всех
+        hashed = get_password_hash("bench")
+        rows = [models.User(email=f"u{i}@bench.local", hashed_password=hashed) for i in range(users)]
+        db.add_all(rows)
+        db.flush()
+        tokens = [create_access_token(subject=u.id) for u in rows]
+
+        txs = [(random.choice(NETWORKS), uuid.uuid4().hex * 2) for _ in range(transactions)]
+        db.add_all(
+            models.Transaction(network_code=net, tx_hash=h, signed_tx=h, status="pending")
+            for net, h in txs
+        )
+        db.commit()
+    finally:
+        db.close()
+    return tokens, txs
+
+
+class LoadRun:
+    def __init__(self, client, recorder, tokens: list[str], txs: list[tuple[str, str]], refresh_ratio: float):
+        self.client = client
+        self.recorder = recorder
+        self.tokens = tokens
+        self.txs = txs
+        self.refresh_ratio = refresh_ratio
+
+    def _auth(self, token: str) -> dict[str, str]:
+        return {"Authorization": f"Bearer {token}"}
+
+    async def call(self, label: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.recorder.record(label, time.perf_counter() - started, ok=False)
+            return None
+        self.recorder.record(label, time.perf_counter() - started, ok=resp.status_code < 400)
+        return resp if resp.status_code < 400 else None
+
+    async def p2p(self, worker: int) -> None:
+        maker = self._auth(self.tokens[worker % len(self.tokens)])
+        taker = self._auth(self.tokens[(worker + 1) % len(self.tokens)])
+        order = {
+            "side": random.choice(("buy", "sell")),
+            "fiat_currency": random.choice(("USD", "EUR", "RUB")),
+            "crypto_currency": random.choice(("BTC", "ETH", "USDT")),
+            "amount": round(random.uniform(0.01, 5), 4),
+            "price": round(random.uniform(90, 110), 2),
+        }
+        resp = await self.call("POST /p2p/orders", "POST", f"{PREFIX}/orders", json=order, headers=maker)
+        if resp is None:
+            return
+        order_id = resp.json()["id"]
+        await self.call(
+            "GET /p2p/orders",
+            "GET",
+            f"{PREFIX}/orders",
+            params={"crypto_currency": order["crypto_currency"], "fiat_currency": order["fiat_currency"]},
+            headers=taker,
+        )
+        if await self.call("POST /p2p/orders/{id}/accept", "POST", f"{PREFIX}/orders/{order_id}/accept", headers=taker) is None:
+            return
+        await self.call("POST /p2p/orders/{id}/confirm", "POST", f"{PREFIX}/orders/{order_id}/confirm", headers=maker)
+        await self.call("POST /p2p/orders/{id}/confirm", "POST", f"{PREFIX}/orders/{order_id}/confirm", headers=taker)
+        await self.call("GET /p2p/history", "GET", f"{PREFIX}/history", headers=maker)
+
+    async def broadcast(self, worker: int) -> None:
+        body = {"network": random.choice(NETWORKS), "signed_tx": uuid.uuid4().hex}
+        resp = await self.call(
+            "POST /tx/broadcast",
+            "POST",
+            f"{PREFIX}/tx/broadcast",
+            json=body,
+            headers=self._auth(self.tokens[worker % len(self.tokens)]),
+        )
+        if resp is not None:
+            data = resp.json()
+            self.txs.append((data["network"], data["tx_hash"]))
+
+    async def batch(self, worker: int) -> None:
+        items = [{"network": random.choice(NETWORKS), "signed_tx": uuid.uuid4().hex} for _ in range(20)]
+        await self.call(
+            "POST /tx/broadcast/batch",
+            "POST",
+            f"{PREFIX}/tx/broadcast/batch",
+            json={"items": items},
+            headers=self._auth(self.tokens[worker % len(self.tokens)]),
+        )
+
+    async def status(self, worker: int) -> None:
+        net, tx_hash = random.choice(self.txs)
+        params = {"refresh": "true"} if random.random() < self.refresh_ratio else None
+        label = "GET /tx/{network}/{tx_hash}" + ("?refresh" if params else "")
+        await self.call(label, "GET", f"{PREFIX}/tx/{net}/{tx_hash}", params=params)
+
+    async def rates(self, worker: int) -> None:
+        await self.call("GET /rates", "GET", f"{PREFIX}/rates")
+
+
+async def _run(args) -> dict:
+    import httpx
+
+    import main
+    from bench.report import Recorder, build_report
+
+    tokens, txs = _seed(args.users, args.transactions)
+    names, weights = zip(*args.mix.items())
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            recorder = Recorder()
+            run = LoadRun(client, recorder, tokens, txs, args.refresh_ratio)
+            deadline = time.perf_counter() + args.duration
+
+            async def worker(n: int) -> None:
+                while time.perf_counter() < deadline:
+                    scenario = random.choices(names, weights)[0]
+                    await getattr(run, scenario)(n)
+
+            await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+            recorder.stop()
+
+    config = {
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "users": args.users,
+        "transactions": args.transactions,
+        "refresh_ratio": args.refresh_ratio,
+        "tatum": {"latency_ms": args.tatum_latency_ms, "error_rate": args.tatum_error_rate},
+        "coingecko": {"latency_ms": args.coingecko_latency_ms, "error_rate": args.coingecko_error_rate},
+        "db_url": os.environ["DB_URL"],
+    }
+    return build_report(recorder.summary(), config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("p2p=1,broadcast=1,batch=0.1,status=4,rates=2"))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=2000)
+    parser.add_argument("--refresh-ratio", type=float, default=0.05, help="доля статус-запросов с ?refresh=true")
+    parser.add_argument("--tatum-latency-ms", type=float, default=80.0)
+    parser.add_argument("--tatum-error-rate", type=float, default=0.01)
+    parser.add_argument("--coingecko-latency-ms", type=float, default=150.0)
+    parser.add_argument("--coingecko-error-rate", type=float, default=0.02)
+    parser.add_argument("--db-url", help="по умолчанию — временная SQLite")
+    parser.add_argument("--json", dest="json_path", help="куда записать JSON-отчёт ('-' — stdout)")
+    args = parser.parse_args()
+
+    from bench.report import print_table, write_json
+    from bench.stubs import StubServer, UpstreamProfile, build_stub_app
+
+    stub = StubServer(
+        build_stub_app(
+            tatum=UpstreamProfile(latency_ms=args.tatum_latency_ms, error_rate=args.tatum_error_rate),
+            coingecko=UpstreamProfile(latency_ms=args.coingecko_latency_ms, error_rate=args.coingecko_error_rate),
+        )
+    ).start()
+
+    # Настройки читаются при импорте app.*, поэтому окружение готовим заранее
+    os.environ["DB_URL"] = args.db_url or f"sqlite:///{tempfile.mkdtemp(prefix='bench-')}/bench.db"
+    os.environ["TATUM_API_KEY"] = "bench"
+    os.environ["TATUM_BASE_URL"] = stub.base_url
+    os.environ["COINGECKO_BASE_URL"] = f"{stub.base_url}/api/v3"
+    # Меряем сервис, а не лимиты на пользователя и бюджет Tatum
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ["TATUM_BUDGET_PER_SECOND"] = "0"
+
+    try:
+        report = asyncio.run(_run(args))
+    finally:
+        stub.stop()
+
+    if args.json_path:
+        write_json(report, args.json_path)
+    if args.json_path != "-":
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
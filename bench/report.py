@@ -0,0 +1,110 @@
+"""Сбор латентностей и отчёт по маршрутам (таблица и JSON)."""
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))
+    return values[idx]
+
+
+class Recorder:
+    """Латентности и ошибки по меткам маршрутов."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def stop(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def summary(self) -> dict[str, Any]:
+        elapsed = self.elapsed
+        routes = {}
+        for route in sorted(self.latencies):
+            values = self.latencies[route]
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "total_requests": total,
+            "total_errors": sum(r["errors"] for r in routes.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def build_report(summary: dict[str, Any], config: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "config": config,
+        **summary,
+    }
+
+
+def print_table(report: dict[str, Any]) -> None:
+    print(f"{'route':44} {'count':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, r in report["routes"].items():
+        print(
+            f"{route:44} {r['count']:>7} {r['errors']:>5} {r['rps']:>8} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}"
+        )
+    if "throughput_rps" in report:
+        print(
+            f"total: {report['total_requests']} req, {report['total_errors']} err, "
+            f"{report['throughput_rps']} rps за {report['elapsed_s']} s"
+        )
+
+
+def write_json(report: dict[str, Any], path: str | None) -> None:
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path in (None, "-"):
+        print(text)
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(text + "\n")
@@ -0,0 +1,136 @@
+"""Сериализация списков P2P-ордеров: ORM + Pydantic против кортежей + orjson.
+
+Засеваем столько активных ордеров, сколько нужно самому большому размеру
+из `--sizes`, и для каждого размера меряем два пути целиком (запрос + JSON) и отдельно только кодирование:
+
+- orm    — ORM-объекты, затем то, что делает FastAPI с response_model:
+           validate_python(from_attributes=True) по list[P2POrderOut] и dump_json;
+- rows   — кортежи колонок P2POrderOut и fast_json.dumps_rows (текущие
+           GET /orders и GET /history).
+
+Оба пути должны давать одинаковые байты — это проверяется на каждом размере.
+
+    python -m bench.serialization --sizes 100,1000,10000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def _seed(orders: int) -> None:
+    import init_db
+    from app import models
+    from app.db import SessionLocal, engine
+    from app.services.security import get_password_hash
+
+    init_db.init_db()
+    db = SessionLocal()
+    try:
+        maker = models.User(email="maker@serialization.local", hashed_password=get_password_hash("bench"))
+        db.add(maker)
+        db.commit()
+        maker_id = maker.id
+    finally:
+        db.close()
+
+    started = datetime(2024, 1, 1)
+    rows = [
+        {
+            "maker_id": maker_id,
+            "side": "sell" if n % 2 else "buy",
+            "fiat_currency": "USD",
+            "crypto_currency": "BTC",
+            "amount": 0.001 * (n % 997 + 1),
+            "price": 60000 + n % 1000 + 0.25,
+            "status": "active",
+            "maker_confirmed": False,
+            "taker_confirmed": False,
+            "created_at": started + timedelta(seconds=n, microseconds=n % 1000),
+            "updated_at": started + timedelta(seconds=n),
+        }
+        for n in range(orders)
+    ]
+    with engine.begin() as conn:
+        for chunk in range(0, len(rows), 10_000):
+            conn.execute(models.P2POrder.__table__.insert(), rows[chunk:chunk + 10_000])
+
+
+def _run(args) -> dict:
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+
+    from app import models
+    from app.api.p2p import ORDER_FIELDS
+    from app.db import SessionLocal
+    from app.schemas.p2p import P2POrderOut
+    from app.services import fast_json
+    from bench.report import Recorder, build_report
+
+    _seed(max(args.sizes))
+    print(f"засеяно: {max(args.sizes)} ордеров; orjson: {'да' if fast_json.orjson else 'нет'}")
+
+    Order = models.P2POrder
+    adapter = TypeAdapter(list[P2POrderOut])
+    columns = fast_json.columns_for(P2POrderOut, Order.__table__.c)
+    recorder = Recorder()
+    db = SessionLocal()
+    try:
+        for size in args.sizes:
+            samples = max(5, args.samples * 100 // size)
+            for _ in range(samples):
+                started = time.perf_counter()
+                objects = db.query(Order).filter(Order.status == "active").order_by(Order.id).limit(size).all()
+                queried = time.perf_counter()
+                legacy = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+                done = time.perf_counter()
+                recorder.record(f"orm  n={size}", done - started, ok=True)
+                recorder.record(f"orm  n={size} (encode only)", done - queried, ok=True)
+                db.expunge_all()
+
+                started = time.perf_counter()
+                rows = db.execute(
+                    select(*columns).where(Order.status == "active").order_by(Order.id).limit(size)
+                ).all()
+                queried = time.perf_counter()
+                fast = fast_json.dumps_rows(ORDER_FIELDS, rows)
+                done = time.perf_counter()
+                recorder.record(f"rows n={size}", done - started, ok=fast == legacy)
+                recorder.record(f"rows n={size} (encode only)", done - queried, ok=fast == legacy)
+    finally:
+        db.close()
+    recorder.stop()
+
+    config = {"sizes": args.sizes, "samples": args.samples, "orjson": fast_json.orjson is not None}
+    return build_report(recorder.summary(), config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[100, 1000, 10_000])
+    parser.add_argument("--samples", type=int, default=50, help="повторов для n=100 (для больших n — меньше)")
+    parser.add_argument("--db-url", help="по умолчанию — временная SQLite")
+    parser.add_argument("--json", dest="json_path", help="куда записать JSON-отчёт ('-' — stdout)")
+    args = parser.parse_args()
+
+    from bench.report import print_table, write_json
+
+    # Настройки читаются при импорте app.*, поэтому окружение готовим заранее
+    os.environ["DB_URL"] = args.db_url or f"sqlite:///{tempfile.mkdtemp(prefix='bench-')}/serialization.db"
+    os.environ.setdefault("PASSWORD_BCRYPT_ROUNDS", "4")
+
+    report = _run(args)
+    if args.json_path:
+        write_json(report, args.json_path)
+    if args.json_path != "-":
+        print_table(report)
+    if report["total_errors"]:
+        print("ВНИМАНИЕ: ответы путей различаются")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
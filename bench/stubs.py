@@ -0,0 +1,106 @@
+"""Локальные заглушки Tatum и CoinGecko для нагрузочных прогонов.
+
+Одно ASGI-приложение отвечает на те же пути, что использует
+app/services/tatum_client.py и RatesCache, с настраиваемой задержкой
+и долей ошибок. Запускается uvicorn'ом в отдельном потоке, чтобы
+не делить event loop с тестируемым приложением.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class UpstreamProfile:
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+
+    async def delay(self) -> None:
+        seconds = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def failed(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def build_stub_app(
+    tatum: UpstreamProfile,
+    coingecko: UpstreamProfile,
+    confirm_rate: float = 0.3,
+) -> FastAPI:
+    stub = FastAPI()
+
+    @stub.post("/v3/{chain}/broadcast")
+    async def broadcast(chain: str, request: Request):
+        await tatum.delay()
+        if tatum.failed():
+            return JSONResponse({"message": "stub broadcast failure"}, status_code=500)
+        body = await request.json()
+        return {"txId": hashlib.sha256(body["txData"].encode()).hexdigest()}
+
+    @stub.get("/v3/{chain}/transaction/{tx_hash}")
+    async def transaction(chain: str, tx_hash: str):
+        await tatum.delay()
+        if tatum.failed():
+            return JSONResponse({"message": "stub status failure"}, status_code=500)
+        if random.random() < confirm_rate:
+            return {"hash": tx_hash, "status": "success"}
+        return JSONResponse({"message": "not found"}, status_code=404)
+
+    @stub.get("/api/v3/simple/price")
+    async def simple_price(ids: str, vs_currencies: str):
+        await coingecko.delay()
+        if coingecko.failed():
+            return JSONResponse({"error": "stub rate limit"}, status_code=429)
+        return {
+            coin: {vs: round(random.uniform(0.5, 70000), 4) for vs in vs_currencies.split(",")}
+            for coin in ids.split(",")
+        }
+
+    return stub
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StubServer:
+    """uvicorn с заглушками в фоновом потоке."""
+
+    def __init__(self, app: FastAPI, port: int | None = None):
+        import uvicorn
+
+        self.port = port or _free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("stub-сервер не запустился")
+            time.sleep(0.02)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
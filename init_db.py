@@ -1,9 +1,207 @@
+import hashlib
+import logging
+
+from sqlalchemy import inspect, text
+
 from app.db import Base, engine, SessionLocal
 from app import models
 
+logger = logging.getLogger(__name__)
+
+# Куда при обновлении схемы уезжают дубли transactions (ничего не удаляем)
+DUPLICATES_TABLE = "transactions_duplicates"
+
+
+def _add_missing_columns(conn, table: str, existing: set[str], columns: dict[str, str]) -> None:
+    # create_all не добавляет колонки в существующие таблицы
+    for name, sql_type in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+
+
+def _upgrade_networks() -> None:
+    insp = inspect(engine)
+    if not insp.has_table("networks"):
+        return
+    columns = {c["name"] for c in insp.get_columns("networks")}
+    with engine.begin() as conn:
+        _add_missing_columns(
+            conn,
+            "networks",
+            columns,
+            {"chain": "VARCHAR", "base_fee": "FLOAT", "reconcile_interval": "FLOAT", "tx_units": "FLOAT"},
+        )
+        if "tx_units" not in columns:
+            # base_fee токенов раньше хранилась в самом токене, теперь — в монете
+            # родительской сети: сбрасываем, значения засева проставит init_db
+            reset = conn.execute(text("UPDATE networks SET base_fee = NULL WHERE is_token = :t"), {"t": True})
+            if reset.rowcount:
+                logger.warning(
+                    "networks: base_fee у %d токенов сброшена (теперь она в монете родительской сети)",
+                    reset.rowcount,
+                )
+
+
+def _backfill_signed_tx_sha256(conn) -> None:
+    """sha256(signed_tx) для строк, сохранённых до появления колонки.
+
+    Иначе повторная отправка старой транзакции не узнаётся по байтам и
+    уходит в Tatum. Строку, чей хеш уже занят другой строкой той же сети
+    (одна транзакция сохранена дважды под разными tx_hash), оставляем с
+    NULL: уникальный индекс (network_code, signed_tx_sha256) не нарушается,
+    а повтор найдёт первую.
+    """
+    stmt = text(
+        "UPDATE transactions SET signed_tx_sha256 = :digest WHERE id = :id AND NOT EXISTS ("
+        " SELECT 1 FROM transactions t WHERE t.network_code = :network_code AND t.signed_tx_sha256 = :digest)"
+    )
+    last_id, filled, skipped = 0, 0, 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, network_code, signed_tx FROM transactions"
+                " WHERE signed_tx_sha256 IS NULL AND id > :last_id ORDER BY id LIMIT 1000"
+            ),
+            {"last_id": last_id},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        params = [
+            {"id": row.id, "network_code": row.network_code, "digest": hashlib.sha256(row.signed_tx.encode()).hexdigest()}
+            for row in rows
+        ]
+        updated = conn.execute(stmt, params).rowcount
+        filled += updated
+        skipped += len(rows) - updated
+    if filled:
+        logger.warning(
+            "transactions: signed_tx_sha256 заполнен у %d строк, %d оставлены пустыми (повтор той же транзакции)",
+            filled,
+            skipped,
+        )
+
+
+def _move_duplicate_transactions(conn) -> None:
+    """Дубли (network_code, tx_hash) — в transactions_duplicates, а не DELETE.
+
+    Оставляем самую раннюю запись; остальные переносятся целиком, чтобы
+    оператор мог их разобрать. Число перенесённых строк пишем в лог.
+    """
+    duplicates = (
+        "SELECT id FROM transactions WHERE id NOT IN ("
+        " SELECT MIN(id) FROM transactions GROUP BY network_code, tx_hash)"
+    )
+    count = conn.execute(text(f"SELECT COUNT(*) FROM ({duplicates}) d")).scalar()
+    if not count:
+        return
+    if not inspect(conn).has_table(DUPLICATES_TABLE):
+        conn.execute(text(f"CREATE TABLE {DUPLICATES_TABLE} AS SELECT * FROM transactions WHERE 1 = 0"))
+    names = ", ".join(c["name"] for c in inspect(conn).get_columns(DUPLICATES_TABLE))
+    conn.execute(
+        text(f"INSERT INTO {DUPLICATES_TABLE} ({names}) SELECT {names} FROM transactions WHERE id IN ({duplicates})")
+    )
+    conn.execute(text(f"DELETE FROM transactions WHERE id IN ({duplicates})"))
+    logger.warning(
+        "transactions: %d дублей (network_code, tx_hash) перенесены в %s, в transactions оставлена самая ранняя запись",
+        count,
+        DUPLICATES_TABLE,
+    )
+
+
+def _upgrade_transactions() -> None:
+    """Довести существующую таблицу transactions до текущей схемы.
+
+    Новые nullable-колонки добавляются через ALTER TABLE, у старых строк
+    заполняется signed_tx_sha256. Старые одноколоночные индексы заменены
+    уникальным (network_code, tx_hash), поэтому дубли от повторных отправок
+    переносятся в transactions_duplicates до самой ранней записи.
+    """
+    insp = inspect(engine)
+    if not insp.has_table("transactions"):
+        return
+    columns = {c["name"] for c in insp.get_columns("transactions")}
+    indexes = {i["name"] for i in insp.get_indexes("transactions")}
+    with engine.begin() as conn:
+        _add_missing_columns(
+            conn, "transactions", columns, {"signed_tx_sha256": "VARCHAR", "idempotency_key": "VARCHAR"}
+        )
+        for name in ("ix_transactions_network_code", "ix_transactions_tx_hash"):
+            if name in indexes:
+                conn.execute(text(f"DROP INDEX {name}"))
+        if "uq_transactions_network_hash" not in indexes:
+            _move_duplicate_transactions(conn)
+        _backfill_signed_tx_sha256(conn)
+
+
+# Горячие таблицы, чьи строки уезжают в архив, и их архивные копии
+ARCHIVED_TABLES = (
+    (models.Transaction.__table__, models.transactions_archive),
+    (models.P2POrder.__table__, models.p2p_orders_archive),
+)
+
+
+def _rebuild_with_autoincrement(conn, table) -> None:
+    """Пересоздать SQLite-таблицу с AUTOINCREMENT (ALTER TABLE так не умеет).
+
+    Индексы старой таблицы удаляются (их имена нужны новой), таблица
+    переименовывается, создаётся заново по модели и строки копируются с
+    теми же id. Внешних ключей на горячие таблицы нет.
+    """
+    old = f"{table.name}__old"
+    for index in inspect(conn).get_indexes(table.name):
+        conn.execute(text(f"DROP INDEX {index['name']}"))
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+    table.create(bind=conn)
+    names = ", ".join(c.name for c in table.columns)
+    conn.execute(text(f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {old}"))
+    conn.execute(text(f"DROP TABLE {old}"))
+    logger.warning("%s: таблица пересоздана с AUTOINCREMENT", table.name)
+
+
+def _upgrade_sqlite_sequences() -> None:
+    """Не выдавать в SQLite id, которые уже есть в архиве.
+
+    Без AUTOINCREMENT SQLite берёт max(id) + 1 горячей таблицы: после
+    архивации строк с максимальным id новый ордер получал id архивного,
+    и архиватор на нём останавливался. Таблицы, созданные до этого,
+    пересоздаются; счётчик sqlite_sequence поднимается до max(id) архива
+    (архив мог заполниться до пересоздания).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        for hot, archive in ARCHIVED_TABLES:
+            if not insp.has_table(hot.name):
+                continue
+            sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": hot.name}
+            ).scalar()
+            if "AUTOINCREMENT" not in sql.upper():
+                _rebuild_with_autoincrement(conn, hot)
+            if not insp.has_table(archive.name):
+                continue
+            top = conn.execute(text(f"SELECT MAX(id) FROM {archive.name}")).scalar()
+            if top is None:
+                continue
+            params = {"name": hot.name, "seq": top}
+            seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), params).scalar()
+            if seq is None:
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), params)
+            elif seq < top:
+                conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"), params)
+
 
 def init_db() -> None:
+    _upgrade_networks()
+    _upgrade_transactions()
+    _upgrade_sqlite_sequences()
     Base.metadata.create_all(bind=engine)
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
     db = SessionLocal()
     try:
@@ -14,6 +212,10 @@ def init_db() -> None:
                 "native_symbol": "BTC",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "bitcoin",
+                "base_fee": 0.00005,
+                "reconcile_interval": 60.0,
+                "tx_units": 140,
             },
             {
                 "code": "ETH",
@@ -21,6 +223,10 @@ def init_db() -> None:
                 "native_symbol": "ETH",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "ethereum",
+                "base_fee": 0.0005,
+                "reconcile_interval": 15.0,
+                "tx_units": 21000,
             },
             {
                 "code": "USDT_ERC20",
@@ -28,6 +234,11 @@ def init_db() -> None:
                 "native_symbol": "USDT",
                 "is_token": True,
                 "parent_chain": "ETH",
+                "chain": "ethereum",
+                # В ETH: ~65k газа на transfer ERC20
+                "base_fee": 0.0015,
+                "reconcile_interval": 15.0,
+                "tx_units": 65000,
             },
             {
                 "code": "TRX",
@@ -35,6 +246,10 @@ def init_db() -> None:
                 "native_symbol": "TRX",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "tron",
+                "base_fee": 1.0,
+                "reconcile_interval": 5.0,
+                "tx_units": None,
             },
             {
                 "code": "USDT_TRC20",
@@ -42,6 +257,11 @@ def init_db() -> None:
                 "native_symbol": "USDT",
                 "is_token": True,
                 "parent_chain": "TRX",
+                "chain": "tron",
+                # В TRX: сжигание энергии на transfer TRC20
+                "base_fee": 15.0,
+                "reconcile_interval": 5.0,
+                "tx_units": None,
             },
             {
                 "code": "LTC",
@@ -49,6 +269,10 @@ def init_db() -> None:
                 "native_symbol": "LTC",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "litecoin",
+                "base_fee": 0.0005,
+                "reconcile_interval": 30.0,
+                "tx_units": 140,
             },
             {
                 "code": "BNB",
@@ -56,6 +280,10 @@ def init_db() -> None:
                 "native_symbol": "BNB",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "bsc",
+                "base_fee": 0.0003,
+                "reconcile_interval": 10.0,
+                "tx_units": 21000,
             },
             {
                 "code": "TON",
@@ -63,6 +291,10 @@ def init_db() -> None:
                 "native_symbol": "TON",
                 "is_token": False,
                 "parent_chain": None,
+                "chain": "ton",
+                "base_fee": 0.02,
+                "reconcile_interval": 5.0,
+                "tx_units": None,
             },
         ]
 
@@ -70,6 +302,11 @@ def init_db() -> None:
             existing = db.query(models.Network).filter(models.Network.code == n["code"]).first()
             if not existing:
                 db.add(models.Network(**n))
+                continue
+            # Новые поля справочника у ранее засеянных сетей
+            for field in ("chain", "base_fee", "reconcile_interval", "tx_units"):
+                if getattr(existing, field) is None:
+                    setattr(existing, field, n[field])
 
         db.commit()
     finally:
@@ -1,8 +1,67 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.db import async_engine
+
+from app.api import auth, networks, rates, address, fees, tx, p2p, stream, export
+from app.services import tatum_client
+from app.services.archiver import archiver
+from app.services.event_hub import event_hub
+from app.services.fee_oracle import fee_oracle
+from app.services.metrics import MetricsMiddleware, gauge_lines, registry
+from app.services.network_registry import network_registry
+from app.services.password_hasher import password_hasher
+from app.services.rate_limit import RateLimitMiddleware, bucket_store
+from app.services.security import auth_cache_stats
+from app.services.shared_cache import shared_cache
+from app.services.order_book import order_book
+from app.services.rates_cache import rates_cache
+from app.services.tx_reconciler import tx_reconciler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Общий кэш воркеров: значения, lease на обновление, инвалидации
+    await shared_cache.start()
+    # Справочник сетей читается один раз; перечитать — SIGHUP
+    await asyncio.to_thread(network_registry.load)
+    network_registry.install_reload_signal()
+    # Общий пул HTTP-соединений к Tatum живёт столько же, сколько процесс
+    await tatum_client.open_client()
+    # Стакан P2P собирается из БД один раз, дальше живёт в памяти
+    await asyncio.to_thread(order_book.load)
+    # Статусы pending-транзакций сверяет фоновый воркер, а не GET-запросы
+    if settings.RECONCILER_ENABLED and settings.tatum_api_key:
+        tx_reconciler.start()
+    # Старые завершённые ордера и транзакции уезжают в архивные таблицы
+    if settings.ARCHIVE_ENABLED:
+        archiver.start()
+    # Курсы обновляются заранее, до истечения TTL; пары стакана — сразу
+    for crypto_currency, fiat_currency in order_book.pairs():
+        rates_cache.track(crypto_currency, fiat_currency)
+    rates_cache.start()
+    # Комиссии сетей из Tatum держим в памяти, оценка их не ждёт
+    fee_oracle.start()
+    # Push-события для /ws и /stream
+    event_hub.start()
+    try:
+        yield
+    finally:
+        await event_hub.stop()
+        await rates_cache.stop()
+        await fee_oracle.stop()
+        await tx_reconciler.stop()
+        await archiver.stop()
+        await tatum_client.close_client()
+        password_hasher.shutdown()
+        network_registry.remove_reload_signal()
+        await bucket_store.close()
+        await async_engine.dispose()
+        await shared_cache.close()
 
-from app.api import auth, networks, rates, address, fees, tx, p2p
 
 app = FastAPI(
     title="Crypto P2P API",
@@ -11,15 +70,21 @@ app = FastAPI(
         "Бэкенд для криптокошелька и P2P-платформы без хранения приватных ключей. "
         "Транзакции отправляются во внешние RPC-провайдеры (например, Tatum)."
     ),
+    lifespan=lifespan,
 )
 
+# Лимит внутри CORS, чтобы и у ответов 429 были CORS-заголовки
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
+# Последним добавленный middleware — внешний: меряем запрос целиком
+app.add_middleware(MetricsMiddleware)
 
 # Routers
 app.include_router(auth.router, prefix=settings.API_V1_STR)
@@ -29,8 +94,69 @@ app.include_router(address.router, prefix=settings.API_V1_STR)
 app.include_router(fees.router, prefix=settings.API_V1_STR)
 app.include_router(tx.router, prefix=settings.API_V1_STR)
 app.include_router(p2p.router, prefix=settings.API_V1_STR)
+app.include_router(stream.router, prefix=settings.API_V1_STR)
+app.include_router(export.router, prefix=settings.API_V1_STR)
 
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Crypto P2P API is running"}
+
+
+@app.get("/stats/tatum-pool")
+def tatum_pool_stats():
+    return tatum_client.pool_stats()
+
+
+@app.get("/stats/tatum-breakers")
+def tatum_breaker_stats():
+    return tatum_client.breaker_stats()
+
+
+@app.get("/stats/auth-cache")
+def auth_cache_statistics():
+    return auth_cache_stats()
+
+
+@app.get("/stats/shared-cache")
+def shared_cache_statistics():
+    return {"backend": shared_cache.backend, **shared_cache.stats()}
+
+
+def _service_gauges() -> list[str]:
+    lines = gauge_lines("tatum_pool", "Пул соединений к Tatum", tatum_client.pool_stats())
+    breakers = tatum_client.breaker_stats()
+    # 0 — closed, 1 — half_open, 2 — open
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    lines += gauge_lines(
+        "tatum_breaker_state",
+        "Состояние breaker Tatum по сети",
+        {chain: states[b["state"]] for chain, b in breakers.items()},
+        label="chain",
+    )
+    lines += gauge_lines(
+        "tatum_breaker_error_count",
+        "Ошибки Tatum в окне breaker",
+        {chain: b["errors_in_window"] for chain, b in breakers.items()},
+        label="chain",
+    )
+    lines += gauge_lines("rates_cache", "Кэш курсов CoinGecko", rates_cache.stats())
+    lines += gauge_lines(
+        "fee_quote_age_seconds",
+        "Возраст котировки комиссий Tatum по сети",
+        fee_oracle.stats()["age_seconds"],
+        label="chain",
+    )
+    lines += gauge_lines("event_hub", "Подписки на push-события", event_hub.stats())
+    for name, stats in auth_cache_stats().items():
+        lines += gauge_lines(f"auth_cache_{name}", f"Кэш аутентификации ({name})", stats)
+    lines += gauge_lines("shared_cache", "Общий кэш воркеров", shared_cache.stats())
+    return lines
+
+
+registry.register_collector(_service_gauges)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(registry.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")